@@ -0,0 +1,131 @@
+"""
+Benchmark do parser de NF-e: implementação antiga (ElementTree + find()
+repetidos) contra o parser em um único passe com lxml.iterparse.
+
+Uso:
+    python -m benchmarks.bench_parse_nfe_xml [--itens 10,100,500,2000] [--repeticoes 20]
+"""
+import argparse
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from src.parse_nfe_xml import NFE_NS, parse_nfe_xml
+
+
+def legacy_parse_nfe_xml(xml_source):
+    """Cópia da implementação anterior, mantida apenas para comparação."""
+    root = ET.fromstring(xml_source)
+    ns = {"nfe": NFE_NS}
+
+    ide = root.find(".//nfe:ide", ns)
+    dEmi = ide.find("nfe:dEmi", ns).text if ide is not None and ide.find("nfe:dEmi", ns) is not None else ""
+    nNF = ide.find("nfe:nNF", ns).text if ide is not None and ide.find("nfe:nNF", ns) is not None else ""
+
+    emit = root.find(".//nfe:emit", ns)
+    CNPJ_emit = emit.find("nfe:CNPJ", ns).text if emit is not None and emit.find("nfe:CNPJ", ns) is not None else ""
+    xNome_emit = emit.find("nfe:xNome", ns).text if emit is not None and emit.find("nfe:xNome", ns) is not None else ""
+
+    dest = root.find(".//nfe:dest", ns)
+    CNPJ_dest = dest.find("nfe:CNPJ", ns).text if dest is not None and dest.find("nfe:CNPJ", ns) is not None else ""
+    xNome_dest = dest.find("nfe:xNome", ns).text if dest is not None and dest.find("nfe:xNome", ns) is not None else ""
+
+    products = []
+    for det in root.findall(".//nfe:det", ns):
+        prod = det.find("nfe:prod", ns)
+        cProd = prod.find("nfe:cProd", ns).text if prod is not None and prod.find("nfe:cProd", ns) is not None else ""
+        xProd = prod.find("nfe:xProd", ns).text if prod is not None and prod.find("nfe:xProd", ns) is not None else ""
+        CFOP = prod.find("nfe:CFOP", ns).text if prod is not None and prod.find("nfe:CFOP", ns) is not None else ""
+        qCom = prod.find("nfe:qCom", ns).text if prod is not None and prod.find("nfe:qCom", ns) is not None else "0.0"
+        vUnCom = prod.find("nfe:vUnCom", ns).text if prod is not None and prod.find("nfe:vUnCom", ns) is not None else "0.0"
+        vProd = prod.find("nfe:vProd", ns).text if prod is not None and prod.find("nfe:vProd", ns) is not None else "0.0"
+
+        lote_info = {"nLote": "", "qLote": "", "dFab": "", "dVal": ""}
+        rastro = prod.find("nfe:rastro", ns)
+        if rastro is not None:
+            lote_info["nLote"] = rastro.find("nfe:nLote", ns).text if rastro.find("nfe:nLote", ns) is not None else ""
+            lote_info["qLote"] = rastro.find("nfe:qLote", ns).text if rastro.find("nfe:qLote", ns) is not None else ""
+            lote_info["dFab"] = rastro.find("nfe:dFab", ns).text if rastro.find("nfe:dFab", ns) is not None else ""
+            lote_info["dVal"] = rastro.find("nfe:dVal", ns).text if rastro.find("nfe:dVal", ns) is not None else ""
+
+        products.append({
+            "cProd": cProd,
+            "xProd": xProd,
+            "CFOP": CFOP,
+            "qCom": float(qCom),
+            "vUnCom": float(vUnCom),
+            "vProd": float(vProd),
+            "lote_info": lote_info
+        })
+
+    return {
+        "dEmi": dEmi,
+        "nNF": nNF,
+        "CNPJ_emit": CNPJ_emit,
+        "xNome_emit": xNome_emit,
+        "CNPJ_dest": CNPJ_dest,
+        "xNome_dest": xNome_dest,
+        "products": products
+    }
+
+
+def build_nfe_xml(num_itens):
+    """Monta uma NF-e sintética (bytes) com num_itens itens, todos com rastro."""
+    dets = []
+    for i in range(1, num_itens + 1):
+        dets.append(
+            f'<det nItem="{i}"><prod>'
+            f'<cProd>PRD{i:05d}</cProd><cEAN>SEM GTIN</cEAN><xProd>PARAFUSO CORTICAL {i}</xProd>'
+            f'<NCM>90211020</NCM><CFOP>5917</CFOP><uCom>UN</uCom><qCom>2.0000</qCom>'
+            f'<vUnCom>150.0000000000</vUnCom><vProd>300.00</vProd>'
+            f'<rastro><nLote>L{i:06d}</nLote><qLote>2.000</qLote>'
+            f'<dFab>2025-01-10</dFab><dVal>2030-01-10</dVal></rastro>'
+            f'</prod><imposto><ICMS><ICMS40><orig>0</orig><CST>41</CST></ICMS40></ICMS></imposto></det>'
+        )
+    xml = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<nfeProc xmlns="{NFE_NS}" versao="4.00"><NFe><infNFe Id="NFe35250100000000000191550010000012341000012345" versao="4.00">'
+        '<ide><cUF>35</cUF><nNF>1234</nNF><dEmi>2025-01-15</dEmi></ide>'
+        '<emit><CNPJ>00000000000191</CNPJ><xNome>AKOS MED LTDA</xNome></emit>'
+        '<dest><CNPJ>11111111000111</CNPJ><xNome>HOSPITAL EXEMPLO</xNome></dest>'
+        + "".join(dets) +
+        '<total><ICMSTot><vNF>0.00</vNF></ICMSTot></total>'
+        '</infNFe></NFe></nfeProc>'
+    )
+    return xml.encode("utf-8")
+
+
+def _measure(func, payload, repeticoes):
+    tracemalloc.start()
+    func(payload)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        func(payload)
+    return (time.perf_counter() - inicio) / repeticoes, pico
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--itens", default="10,100,500,2000")
+    parser.add_argument("--repeticoes", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'itens':>6} {'antigo (ms)':>12} {'novo (ms)':>10} {'ganho':>7} {'pico antigo (KiB)':>18} {'pico novo (KiB)':>16}")
+    for num_itens in (int(n) for n in args.itens.split(",")):
+        payload = build_nfe_xml(num_itens)
+        novo = parse_nfe_xml(payload, is_file=False)
+        antigo = legacy_parse_nfe_xml(payload)
+        if antigo != novo:
+            raise SystemExit(f"Saídas divergentes para {num_itens} itens")
+
+        t_antigo, m_antigo = _measure(legacy_parse_nfe_xml, payload, args.repeticoes)
+        t_novo, m_novo = _measure(lambda p: parse_nfe_xml(p, is_file=False), payload, args.repeticoes)
+        print(f"{num_itens:>6} {t_antigo * 1000:>12.2f} {t_novo * 1000:>10.2f} {t_antigo / t_novo:>6.1f}x "
+              f"{m_antigo / 1024:>18.0f} {m_novo / 1024:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Gerador de NF-e sintéticas (leiaute 4.00) para benchmarks.
+
+As notas seguem a estrutura de uma NF-e autorizada (nfeProc/NFe/infNFe com
+chave de acesso e dígito verificador, ide com dhEmi, emit/dest com endereço,
+det/prod com grupo rastro, imposto e total) e misturam os CFOPs de
+consignação: saídas 5917/6917 (conforme a UF do cliente), retornos 1918,
+retornos simbólicos 1919 e faturamento 5114. Clientes, produtos e lotes vêm
+de catálogos de tamanho configurável; com a mesma semente a sequência gerada
+é sempre a mesma.
+
+Uso:
+    gerador = NFeGenerator(clientes=50, produtos=500, itens_por_nota=20)
+    for nome, xml in gerador.notas(total_itens=10_000):
+        ...
+"""
+import random
+from datetime import date, timedelta
+from xml.sax.saxutils import escape
+
+from src.parse_nfe_xml import NFE_NS
+
+EMITENTE_CNPJ = "00000000000191"
+EMITENTE_NOME = "AKOS MED COMERCIO DE PRODUTOS MEDICOS LTDA"
+EMITENTE_UF = "SP"
+
+# Código IBGE das UFs usadas nos clientes sintéticos
+UF_CODIGOS = {"SP": "35", "RJ": "33", "MG": "31", "PR": "41", "RS": "43", "BA": "29"}
+
+# CFOP -> peso no sorteio do tipo da nota (saídas intra/interestaduais
+# são resolvidas pela UF do cliente)
+CFOP_PESOS = (
+    ("saida", 45),
+    ("1918", 20),
+    ("1919", 20),
+    ("5114", 15),
+)
+
+_PRODUTOS_BASE = (
+    "PARAFUSO CORTICAL", "PLACA BLOQUEADA", "HASTE INTRAMEDULAR", "PROTESE DE QUADRIL",
+    "CAGE INTERSOMATICO", "ANCORA DE SUTURA", "FIO DE KIRSCHNER", "ENXERTO OSSEO",
+)
+
+
+def chave_acesso(cUF, data_emissao, cnpj, serie, nNF, cNF, modelo="55", tpEmis="1"):
+    """Chave de acesso de 44 dígitos com o dígito verificador (módulo 11)."""
+    base = f"{cUF}{data_emissao:%y%m}{cnpj}{modelo}{serie:03d}{nNF:09d}{tpEmis}{cNF:08d}"
+    soma = sum(int(digito) * (2 + i % 8) for i, digito in enumerate(reversed(base)))
+    resto = soma % 11
+    return base + str(0 if resto < 2 else 11 - resto)
+
+
+class Cliente:
+    __slots__ = ("cnpj", "nome", "uf")
+
+    def __init__(self, cnpj, nome, uf):
+        self.cnpj = cnpj
+        self.nome = nome
+        self.uf = uf
+
+
+class Produto:
+    __slots__ = ("codigo", "descricao", "valor", "lotes")
+
+    def __init__(self, codigo, descricao, valor, lotes):
+        self.codigo = codigo
+        self.descricao = descricao
+        self.valor = valor
+        self.lotes = lotes
+
+
+class NFeGenerator:
+    """
+    Gera NF-e sintéticas reprodutíveis.
+
+    Args:
+        clientes (int): Quantidade de destinatários (hospitais)
+        produtos (int): Quantidade de produtos no catálogo
+        lotes_por_produto (int): Lotes distintos de cada produto
+        itens_por_nota (int): Itens por NF-e (a última pode ter menos)
+        proporcao_rastro (float): Fração dos itens com grupo rastro
+        seed (int): Semente do sorteio
+        data_inicial (date): Emissão da primeira nota; as seguintes avançam no tempo
+    """
+    def __init__(self, clientes=50, produtos=500, lotes_por_produto=4, itens_por_nota=20,
+                 proporcao_rastro=0.9, seed=42, data_inicial=date(2024, 1, 2)):
+        self.random = random.Random(seed)
+        self.itens_por_nota = max(1, int(itens_por_nota))
+        self.proporcao_rastro = proporcao_rastro
+        self.data_inicial = data_inicial
+        self.numero = 0
+
+        ufs = list(UF_CODIGOS)
+        self.clientes = [
+            Cliente(f"{10000000 + i:08d}0001{i % 100:02d}", f"HOSPITAL SINTETICO {i:04d}",
+                    EMITENTE_UF if i % 3 else self.random.choice(ufs))
+            for i in range(clientes)
+        ]
+        self.produtos = []
+        for i in range(produtos):
+            descricao = f"{_PRODUTOS_BASE[i % len(_PRODUTOS_BASE)]} {i:05d}"
+            lotes = [f"L{i:05d}{n:03d}" for n in range(lotes_por_produto)]
+            self.produtos.append(Produto(f"PRD{i:06d}", descricao, round(self.random.uniform(50, 5000), 2), lotes))
+
+        self._tipos = [tipo for tipo, _ in CFOP_PESOS]
+        self._pesos = [peso for _, peso in CFOP_PESOS]
+
+    def _cfop(self, cliente):
+        tipo = self.random.choices(self._tipos, self._pesos)[0]
+        if tipo == "saida":
+            return "5917" if cliente.uf == EMITENTE_UF else "6917"
+        return tipo
+
+    def _det(self, n_item, produto, cfop):
+        quantidade = self.random.randint(1, 10)
+        v_prod = quantidade * produto.valor
+        rastro = ""
+        if self.random.random() < self.proporcao_rastro:
+            fabricacao = self.data_inicial - timedelta(days=self.random.randint(30, 720))
+            validade = fabricacao + timedelta(days=self.random.choice((365, 730, 1095, 1825)))
+            rastro = (
+                f"<rastro><nLote>{self.random.choice(produto.lotes)}</nLote><qLote>{quantidade:.3f}</qLote>"
+                f"<dFab>{fabricacao:%Y-%m-%d}</dFab><dVal>{validade:%Y-%m-%d}</dVal></rastro>"
+            )
+        return (
+            f'<det nItem="{n_item}"><prod>'
+            f"<cProd>{produto.codigo}</cProd><cEAN>SEM GTIN</cEAN><xProd>{escape(produto.descricao)}</xProd>"
+            f"<NCM>90211020</NCM><CFOP>{cfop}</CFOP><uCom>UN</uCom><qCom>{quantidade:.4f}</qCom>"
+            f"<vUnCom>{produto.valor:.10f}</vUnCom><vProd>{v_prod:.2f}</vProd>"
+            f"<cEANTrib>SEM GTIN</cEANTrib><uTrib>UN</uTrib><qTrib>{quantidade:.4f}</qTrib>"
+            f"<vUnTrib>{produto.valor:.10f}</vUnTrib><indTot>1</indTot>{rastro}"
+            "</prod><imposto><ICMS><ICMS40><orig>0</orig><CST>41</CST></ICMS40></ICMS>"
+            "<PIS><PISNT><CST>07</CST></PISNT></PIS><COFINS><COFINSNT><CST>07</CST></COFINSNT></COFINS>"
+            "</imposto></det>"
+        ), v_prod
+
+    def nota(self, num_itens=None):
+        """Gera a próxima NF-e. Returns: (chave de acesso, bytes do XML)"""
+        num_itens = num_itens or self.itens_por_nota
+        self.numero += 1
+        nNF = self.numero
+        # Em média ~40 notas por dia a partir de data_inicial
+        emissao = self.data_inicial + timedelta(days=nNF // 40)
+        cliente = self.random.choice(self.clientes)
+        cfop = self._cfop(cliente)
+        chave = chave_acesso(UF_CODIGOS[EMITENTE_UF], emissao, EMITENTE_CNPJ, 1, nNF, nNF % 100000000)
+
+        if num_itens <= len(self.produtos):
+            produtos = self.random.sample(self.produtos, num_itens)
+        else:
+            produtos = self.random.choices(self.produtos, k=num_itens)
+        dets = []
+        total = 0.0
+        for n_item, produto in enumerate(produtos, 1):
+            det, v_prod = self._det(n_item, produto, cfop)
+            dets.append(det)
+            total += v_prod
+
+        tp_nf = "0" if cfop[0] in "123" else "1"
+        id_dest = "1" if cliente.uf == EMITENTE_UF else "2"
+        xml = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<nfeProc xmlns="{NFE_NS}" versao="4.00"><NFe xmlns="{NFE_NS}">'
+            f'<infNFe Id="NFe{chave}" versao="4.00">'
+            f"<ide><cUF>{UF_CODIGOS[EMITENTE_UF]}</cUF><cNF>{nNF % 100000000:08d}</cNF>"
+            f"<natOp>{'REMESSA EM CONSIGNACAO' if cfop[0] in '56' and cfop != '5114' else 'RETORNO / FATURAMENTO'}</natOp>"
+            f"<mod>55</mod><serie>1</serie><nNF>{nNF}</nNF>"
+            f"<dhEmi>{emissao:%Y-%m-%d}T10:00:00-03:00</dhEmi><tpNF>{tp_nf}</tpNF><idDest>{id_dest}</idDest>"
+            f"<cMunFG>3550308</cMunFG><tpImp>1</tpImp><tpEmis>1</tpEmis><cDV>{chave[-1]}</cDV>"
+            "<tpAmb>1</tpAmb><finNFe>1</finNFe><indFinal>1</indFinal><indPres>9</indPres>"
+            "<procEmi>0</procEmi><verProc>1.0</verProc></ide>"
+            f"<emit><CNPJ>{EMITENTE_CNPJ}</CNPJ><xNome>{EMITENTE_NOME}</xNome>"
+            f"<enderEmit><xLgr>RUA EXEMPLO</xLgr><nro>100</nro><xBairro>CENTRO</xBairro>"
+            f"<cMun>3550308</cMun><xMun>SAO PAULO</xMun><UF>{EMITENTE_UF}</UF><CEP>01000000</CEP></enderEmit>"
+            "<IE>111111111111</IE><CRT>3</CRT></emit>"
+            f"<dest><CNPJ>{cliente.cnpj}</CNPJ><xNome>{cliente.nome}</xNome>"
+            f"<enderDest><xLgr>AV DOS HOSPITAIS</xLgr><nro>1</nro><xBairro>SAUDE</xBairro>"
+            f"<cMun>3550308</cMun><xMun>CIDADE</xMun><UF>{cliente.uf}</UF><CEP>02000000</CEP></enderDest>"
+            "<indIEDest>9</indIEDest></dest>"
+            + "".join(dets) +
+            f"<total><ICMSTot><vBC>0.00</vBC><vICMS>0.00</vICMS><vProd>{total:.2f}</vProd>"
+            f"<vNF>{total:.2f}</vNF></ICMSTot></total>"
+            "<transp><modFrete>9</modFrete></transp>"
+            "</infNFe></NFe>"
+            f'<protNFe versao="4.00"><infProt><tpAmb>1</tpAmb><chNFe>{chave}</chNFe><cStat>100</cStat>'
+            "<xMotivo>Autorizado o uso da NF-e</xMotivo></infProt></protNFe>"
+            "</nfeProc>"
+        )
+        return chave, xml.encode("utf-8")
+
+    def notas(self, total_itens):
+        """Gera NF-e até somar total_itens itens. Yields: (nome do arquivo, bytes)"""
+        restantes = total_itens
+        while restantes > 0:
+            num_itens = min(self.itens_por_nota, restantes)
+            chave, xml = self.nota(num_itens)
+            restantes -= num_itens
+            yield f"{chave}-nfe.xml", xml
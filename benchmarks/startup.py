@@ -0,0 +1,172 @@
+"""
+Tempo de subida e memória dos workers do gunicorn, com e sem --preload.
+
+Para cada modo o gunicorn é iniciado com gunicorn.conf.py e N workers; o
+tempo de subida vai do início do processo até o último worker registrar
+"Worker pronto" (post_worker_init) e responder em /test. A memória de cada
+worker é lida de /proc logo depois e de novo após algumas requisições:
+RSS (inclui páginas compartilhadas com o mestre) e PSS (páginas
+compartilhadas divididas entre os processos, a medida do custo real).
+
+Uso:
+    python -m benchmarks.startup [--workers 4] [--repeticoes 3] [--saida startup.json]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODOS = (("preload", "1"), ("sem_preload", "0"))
+# Requisições feitas antes da segunda leitura de memória
+REQUISICOES_AQUECIMENTO = 50
+TIMEOUT_SUBIDA = 60
+
+
+def _porta_livre():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _memoria_kb(pid):
+    """(RSS, PSS) em kB do processo, lidos de /proc."""
+    rss = pss = None
+    with open(f"/proc/{pid}/status") as status:
+        for linha in status:
+            if linha.startswith("VmRSS:"):
+                rss = int(linha.split()[1])
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as smaps:
+            for linha in smaps:
+                if linha.startswith("Pss:"):
+                    pss = int(linha.split()[1])
+    except OSError:
+        pass
+    return rss, pss
+
+
+def _get(url):
+    with urllib.request.urlopen(url, timeout=10) as response:
+        response.read()
+        return response.status
+
+
+def _memoria_workers(pids):
+    medidas = [_memoria_kb(pid) for pid in pids]
+    rss = [r for r, _ in medidas if r is not None]
+    pss = [p for _, p in medidas if p is not None]
+    return {
+        "rss_mb_por_worker": round(statistics.mean(rss) / 1024, 1) if rss else None,
+        "pss_mb_por_worker": round(statistics.mean(pss) / 1024, 1) if pss else None,
+    }
+
+
+def subir(workers, preload, env):
+    """Inicia o gunicorn, espera os workers e mede tempo e memória; encerra ao final."""
+    porta = _porta_livre()
+    env = dict(env, GUNICORN_PRELOAD=preload, WEB_CONCURRENCY=str(workers))
+    inicio = time.perf_counter()
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "src.main:create_app()", "-c", os.path.join(RAIZ, "gunicorn.conf.py"),
+         "--bind", f"127.0.0.1:{porta}"],
+        cwd=RAIZ, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    prontos = []
+    todos_prontos = threading.Event()
+
+    def ler_log():
+        for linha in processo.stderr:
+            if "Worker pronto (pid" in linha:
+                prontos.append((time.perf_counter() - inicio, int(linha.rsplit("pid", 1)[1].strip(" )\n"))))
+                if len(prontos) >= workers:
+                    todos_prontos.set()
+
+    threading.Thread(target=ler_log, daemon=True).start()
+    try:
+        if not todos_prontos.wait(TIMEOUT_SUBIDA):
+            raise SystemExit(f"gunicorn não subiu {workers} worker(s) em {TIMEOUT_SUBIDA}s")
+        url = f"http://127.0.0.1:{porta}"
+        _get(f"{url}/test")
+        pronto = time.perf_counter() - inicio
+        pids = [pid for _, pid in prontos]
+
+        resultado = {
+            "segundos_ate_primeiro_worker": round(prontos[0][0], 3),
+            "segundos_ate_todos_prontos": round(pronto, 3),
+            "mestre_rss_mb": round(_memoria_kb(processo.pid)[0] / 1024, 1),
+            "apos_subida": _memoria_workers(pids),
+        }
+        for _ in range(REQUISICOES_AQUECIMENTO):
+            _get(f"{url}/api/balance")
+        resultado["apos_requisicoes"] = _memoria_workers(pids)
+        return resultado
+    finally:
+        processo.terminate()
+        try:
+            processo.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tempo de subida e memória por worker do gunicorn")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--database-url", help="Banco a usar (padrão: SQLite temporário com as migrações)")
+    parser.add_argument("--saida", help="Arquivo JSON com os resultados")
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ, JOB_WORKERS="0")
+    if args.database_url:
+        env["DATABASE_URL"] = args.database_url
+    else:
+        diretorio = tempfile.mkdtemp(prefix="opme_startup_")
+        env["DATABASE_URL"] = f"sqlite:///{os.path.join(diretorio, 'startup.db')}"
+        subprocess.run([sys.executable, "-m", "flask", "--app", "src.main", "db", "upgrade"],
+                       cwd=RAIZ, env=env, check=True, capture_output=True)
+
+    resultados = {}
+    for modo, preload in MODOS:
+        execucoes = [subir(args.workers, preload, env) for _ in range(args.repeticoes)]
+        # Mediana de cada medida entre as repetições
+        resumo = {}
+        for chave, valor in execucoes[0].items():
+            if isinstance(valor, dict):
+                resumo[chave] = {
+                    k: statistics.median(e[chave][k] for e in execucoes) if valor[k] is not None else None
+                    for k in valor
+                }
+            else:
+                resumo[chave] = statistics.median(e[chave] for e in execucoes)
+        resultados[modo] = resumo
+        print(f"{modo:<12} todos prontos em {resumo['segundos_ate_todos_prontos']:.2f}s  "
+              f"RSS/worker {resumo['apos_subida']['rss_mb_por_worker']} MB  "
+              f"PSS/worker {resumo['apos_subida']['pss_mb_por_worker']} MB  "
+              f"(após {REQUISICOES_AQUECIMENTO} requisições: PSS {resumo['apos_requisicoes']['pss_mb_por_worker']} MB)")
+
+    relatorio = {
+        "meta": {
+            "data": datetime.now().isoformat(timespec="seconds"),
+            "workers": args.workers,
+            "repeticoes": args.repeticoes,
+            "python": sys.version.split()[0],
+        },
+        "resultados": resultados,
+    }
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
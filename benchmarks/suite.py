@@ -0,0 +1,299 @@
+"""
+Suíte de benchmarks: parsing, importação, cálculo de saldo e rotas HTTP
+em escalas crescentes de itens de NF-e, com resultados em JSON.
+
+O banco (SQLite temporário, ou --database-url) é criado pelas migrações e
+preenchido com NF-e do gerador sintético até cada escala; as escalas são
+cumulativas (10k, depois mais 90k até 100k, ...). Em cada escala:
+
+- parse_nfe_xml: parsing de uma amostra das notas geradas
+- carga_lote: NFeBatchIngestor (hash + parsing + gravação em lotes) das notas novas
+- insert_nfe_data e parse_and_save_nfe: importação nota a nota, por nota
+- get_opme_movements, calculate_balance e get_balance (razão, agregação em SQL e
+  saldo em uma data pelos checkpoints)
+- rotas HTTP pelo cliente de teste do Flask (pilha WSGI completa, sem rede)
+
+Uso:
+    python -m benchmarks.suite [--escalas 10k,100k,1M] [--saida resultados.json]
+                               [--comparar resultados_anteriores.json]
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.nfe_generator import NFeGenerator
+
+DEFAULT_ESCALAS = "10k,100k,1M"
+# Notas da amostra de parsing e das importações nota a nota, por escala
+AMOSTRA_PARSE = 2000
+AMOSTRA_NOTA_A_NOTA = 100
+# Repetições de cada rota HTTP
+REPETICOES_HTTP = 5
+
+ROTAS_HTTP = (
+    ("GET /api/balance", "/api/balance"),
+    ("GET /api/balance?cnpj_cliente", "/api/balance?cnpj_cliente={cnpj}"),
+    ("GET /api/balance?periodo", "/api/balance?data_inicio=2024-01-01&data_fim=2024-06-30"),
+    ("GET /api/movements?limit=1000", "/api/movements?limit=1000"),
+    ("GET /api/movements?cnpj_cliente", "/api/movements?cnpj_cliente={cnpj}"),
+    ("GET /api/estoque/resumo", "/api/estoque/resumo"),
+    ("GET /api/lotes/vencendo?dias=90", "/api/lotes/vencendo?dias=90"),
+    ("GET /api/aging", "/api/aging"),
+    ("GET /api/aging?detalhe&cnpj_cliente", "/api/aging?detalhe=1&cnpj_cliente={cnpj}"),
+    ("GET /api/search?q=nome", "/api/search?q=hospital%20sint"),
+    ("GET /api/search?q=codigo", "/api/search?q=prd00"),
+    ("GET /api/export/balance", "/api/export/balance"),
+)
+
+
+def parse_escala(texto):
+    """'10k' -> 10000, '1M' -> 1000000."""
+    texto = texto.strip().lower()
+    multiplicador = {"k": 1000, "m": 1000000}.get(texto[-1:], 1)
+    return int(float(texto.rstrip("km")) * multiplicador)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _resultado(escala, benchmark, tempos, unidades=None, **extra):
+    """Linha do JSON: tempo total, mediana/p95 por repetição e vazão."""
+    total = sum(tempos)
+    ordenados = sorted(tempos)
+    resultado = {
+        "escala": escala,
+        "benchmark": benchmark,
+        "repeticoes": len(tempos),
+        "segundos_total": round(total, 6),
+        "ms_mediana": round(statistics.median(ordenados) * 1000, 3),
+        "ms_p95": round(ordenados[min(len(ordenados) - 1, int(len(ordenados) * 0.95))] * 1000, 3),
+    }
+    if unidades is not None:
+        resultado["unidades"] = unidades
+        resultado["unidades_por_segundo"] = round(unidades / total, 1) if total else None
+    resultado.update(extra)
+    print(f"  {benchmark:<36} {resultado['ms_mediana']:>10.2f} ms"
+          + (f" {resultado['unidades_por_segundo']:>12,.0f}/s" if unidades else ""))
+    return resultado
+
+
+def _cronometrar(func, *args):
+    inicio = time.perf_counter()
+    retorno = func(*args)
+    return time.perf_counter() - inicio, retorno
+
+
+class Suite:
+    def __init__(self, app, gerador):
+        self.app = app
+        self.gerador = gerador
+        self.client = app.test_client()
+        self.itens = 0
+        self.resultados = []
+
+    def _notas(self, total_itens):
+        self.itens += total_itens
+        return self.gerador.notas(total_itens)
+
+    def carregar(self, escala):
+        """Grava as notas até a escala; devolve só a amostra usada no parsing."""
+        from src.connections import connect
+        from src.insert_nfe_data import NFeBatchIngestor
+
+        itens = escala - self.itens
+        if itens <= 0:
+            return []
+        amostra = []
+        notas = 0
+        with connect() as connection:
+            ingestor = NFeBatchIngestor(connection, batch_size=self.app.config["NFE_BATCH_SIZE"])
+            tempo = 0.0
+            # As notas são geradas sob demanda; só o tempo de importação é medido
+            for nome, xml in self._notas(itens):
+                if len(amostra) < AMOSTRA_PARSE:
+                    amostra.append(xml)
+                inicio = time.perf_counter()
+                ingestor.add(nome, xml, is_file=False)
+                tempo += time.perf_counter() - inicio
+                notas += 1
+            inicio = time.perf_counter()
+            resumo = ingestor.close()
+            tempo += time.perf_counter() - inicio
+        if resumo["erros"]:
+            raise SystemExit(f"Falha na carga: {resumo['erros']} erro(s)")
+        self.resultados.append(_resultado(escala, "carga_lote", [tempo], unidades=itens, notas=notas))
+        return amostra
+
+    def parse(self, escala, amostra):
+        from src.parse_nfe_xml import parse_nfe_xml
+
+        if not amostra:
+            return
+        tempos = []
+        itens = 0
+        for xml in amostra:
+            tempo, nota = _cronometrar(parse_nfe_xml, xml, False)
+            tempos.append(tempo)
+            itens += len(nota["products"])
+        self.resultados.append(_resultado(escala, "parse_nfe_xml", tempos, unidades=itens))
+
+    def nota_a_nota(self, escala):
+        from src.insert_nfe_data import insert_nfe_data
+        from src.routes.opme import parse_and_save_nfe
+
+        for benchmark, func in (("insert_nfe_data", lambda xml: insert_nfe_data(xml, is_file=False)),
+                                ("parse_and_save_nfe", parse_and_save_nfe)):
+            notas = list(self._notas(AMOSTRA_NOTA_A_NOTA * self.gerador.itens_por_nota))
+            tempos = []
+            with self.app.app_context():
+                for _, xml in notas:
+                    tempo, importada = _cronometrar(func, xml)
+                    if not importada:
+                        raise SystemExit(f"{benchmark}: nota não importada")
+                    tempos.append(tempo)
+            self.resultados.append(_resultado(escala, benchmark, tempos, unidades=len(notas)))
+
+    def saldos(self, escala):
+        from src.opme_logic import calculate_balance, get_balance, get_cfop_signs, get_opme_movements
+
+        tempo, movimentos = _cronometrar(get_opme_movements)
+        self.resultados.append(_resultado(escala, "get_opme_movements", [tempo], unidades=len(movimentos)))
+        tempo, saldo = _cronometrar(calculate_balance, movimentos, get_cfop_signs())
+        self.resultados.append(_resultado(escala, "calculate_balance", [tempo], unidades=len(movimentos),
+                                          chaves=len(saldo)))
+        del movimentos, saldo
+
+        # Saldo no meio do período carregado: checkpoint + movimentações desde o corte
+        meio = self.gerador.data_inicial + timedelta(days=self.gerador.numero // 80)
+        for benchmark, filtros in (("get_balance (razão)", {}),
+                                   ("get_balance (agregação)", {"from_ledger": False}),
+                                   ("get_balance (as_of)", {"as_of": meio.isoformat()}),
+                                   ("get_balance (agregação até a data)", {"data_fim": meio.isoformat(),
+                                                                           "from_ledger": False})):
+            tempos = [_cronometrar(lambda: get_balance(**filtros))[0] for _ in range(3)]
+            self.resultados.append(_resultado(escala, benchmark, tempos))
+
+    def http(self, escala):
+        from src.response_cache import RESPONSE_CACHE
+
+        cnpj = self.gerador.clientes[0].cnpj
+        for benchmark, rota in ROTAS_HTTP:
+            url = rota.format(cnpj=cnpj)
+            tempos = []
+            tamanho = 0
+            for _ in range(REPETICOES_HTTP):
+                # Mede a resposta calculada, não o cache de respostas
+                RESPONSE_CACHE.clear()
+                inicio = time.perf_counter()
+                response = self.client.get(url)
+                tamanho = sum(len(bloco) for bloco in response.response)
+                tempos.append(time.perf_counter() - inicio)
+                if response.status_code != 200:
+                    raise SystemExit(f"{url}: HTTP {response.status_code}")
+                response.close()
+            self.resultados.append(_resultado(escala, benchmark, tempos, bytes=tamanho))
+
+    def executar(self, escala):
+        print(f"Escala {escala:,} itens")
+        amostra = self.carregar(escala)
+        self.parse(escala, amostra)
+        del amostra
+        self.nota_a_nota(escala)
+        self.saldos(escala)
+        self.http(escala)
+
+
+def comparar(anterior, atual):
+    """Imprime a razão atual/anterior da mediana de cada (escala, benchmark)."""
+    base = {(r["escala"], r["benchmark"]): r for r in anterior["resultados"]}
+    print(f"\nComparação com {anterior['meta'].get('commit')} ({anterior['meta'].get('data')})")
+    for r in atual["resultados"]:
+        antes = base.get((r["escala"], r["benchmark"]))
+        if antes and antes["ms_mediana"]:
+            razao = r["ms_mediana"] / antes["ms_mediana"]
+            marca = "  <-- mais lento" if razao > 1.2 else ""
+            print(f"  {r['escala']:>9,} {r['benchmark']:<36} {antes['ms_mediana']:>10.2f} -> "
+                  f"{r['ms_mediana']:>10.2f} ms ({razao:.2f}x){marca}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de parsing, importação, saldo e rotas HTTP")
+    parser.add_argument("--escalas", default=DEFAULT_ESCALAS, help="Itens de NF-e por escala (ex.: 10k,100k,1M)")
+    parser.add_argument("--itens-por-nota", type=int, default=20)
+    parser.add_argument("--clientes", type=int, default=50)
+    parser.add_argument("--produtos", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database-url", help="Banco vazio a usar (padrão: SQLite temporário)")
+    parser.add_argument("--saida", help="Arquivo JSON (padrão: benchmarks/resultados/<data>.json)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args(argv)
+
+    escalas = sorted(parse_escala(escala) for escala in args.escalas.split(","))
+    diretorio = None
+    if not args.database_url:
+        diretorio = tempfile.mkdtemp(prefix="opme_bench_")
+        args.database_url = f"sqlite:///{os.path.join(diretorio, 'bench.db')}"
+    # O app lê DATABASE_URL na importação; o worker de tarefas fica desligado
+    os.environ["DATABASE_URL"] = args.database_url
+    os.environ["JOB_WORKERS"] = "0"
+
+    from flask_migrate import upgrade
+    from src.main import create_app
+
+    app = create_app()
+
+    with app.app_context():
+        upgrade()
+
+    gerador = NFeGenerator(clientes=args.clientes, produtos=args.produtos,
+                           itens_por_nota=args.itens_por_nota, seed=args.seed)
+    suite = Suite(app, gerador)
+    for escala in escalas:
+        suite.executar(escala)
+
+    relatorio = {
+        "meta": {
+            "data": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "plataforma": platform.platform(),
+            "banco": args.database_url.split("://")[0],
+            "escalas": escalas,
+            "itens_por_nota": args.itens_por_nota,
+            "clientes": args.clientes,
+            "produtos": args.produtos,
+            "seed": args.seed,
+        },
+        "resultados": suite.resultados,
+    }
+    saida = args.saida or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), "resultados", f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+    print(f"\nResultados gravados em {saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            comparar(json.load(arquivo), relatorio)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,24 @@
+"""
+Configuração do gunicorn, lida automaticamente do diretório de trabalho.
+
+    gunicorn "src.main:create_app()" --bind 0.0.0.0:5000
+
+Quantidade de workers: WEB_CONCURRENCY (padrão do gunicorn: 1).
+"""
+import os
+
+# O app é criado uma vez no processo mestre e os workers o herdam pelo fork,
+# compartilhando as páginas de memória do código já importado
+# (GUNICORN_PRELOAD=0 volta a criar um app em cada worker)
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1").lower() not in ("0", "false", "nao", "não")
+
+
+def post_fork(server, worker):
+    # Conexões abertas pelo mestre não podem ser usadas por dois processos
+    from src.connections import dispose_after_fork
+    dispose_after_fork()
+
+
+def post_worker_init(worker):
+    # Marca usada por benchmarks/startup.py para medir o tempo até o worker atender
+    worker.log.info("Worker pronto (pid %s)", worker.pid)
@@ -0,0 +1,119 @@
+"""esquema inicial das NF-es
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 12:00:00.000000
+
+Cria as tabelas que antes vinham de db.create_all() e de database_setup.py.
+Tabelas que já existem são mantidas, para que bancos criados por esses
+caminhos possam ser colocados sob controle de migrações com
+`flask db upgrade`. O nfe_item dos modelos antigos (db.create_all()) é
+convertido para o de database_setup.py: nfe_header_id passa a nfe_id, nLote
+e qLote vão para lote_info, vProd é calculado como qCom * vUnCom e uCom,
+que nenhuma consulta lê, é removida.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if 'nfe_header' not in existing:
+        op.create_table(
+            'nfe_header',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('nNF', sa.String(length=20), nullable=False),
+            sa.Column('dEmi', sa.Date(), nullable=False),
+            sa.Column('CNPJ_emit', sa.String(length=14), nullable=False),
+            sa.Column('xNome_emit', sa.String(length=100), nullable=False),
+            sa.Column('CNPJ_dest', sa.String(length=14), nullable=False),
+            sa.Column('xNome_dest', sa.String(length=100), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    if 'nfe_item' not in existing:
+        op.create_table(
+            'nfe_item',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('nfe_id', sa.Integer(), nullable=False),
+            sa.Column('cProd', sa.String(length=20), nullable=False),
+            sa.Column('xProd', sa.String(length=100), nullable=False),
+            sa.Column('CFOP', sa.String(length=4), nullable=False),
+            sa.Column('qCom', sa.Float(), nullable=False),
+            sa.Column('vUnCom', sa.Float(), nullable=False),
+            sa.Column('vProd', sa.Float(), nullable=False),
+            sa.ForeignKeyConstraint(['nfe_id'], ['nfe_header.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    if 'lote_info' not in existing:
+        op.create_table(
+            'lote_info',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('nfe_item_id', sa.Integer(), nullable=False),
+            sa.Column('nLote', sa.String(length=20), nullable=True),
+            sa.Column('qLote', sa.Float(), nullable=True),
+            sa.Column('dFab', sa.String(length=10), nullable=True),
+            sa.Column('dVal', sa.String(length=10), nullable=True),
+            sa.ForeignKeyConstraint(['nfe_item_id'], ['nfe_item.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+    item_columns = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('nfe_item')}
+    if 'nfe_header_id' in item_columns:
+        op.execute(
+            'INSERT INTO lote_info (nfe_item_id, "nLote", "qLote") '
+            'SELECT id, "nLote", "qLote" FROM nfe_item '
+            'WHERE "nLote" IS NOT NULL OR "qLote" IS NOT NULL'
+        )
+        with op.batch_alter_table('nfe_item') as batch_op:
+            batch_op.alter_column(
+                'nfe_header_id', new_column_name='nfe_id',
+                existing_type=sa.Integer(), existing_nullable=False
+            )
+            batch_op.add_column(sa.Column('vProd', sa.Float(), nullable=True))
+            batch_op.drop_column('uCom')
+            batch_op.drop_column('nLote')
+            batch_op.drop_column('qLote')
+        op.execute('UPDATE nfe_item SET "vProd" = "qCom" * "vUnCom"')
+        with op.batch_alter_table('nfe_item') as batch_op:
+            batch_op.alter_column('vProd', existing_type=sa.Float(), nullable=False)
+
+    if 'saldo_consignacao' not in existing:
+        op.create_table(
+            'saldo_consignacao',
+            sa.Column('CNPJ_dest', sa.String(length=14), nullable=False),
+            sa.Column('cProd', sa.String(length=20), nullable=False),
+            sa.Column('nLote', sa.String(length=20), nullable=False),
+            sa.Column('xNome_dest', sa.String(length=100), nullable=True),
+            sa.Column('xProd', sa.String(length=100), nullable=True),
+            sa.Column('saldo', sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint('CNPJ_dest', 'cProd', 'nLote')
+        )
+
+    if 'estoque_consignacao' not in existing:
+        op.create_table(
+            'estoque_consignacao',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('produto', sa.String(length=100), nullable=False),
+            sa.Column('quantidade', sa.Float(), nullable=False),
+            sa.Column('nfe_item_id', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['nfe_item_id'], ['nfe_item.id']),
+            sa.PrimaryKeyConstraint('id')
+        )
+
+
+def downgrade():
+    op.drop_table('estoque_consignacao')
+    op.drop_table('saldo_consignacao')
+    op.drop_table('lote_info')
+    op.drop_table('nfe_item')
+    op.drop_table('nfe_header')
@@ -0,0 +1,46 @@
+"""índices das consultas quentes e chave única da NF-e
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:10:00.000000
+
+- nfe_header.chNFe (chave de acesso de 44 dígitos) com índice único;
+- filtro por cliente (CNPJ_dest, dEmi) e checagem de duplicidade por nNF;
+- joins nfe_item.nfe_id e lote_info.nfe_item_id.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+INDEXES = (
+    ('ux_nfe_header_chNFe', 'nfe_header', ['chNFe'], True),
+    ('ix_nfe_header_CNPJ_dest_dEmi', 'nfe_header', ['CNPJ_dest', 'dEmi'], False),
+    ('ix_nfe_header_nNF', 'nfe_header', ['nNF'], False),
+    ('ix_nfe_item_nfe_id', 'nfe_item', ['nfe_id'], False),
+    ('ix_lote_info_nfe_item_id', 'lote_info', ['nfe_item_id'], False),
+)
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if 'chNFe' not in {column['name'] for column in inspector.get_columns('nfe_header')}:
+        op.add_column('nfe_header', sa.Column('chNFe', sa.String(length=44), nullable=True))
+
+    for name, table, columns, unique in INDEXES:
+        if name not in {index['name'] for index in inspector.get_indexes(table)}:
+            op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade():
+    for name, table, _columns, _unique in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
+
+    with op.batch_alter_table('nfe_header') as batch_op:
+        batch_op.drop_column('chNFe')
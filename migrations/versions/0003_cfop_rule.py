@@ -0,0 +1,48 @@
+"""tabela cfop_rule com o sinal de cada CFOP no saldo
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 12:20:00.000000
+
+Conteúdo inicial igual a opme_logic.CFOP_RULES: saídas para consignação
+subtraem, retornos (inclusive simbólicos) somam e faturamento não altera
+o saldo.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+REGRAS = [
+    {'CFOP': '5917', 'sinal': -1, 'descricao': 'Saída para consignação'},
+    {'CFOP': '6917', 'sinal': -1, 'descricao': 'Saída para consignação'},
+    {'CFOP': '1918', 'sinal': 1, 'descricao': 'Retorno de consignação'},
+    {'CFOP': '2918', 'sinal': 1, 'descricao': 'Retorno de consignação'},
+    {'CFOP': '1919', 'sinal': 1, 'descricao': 'Retorno simbólico (material utilizado)'},
+    {'CFOP': '2919', 'sinal': 1, 'descricao': 'Retorno simbólico (material utilizado)'},
+    {'CFOP': '5114', 'sinal': 0, 'descricao': 'Faturamento (venda)'},
+    {'CFOP': '6114', 'sinal': 0, 'descricao': 'Faturamento (venda)'},
+]
+
+
+def upgrade():
+    if 'cfop_rule' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    cfop_rule = op.create_table(
+        'cfop_rule',
+        sa.Column('CFOP', sa.String(length=4), nullable=False),
+        sa.Column('sinal', sa.Integer(), nullable=False),
+        sa.Column('descricao', sa.String(length=100), nullable=True),
+        sa.PrimaryKeyConstraint('CFOP')
+    )
+    op.bulk_insert(cfop_rule, REGRAS)
+
+
+def downgrade():
+    op.drop_table('cfop_rule')
@@ -0,0 +1,36 @@
+"""tabela sync_state com a marca d'água da sincronização com o Mainô
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 13:00:00.000000
+
+Uma linha por conta (identificador derivado da credencial) e endpoint,
+com o último dia sincronizado com sucesso.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'sync_state' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table(
+        'sync_state',
+        sa.Column('conta', sa.String(length=64), nullable=False),
+        sa.Column('endpoint', sa.String(length=50), nullable=False),
+        sa.Column('watermark', sa.Date(), nullable=False),
+        sa.Column('atualizado_em', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('conta', 'endpoint')
+    )
+
+
+def downgrade():
+    op.drop_table('sync_state')
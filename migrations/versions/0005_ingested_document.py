@@ -0,0 +1,37 @@
+"""tabela ingested_document com o hash do conteúdo de cada XML recebido
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 13:30:00.000000
+
+Cópias exatas de um XML já recebido são reconhecidas pelo SHA-256 dos
+bytes, antes do parsing.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'ingested_document' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table(
+        'ingested_document',
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('chNFe', sa.String(length=44), nullable=True),
+        sa.Column('criado_em', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('sha256')
+    )
+    op.create_index('ix_ingested_document_chNFe', 'ingested_document', ['chNFe'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_ingested_document_chNFe', table_name='ingested_document')
+    op.drop_table('ingested_document')
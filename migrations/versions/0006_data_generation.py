@@ -0,0 +1,35 @@
+"""tabela data_generation com o contador de gerações dos dados
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 14:00:00.000000
+
+Linha única (id=1) incrementada na transação de cada importação; o cache
+de respostas compara a geração guardada com a atual.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'data_generation' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    data_generation = op.create_table(
+        'data_generation',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('generation', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(data_generation, [{'id': 1, 'generation': 0}])
+
+
+def downgrade():
+    op.drop_table('data_generation')
@@ -0,0 +1,52 @@
+"""tabela ingest_job com a fila de tarefas em segundo plano
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18 15:00:00.000000
+
+Importações e sincronizações com o Mainô deixam de rodar dentro da
+requisição HTTP: a rota grava a tarefa e um worker (no próprio app ou em
+`python -m src.jobs`) a executa, registrando progresso e resultado.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if 'ingest_job' in sa.inspect(op.get_bind()).get_table_names():
+        return
+
+    op.create_table(
+        'ingest_job',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('tipo', sa.String(length=30), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('prioridade', sa.Integer(), nullable=False),
+        sa.Column('parametros', sa.Text(), nullable=True),
+        sa.Column('credenciais', sa.Text(), nullable=True),
+        sa.Column('progresso', sa.Integer(), nullable=False),
+        sa.Column('total', sa.Integer(), nullable=True),
+        sa.Column('mensagem', sa.String(length=200), nullable=True),
+        sa.Column('resultado', sa.Text(), nullable=True),
+        sa.Column('erro', sa.Text(), nullable=True),
+        sa.Column('cancelar', sa.Boolean(), nullable=False),
+        sa.Column('worker', sa.String(length=100), nullable=True),
+        sa.Column('criado_em', sa.DateTime(), nullable=False),
+        sa.Column('iniciado_em', sa.DateTime(), nullable=True),
+        sa.Column('concluido_em', sa.DateTime(), nullable=True),
+        sa.Column('heartbeat_em', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ingest_job_status_prioridade', 'ingest_job', ['status', 'prioridade', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_ingest_job_status_prioridade', table_name='ingest_job')
+    op.drop_table('ingest_job')
@@ -0,0 +1,49 @@
+"""tabela saldo_checkpoint com os saldos ao fim de cada período
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18 16:00:00.000000
+
+Saldos acumulados por (CNPJ_dest, cProd, nLote) em cada data de corte, para
+consultas de saldo em uma data passada (as_of), e índice em nfe_header.dEmi
+para ler só as movimentações posteriores ao corte. Os checkpoints de bancos
+existentes são criados na próxima importação (ou com
+`python -m src.rebuild_saldo`); até lá as consultas as_of somam o histórico
+inteiro, com o mesmo resultado.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    if 'ix_nfe_header_dEmi' not in {index['name'] for index in inspector.get_indexes('nfe_header')}:
+        op.create_index('ix_nfe_header_dEmi', 'nfe_header', ['dEmi'], unique=False)
+
+    if 'saldo_checkpoint' in inspector.get_table_names():
+        return
+
+    op.create_table(
+        'saldo_checkpoint',
+        sa.Column('data_corte', sa.Date(), nullable=False),
+        sa.Column('CNPJ_dest', sa.String(length=14), nullable=False),
+        sa.Column('cProd', sa.String(length=20), nullable=False),
+        sa.Column('nLote', sa.String(length=20), nullable=False),
+        sa.Column('xNome_dest', sa.String(length=100), nullable=True),
+        sa.Column('xProd', sa.String(length=100), nullable=True),
+        sa.Column('saldo', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('data_corte', 'CNPJ_dest', 'cProd', 'nLote')
+    )
+
+
+def downgrade():
+    op.drop_table('saldo_checkpoint')
+    op.drop_index('ix_nfe_header_dEmi', table_name='nfe_header')
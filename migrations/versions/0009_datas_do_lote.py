@@ -0,0 +1,63 @@
+"""datas de fabricação e validade do lote como DATE, com índice na validade
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-18 17:00:00.000000
+
+lote_info.dFab e lote_info.dVal deixam de ser texto. Valores vazios ou fora
+do formato AAAA-MM-DD viram NULL. Em SQLite a tabela é recriada sem CAST (o
+CAST para DATE do batch do alembic converteria '2030-01-10' no inteiro
+2030): as datas já estão em texto ISO, que é como o tipo Date as grava.
+O índice ix_lote_info_dVal atende o relatório de lotes a vencer
+(/api/lotes/vencendo).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0009'
+down_revision = '0008'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ('dFab', 'dVal')
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    tipos = {column['name']: column['type'] for column in inspector.get_columns('lote_info')}
+    if not all(isinstance(tipos[coluna], sa.Date) for coluna in COLUMNS):
+        if bind.dialect.name == 'sqlite':
+            for coluna in COLUMNS:
+                op.execute(
+                    f'UPDATE lote_info SET "{coluna}" = NULL '
+                    f"WHERE \"{coluna}\" NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+                )
+            reflect_args = [sa.Column(coluna, sa.Date()) for coluna in COLUMNS]
+            with op.batch_alter_table('lote_info', recreate='always', reflect_args=reflect_args):
+                pass
+        else:
+            for coluna in COLUMNS:
+                op.alter_column(
+                    'lote_info', coluna,
+                    type_=sa.Date(),
+                    existing_type=sa.String(length=10),
+                    existing_nullable=True,
+                    postgresql_using=(
+                        f'CASE WHEN "{coluna}" ~ \'^\\d{{4}}-\\d{{2}}-\\d{{2}}$\' '
+                        f'THEN "{coluna}"::date END'
+                    )
+                )
+
+    if 'ix_lote_info_dVal' not in {index['name'] for index in inspector.get_indexes('lote_info')}:
+        op.create_index('ix_lote_info_dVal', 'lote_info', ['dVal'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_lote_info_dVal', table_name='lote_info')
+    with op.batch_alter_table('lote_info') as batch_op:
+        for coluna in COLUMNS:
+            batch_op.alter_column(coluna, type_=sa.String(length=10), existing_type=sa.Date())
@@ -0,0 +1,69 @@
+"""tabelas fifo_camada, fifo_chave e fifo_idade com as filas FIFO de remessas em aberto
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-18 18:00:00.000000
+
+Remessas em consignação ainda não devolvidas, casadas FIFO com os retornos
+por (CNPJ_dest, cProd, nLote), e os totais em aberto por cliente e dia
+de emissão, para o relatório de idade (/api/aging). Em bancos existentes
+as filas são criadas de uma vez na próxima importação (ou com
+`python -m src.rebuild_saldo`).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0010'
+down_revision = '0009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tabelas = sa.inspect(op.get_bind()).get_table_names()
+
+    if 'fifo_camada' not in tabelas:
+        op.create_table(
+            'fifo_camada',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('CNPJ_dest', sa.String(length=14), nullable=False),
+            sa.Column('cProd', sa.String(length=20), nullable=False),
+            sa.Column('nLote', sa.String(length=20), nullable=False),
+            sa.Column('dEmi', sa.Date(), nullable=False),
+            sa.Column('nfe_item_id', sa.Integer(), nullable=False),
+            sa.Column('quantidade', sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index(
+            'ix_fifo_camada_chave', 'fifo_camada',
+            ['CNPJ_dest', 'cProd', 'nLote', 'dEmi', 'nfe_item_id'], unique=False
+        )
+
+    if 'fifo_chave' not in tabelas:
+        op.create_table(
+            'fifo_chave',
+            sa.Column('CNPJ_dest', sa.String(length=14), nullable=False),
+            sa.Column('cProd', sa.String(length=20), nullable=False),
+            sa.Column('nLote', sa.String(length=20), nullable=False),
+            sa.Column('ultima_emissao', sa.Date(), nullable=False),
+            sa.PrimaryKeyConstraint('CNPJ_dest', 'cProd', 'nLote')
+        )
+
+    if 'fifo_idade' not in tabelas:
+        op.create_table(
+            'fifo_idade',
+            sa.Column('CNPJ_dest', sa.String(length=14), nullable=False),
+            sa.Column('dEmi', sa.Date(), nullable=False),
+            sa.Column('quantidade', sa.Float(), nullable=False),
+            sa.Column('sem_remessa', sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint('CNPJ_dest', 'dEmi')
+        )
+
+
+def downgrade():
+    op.drop_table('fifo_idade')
+    op.drop_table('fifo_chave')
+    op.drop_index('ix_fifo_camada_chave', table_name='fifo_camada')
+    op.drop_table('fifo_camada')
@@ -0,0 +1,85 @@
+"""tabela search_entry com índice de trigramas para a busca de clientes, produtos e lotes
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-18 19:00:00.000000
+
+Uma linha por cliente, produto e lote, com código e descrição normalizados
+na coluna termo (/api/search). O índice de trigramas depende do banco:
+tabela FTS5 search_fts (tokenize='trigram', SQLite 3.34+) sincronizada por
+triggers, ou índice GIN gin_trgm_ops da extensão pg_trgm no PostgreSQL. Em
+bancos existentes o índice é preenchido na próxima importação (ou com
+`python -m src.rebuild_saldo`).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0011'
+down_revision = '0010'
+branch_labels = None
+depends_on = None
+
+SQLITE_FTS_DDL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+        termo, content='search_entry', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_entry_ai AFTER INSERT ON search_entry BEGIN
+        INSERT INTO search_fts (rowid, termo) VALUES (new.id, new.termo);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_entry_ad AFTER DELETE ON search_entry BEGIN
+        INSERT INTO search_fts (search_fts, rowid, termo) VALUES ('delete', old.id, old.termo);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_entry_au AFTER UPDATE OF termo ON search_entry BEGIN
+        INSERT INTO search_fts (search_fts, rowid, termo) VALUES ('delete', old.id, old.termo);
+        INSERT INTO search_fts (rowid, termo) VALUES (new.id, new.termo);
+    END
+    """,
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    if 'search_entry' not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            'search_entry',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('chave', sa.String(length=20), nullable=False),
+            sa.Column('tipo', sa.String(length=10), nullable=False),
+            sa.Column('cProd', sa.String(length=20), nullable=False),
+            sa.Column('descricao', sa.String(length=100), nullable=False),
+            sa.Column('termo', sa.String(length=250), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ux_search_entry_chave', 'search_entry', ['chave', 'tipo', 'cProd'], unique=True)
+
+    if bind.dialect.name == 'sqlite':
+        for ddl in SQLITE_FTS_DDL:
+            op.execute(ddl)
+    elif bind.dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute(
+            'CREATE INDEX IF NOT EXISTS ix_search_entry_termo_trgm '
+            'ON search_entry USING gin (termo gin_trgm_ops)'
+        )
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        for trigger in ('search_entry_ai', 'search_entry_ad', 'search_entry_au'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS search_fts')
+    elif bind.dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_search_entry_termo_trgm')
+    op.drop_index('ux_search_entry_chave', table_name='search_entry')
+    op.drop_table('search_entry')
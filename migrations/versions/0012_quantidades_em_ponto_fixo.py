@@ -0,0 +1,77 @@
+"""quantidades e valores como inteiros escalados e índice parcial dos saldos em aberto
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-18 20:00:00.000000
+
+qCom, qLote e os saldos/quantidades derivados passam a ser gravados em
+décimos de milésimo da unidade, vProd em centavos e vUnCom com 10 casas
+(src/fixed_point.py), em BIGINT em vez de REAL. Os valores existentes são
+multiplicados pela escala e arredondados antes da troca de tipo; em SQLite
+as tabelas são recriadas pelo batch do alembic. Com saldos exatos, o índice
+parcial ix_saldo_consignacao_aberto (saldo <> 0) atende a leitura só das
+chaves com material em aberto (/api/balance?em_aberto=1).
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0012'
+down_revision = '0011'
+branch_labels = None
+depends_on = None
+
+# tabela -> ((coluna, casas decimais, nullable), ...)
+COLUMNS = {
+    'nfe_item': (('qCom', 4, False), ('vUnCom', 10, False), ('vProd', 2, False)),
+    'lote_info': (('qLote', 4, True),),
+    'saldo_consignacao': (('saldo', 4, False),),
+    'saldo_checkpoint': (('saldo', 4, False),),
+    'fifo_camada': (('quantidade', 4, False),),
+    'fifo_idade': (('quantidade', 4, False), ('sem_remessa', 4, False)),
+}
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    for tabela, colunas in COLUMNS.items():
+        tipos = {column['name']: column['type'] for column in inspector.get_columns(tabela)}
+        pendentes = [coluna for coluna in colunas if not isinstance(tipos[coluna[0]], sa.Integer)]
+        if not pendentes:
+            continue
+        for coluna, casas, _ in pendentes:
+            op.execute(f'UPDATE {tabela} SET "{coluna}" = ROUND("{coluna}" * {10 ** casas})')
+        with op.batch_alter_table(tabela) as batch_op:
+            for coluna, _, nullable in pendentes:
+                batch_op.alter_column(
+                    coluna,
+                    type_=sa.BigInteger(),
+                    existing_type=sa.Float(),
+                    existing_nullable=nullable,
+                    postgresql_using=f'"{coluna}"::bigint'
+                )
+
+    if 'ix_saldo_consignacao_aberto' not in {index['name'] for index in inspector.get_indexes('saldo_consignacao')}:
+        op.create_index(
+            'ix_saldo_consignacao_aberto', 'saldo_consignacao', ['CNPJ_dest', 'cProd', 'nLote'], unique=False,
+            sqlite_where=sa.text('saldo <> 0'), postgresql_where=sa.text('saldo <> 0')
+        )
+
+
+def downgrade():
+    op.drop_index('ix_saldo_consignacao_aberto', table_name='saldo_consignacao')
+    for tabela, colunas in COLUMNS.items():
+        with op.batch_alter_table(tabela) as batch_op:
+            for coluna, _, nullable in colunas:
+                batch_op.alter_column(
+                    coluna,
+                    type_=sa.Float(),
+                    existing_type=sa.BigInteger(),
+                    existing_nullable=nullable,
+                    postgresql_using=f'"{coluna}"::double precision'
+                )
+        for coluna, casas, _ in colunas:
+            op.execute(f'UPDATE {tabela} SET "{coluna}" = "{coluna}" / {10 ** casas}.0')
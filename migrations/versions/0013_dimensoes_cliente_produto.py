@@ -0,0 +1,149 @@
+"""tabelas de dimensão cliente e produto com chaves inteiras nas NF-es
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-18 21:00:00.000000
+
+CNPJ e razão social de emitentes e destinatários passam para cliente, e
+código e descrição dos produtos para produto (src/dimensions.py), com o
+nome da NF-e mais recente. nfe_header guarda emitente_id e cliente_id e
+nfe_item guarda produto_id; o índice ix_nfe_header_CNPJ_dest_dEmi dá lugar
+a ix_nfe_header_cliente_id_dEmi. As tabelas derivadas (saldo_consignacao,
+saldo_checkpoint, fifo_* e search_entry) continuam com as chaves naturais
+até a migração 0015.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0013'
+down_revision = '0012'
+branch_labels = None
+depends_on = None
+
+# Um nome por chave: o da nota mais recente (como em search_entry)
+CLIENTES_SQL = """
+    INSERT INTO cliente ("CNPJ", "xNome")
+    SELECT "CNPJ", "xNome"
+    FROM (
+        SELECT "CNPJ", "xNome",
+               ROW_NUMBER() OVER (PARTITION BY "CNPJ" ORDER BY "dEmi" DESC, id DESC, papel) AS ordem
+        FROM (
+            SELECT "CNPJ_dest" AS "CNPJ", "xNome_dest" AS "xNome", "dEmi", id, 0 AS papel FROM nfe_header
+            UNION ALL
+            SELECT "CNPJ_emit", "xNome_emit", "dEmi", id, 1 FROM nfe_header
+        ) participantes
+    ) clientes
+    WHERE ordem = 1
+"""
+PRODUTOS_SQL = """
+    INSERT INTO produto ("cProd", "xProd")
+    SELECT "cProd", "xProd"
+    FROM (
+        SELECT ni."cProd", ni."xProd",
+               ROW_NUMBER() OVER (PARTITION BY ni."cProd" ORDER BY nh."dEmi" DESC, ni.id DESC) AS ordem
+        FROM nfe_item ni
+        JOIN nfe_header nh ON nh.id = ni.nfe_id
+    ) produtos
+    WHERE ordem = 1
+"""
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tabelas = inspector.get_table_names()
+
+    if 'cliente' not in tabelas:
+        op.create_table(
+            'cliente',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('CNPJ', sa.String(length=14), nullable=False),
+            sa.Column('xNome', sa.String(length=100), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ux_cliente_CNPJ', 'cliente', ['CNPJ'], unique=True)
+
+    if 'produto' not in tabelas:
+        op.create_table(
+            'produto',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('cProd', sa.String(length=20), nullable=False),
+            sa.Column('xProd', sa.String(length=100), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ux_produto_cProd', 'produto', ['cProd'], unique=True)
+
+    if 'CNPJ_dest' in {column['name'] for column in inspector.get_columns('nfe_header')}:
+        op.execute(CLIENTES_SQL)
+        op.add_column('nfe_header', sa.Column('emitente_id', sa.Integer(), nullable=True))
+        op.add_column('nfe_header', sa.Column('cliente_id', sa.Integer(), nullable=True))
+        op.execute("""
+            UPDATE nfe_header SET
+                emitente_id = (SELECT c.id FROM cliente c WHERE c."CNPJ" = nfe_header."CNPJ_emit"),
+                cliente_id = (SELECT c.id FROM cliente c WHERE c."CNPJ" = nfe_header."CNPJ_dest")
+        """)
+        op.drop_index('ix_nfe_header_CNPJ_dest_dEmi', table_name='nfe_header')
+        with op.batch_alter_table('nfe_header') as batch_op:
+            batch_op.alter_column('emitente_id', existing_type=sa.Integer(), nullable=False)
+            batch_op.alter_column('cliente_id', existing_type=sa.Integer(), nullable=False)
+            batch_op.create_foreign_key('fk_nfe_header_emitente_id', 'cliente', ['emitente_id'], ['id'])
+            batch_op.create_foreign_key('fk_nfe_header_cliente_id', 'cliente', ['cliente_id'], ['id'])
+            for coluna in ('CNPJ_emit', 'xNome_emit', 'CNPJ_dest', 'xNome_dest'):
+                batch_op.drop_column(coluna)
+        op.create_index('ix_nfe_header_cliente_id_dEmi', 'nfe_header', ['cliente_id', 'dEmi'], unique=False)
+
+    if 'cProd' in {column['name'] for column in inspector.get_columns('nfe_item')}:
+        op.execute(PRODUTOS_SQL)
+        op.add_column('nfe_item', sa.Column('produto_id', sa.Integer(), nullable=True))
+        op.execute("""
+            UPDATE nfe_item SET produto_id = (SELECT p.id FROM produto p WHERE p."cProd" = nfe_item."cProd")
+        """)
+        with op.batch_alter_table('nfe_item') as batch_op:
+            batch_op.alter_column('produto_id', existing_type=sa.Integer(), nullable=False)
+            batch_op.create_foreign_key('fk_nfe_item_produto_id', 'produto', ['produto_id'], ['id'])
+            batch_op.drop_column('cProd')
+            batch_op.drop_column('xProd')
+
+
+def downgrade():
+    op.add_column('nfe_item', sa.Column('cProd', sa.String(length=20), nullable=True))
+    op.add_column('nfe_item', sa.Column('xProd', sa.String(length=100), nullable=True))
+    op.execute("""
+        UPDATE nfe_item SET
+            "cProd" = (SELECT p."cProd" FROM produto p WHERE p.id = nfe_item.produto_id),
+            "xProd" = (SELECT p."xProd" FROM produto p WHERE p.id = nfe_item.produto_id)
+    """)
+    with op.batch_alter_table('nfe_item') as batch_op:
+        batch_op.drop_constraint('fk_nfe_item_produto_id', type_='foreignkey')
+        batch_op.drop_column('produto_id')
+        batch_op.alter_column('cProd', existing_type=sa.String(length=20), nullable=False)
+        batch_op.alter_column('xProd', existing_type=sa.String(length=100), nullable=False)
+
+    colunas = (
+        ('CNPJ_emit', 'CNPJ', 14, 'emitente_id'),
+        ('xNome_emit', 'xNome', 100, 'emitente_id'),
+        ('CNPJ_dest', 'CNPJ', 14, 'cliente_id'),
+        ('xNome_dest', 'xNome', 100, 'cliente_id'),
+    )
+    for coluna, _, tamanho, _ in colunas:
+        op.add_column('nfe_header', sa.Column(coluna, sa.String(length=tamanho), nullable=True))
+    op.execute("UPDATE nfe_header SET " + ", ".join(
+        f'"{coluna}" = (SELECT c."{origem}" FROM cliente c WHERE c.id = nfe_header.{chave})'
+        for coluna, origem, _, chave in colunas
+    ))
+    op.drop_index('ix_nfe_header_cliente_id_dEmi', table_name='nfe_header')
+    with op.batch_alter_table('nfe_header') as batch_op:
+        batch_op.drop_constraint('fk_nfe_header_emitente_id', type_='foreignkey')
+        batch_op.drop_constraint('fk_nfe_header_cliente_id', type_='foreignkey')
+        batch_op.drop_column('emitente_id')
+        batch_op.drop_column('cliente_id')
+        for coluna, _, tamanho, _ in colunas:
+            batch_op.alter_column(coluna, existing_type=sa.String(length=tamanho), nullable=False)
+    op.create_index('ix_nfe_header_CNPJ_dest_dEmi', 'nfe_header', ['CNPJ_dest', 'dEmi'], unique=False)
+
+    op.drop_index('ux_produto_cProd', table_name='produto')
+    op.drop_table('produto')
+    op.drop_index('ux_cliente_CNPJ', table_name='cliente')
+    op.drop_table('cliente')
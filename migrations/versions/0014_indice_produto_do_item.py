@@ -0,0 +1,31 @@
+"""índice de nfe_item por produto_id
+
+Revision ID: 0014
+Revises: 0013
+Create Date: 2026-10-18 22:00:00.000000
+
+Os saldos agregados e em uma data filtrados por produto
+(/api/balance?codigo_produto=... com período ou as_of) comparam
+nfe_item.produto_id; sem índice a tabela de itens era lida inteira, o que
+a verificação de planos (flask check-query-plans) passou a acusar ao montar
+as consultas pelo próprio balance_query.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0014'
+down_revision = '0013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'ix_nfe_item_produto_id' not in {index['name'] for index in inspector.get_indexes('nfe_item')}:
+        op.create_index('ix_nfe_item_produto_id', 'nfe_item', ['produto_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_nfe_item_produto_id', table_name='nfe_item')
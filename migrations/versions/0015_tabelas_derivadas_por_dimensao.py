@@ -0,0 +1,304 @@
+"""tabelas derivadas com as chaves inteiras de cliente e produto
+
+Revision ID: 0015
+Revises: 0014
+Create Date: 2026-10-18 23:00:00.000000
+
+saldo_consignacao, saldo_checkpoint, fifo_camada, fifo_chave, fifo_idade e
+search_entry passam de (CNPJ_dest, cProd) para (cliente_id, produto_id), e
+as cópias de xNome_dest/xProd/descricao saem: CNPJ, código e nomes são lidos
+de cliente e produto, de modo que uma razão social ou descrição nova aparece
+em todas as consultas, e não só nas chaves movimentadas depois da troca. As
+linhas existentes são convertidas por junção com as dimensões; o índice de
+trigramas da busca é recriado e reconstruído.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0015'
+down_revision = '0014'
+branch_labels = None
+depends_on = None
+
+SQLITE_FTS_TRIGGERS = ('search_entry_ai', 'search_entry_ad', 'search_entry_au')
+SQLITE_FTS_DDL = (
+    """
+    CREATE TRIGGER IF NOT EXISTS search_entry_ai AFTER INSERT ON search_entry BEGIN
+        INSERT INTO search_fts (rowid, termo) VALUES (new.id, new.termo);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_entry_ad AFTER DELETE ON search_entry BEGIN
+        INSERT INTO search_fts (search_fts, rowid, termo) VALUES ('delete', old.id, old.termo);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_entry_au AFTER UPDATE OF termo ON search_entry BEGIN
+        INSERT INTO search_fts (search_fts, rowid, termo) VALUES ('delete', old.id, old.termo);
+        INSERT INTO search_fts (rowid, termo) VALUES (new.id, new.termo);
+    END
+    """,
+)
+
+# tabela -> SELECT das linhas no formato novo, a partir da tabela antiga (t)
+CONVERSOES = {
+    'saldo_consignacao': """
+        SELECT c.id AS cliente_id, p.id AS produto_id, t."nLote", t.saldo
+        FROM saldo_consignacao t
+        JOIN cliente c ON c."CNPJ" = t."CNPJ_dest"
+        JOIN produto p ON p."cProd" = t."cProd"
+    """,
+    'saldo_checkpoint': """
+        SELECT t.data_corte, c.id AS cliente_id, p.id AS produto_id, t."nLote", t.saldo
+        FROM saldo_checkpoint t
+        JOIN cliente c ON c."CNPJ" = t."CNPJ_dest"
+        JOIN produto p ON p."cProd" = t."cProd"
+    """,
+    'fifo_camada': """
+        SELECT c.id AS cliente_id, p.id AS produto_id, t."nLote", t."dEmi", t.nfe_item_id, t.quantidade
+        FROM fifo_camada t
+        JOIN cliente c ON c."CNPJ" = t."CNPJ_dest"
+        JOIN produto p ON p."cProd" = t."cProd"
+    """,
+    'fifo_chave': """
+        SELECT c.id AS cliente_id, p.id AS produto_id, t."nLote", t.ultima_emissao
+        FROM fifo_chave t
+        JOIN cliente c ON c."CNPJ" = t."CNPJ_dest"
+        JOIN produto p ON p."cProd" = t."cProd"
+    """,
+    'fifo_idade': """
+        SELECT c.id AS cliente_id, t."dEmi", t.quantidade, t.sem_remessa
+        FROM fifo_idade t
+        JOIN cliente c ON c."CNPJ" = t."CNPJ_dest"
+    """,
+    # Cliente pela chave (CNPJ); produto e lote pelo código do produto
+    'search_entry': """
+        SELECT t.chave, t.tipo, COALESCE(c.id, p.id) AS dimensao_id, t.termo
+        FROM search_entry t
+        LEFT JOIN cliente c ON t.tipo = 'cliente' AND c."CNPJ" = t.chave
+        LEFT JOIN produto p ON t.tipo <> 'cliente'
+            AND p."cProd" = CASE WHEN t.tipo = 'lote' THEN t."cProd" ELSE t.chave END
+        WHERE COALESCE(c.id, p.id) IS NOT NULL
+    """,
+}
+
+# Volta às chaves naturais, com os nomes atuais das dimensões
+REVERSOES = {
+    'saldo_consignacao': """
+        SELECT c."CNPJ" AS "CNPJ_dest", p."cProd", t."nLote", c."xNome" AS "xNome_dest", p."xProd", t.saldo
+        FROM saldo_consignacao t
+        JOIN cliente c ON c.id = t.cliente_id
+        JOIN produto p ON p.id = t.produto_id
+    """,
+    'saldo_checkpoint': """
+        SELECT t.data_corte, c."CNPJ" AS "CNPJ_dest", p."cProd", t."nLote",
+               c."xNome" AS "xNome_dest", p."xProd", t.saldo
+        FROM saldo_checkpoint t
+        JOIN cliente c ON c.id = t.cliente_id
+        JOIN produto p ON p.id = t.produto_id
+    """,
+    'fifo_camada': """
+        SELECT c."CNPJ" AS "CNPJ_dest", p."cProd", t."nLote", t."dEmi", t.nfe_item_id, t.quantidade
+        FROM fifo_camada t
+        JOIN cliente c ON c.id = t.cliente_id
+        JOIN produto p ON p.id = t.produto_id
+    """,
+    'fifo_chave': """
+        SELECT c."CNPJ" AS "CNPJ_dest", p."cProd", t."nLote", t.ultima_emissao
+        FROM fifo_chave t
+        JOIN cliente c ON c.id = t.cliente_id
+        JOIN produto p ON p.id = t.produto_id
+    """,
+    'fifo_idade': """
+        SELECT c."CNPJ" AS "CNPJ_dest", t."dEmi", t.quantidade, t.sem_remessa
+        FROM fifo_idade t
+        JOIN cliente c ON c.id = t.cliente_id
+    """,
+    'search_entry': """
+        SELECT t.chave, t.tipo,
+               CASE WHEN t.tipo = 'lote' THEN p."cProd" ELSE '' END AS "cProd",
+               COALESCE(c."xNome", p."xProd") AS descricao, t.termo
+        FROM search_entry t
+        LEFT JOIN cliente c ON t.tipo = 'cliente' AND c.id = t.dimensao_id
+        LEFT JOIN produto p ON t.tipo <> 'cliente' AND p.id = t.dimensao_id
+        WHERE COALESCE(c."xNome", p."xProd") IS NOT NULL
+    """,
+}
+
+
+def _chave_cliente():
+    return sa.Column('cliente_id', sa.Integer(), nullable=False)
+
+
+def _chave_produto():
+    return sa.Column('produto_id', sa.Integer(), nullable=False)
+
+
+def _cnpj():
+    return sa.Column('CNPJ_dest', sa.String(length=14), nullable=False)
+
+
+def _cprod():
+    return sa.Column('cProd', sa.String(length=20), nullable=False)
+
+
+def _lote():
+    return sa.Column('nLote', sa.String(length=20), nullable=False)
+
+
+def _tabelas_por_dimensao():
+    return {
+        'saldo_consignacao': (
+            _chave_cliente(), _chave_produto(), _lote(),
+            sa.Column('saldo', sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint('cliente_id', 'produto_id', 'nLote')
+        ),
+        'saldo_checkpoint': (
+            sa.Column('data_corte', sa.Date(), nullable=False),
+            _chave_cliente(), _chave_produto(), _lote(),
+            sa.Column('saldo', sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint('data_corte', 'cliente_id', 'produto_id', 'nLote')
+        ),
+        'fifo_camada': (
+            sa.Column('id', sa.Integer(), nullable=False),
+            _chave_cliente(), _chave_produto(), _lote(),
+            sa.Column('dEmi', sa.Date(), nullable=False),
+            sa.Column('nfe_item_id', sa.Integer(), nullable=False),
+            sa.Column('quantidade', sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        ),
+        'fifo_chave': (
+            _chave_cliente(), _chave_produto(), _lote(),
+            sa.Column('ultima_emissao', sa.Date(), nullable=False),
+            sa.PrimaryKeyConstraint('cliente_id', 'produto_id', 'nLote')
+        ),
+        'fifo_idade': (
+            _chave_cliente(),
+            sa.Column('dEmi', sa.Date(), nullable=False),
+            sa.Column('quantidade', sa.BigInteger(), nullable=False),
+            sa.Column('sem_remessa', sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint('cliente_id', 'dEmi')
+        ),
+        'search_entry': (
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('chave', sa.String(length=20), nullable=False),
+            sa.Column('tipo', sa.String(length=10), nullable=False),
+            sa.Column('dimensao_id', sa.Integer(), nullable=False),
+            sa.Column('termo', sa.String(length=250), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        ),
+    }
+
+
+def _tabelas_por_chave_natural():
+    return {
+        'saldo_consignacao': (
+            _cnpj(), _cprod(), _lote(),
+            sa.Column('xNome_dest', sa.String(length=100), nullable=True),
+            sa.Column('xProd', sa.String(length=100), nullable=True),
+            sa.Column('saldo', sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint('CNPJ_dest', 'cProd', 'nLote')
+        ),
+        'saldo_checkpoint': (
+            sa.Column('data_corte', sa.Date(), nullable=False),
+            _cnpj(), _cprod(), _lote(),
+            sa.Column('xNome_dest', sa.String(length=100), nullable=True),
+            sa.Column('xProd', sa.String(length=100), nullable=True),
+            sa.Column('saldo', sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint('data_corte', 'CNPJ_dest', 'cProd', 'nLote')
+        ),
+        'fifo_camada': (
+            sa.Column('id', sa.Integer(), nullable=False),
+            _cnpj(), _cprod(), _lote(),
+            sa.Column('dEmi', sa.Date(), nullable=False),
+            sa.Column('nfe_item_id', sa.Integer(), nullable=False),
+            sa.Column('quantidade', sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        ),
+        'fifo_chave': (
+            _cnpj(), _cprod(), _lote(),
+            sa.Column('ultima_emissao', sa.Date(), nullable=False),
+            sa.PrimaryKeyConstraint('CNPJ_dest', 'cProd', 'nLote')
+        ),
+        'fifo_idade': (
+            _cnpj(),
+            sa.Column('dEmi', sa.Date(), nullable=False),
+            sa.Column('quantidade', sa.BigInteger(), nullable=False),
+            sa.Column('sem_remessa', sa.BigInteger(), nullable=False),
+            sa.PrimaryKeyConstraint('CNPJ_dest', 'dEmi')
+        ),
+        'search_entry': (
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('chave', sa.String(length=20), nullable=False),
+            sa.Column('tipo', sa.String(length=10), nullable=False),
+            sa.Column('cProd', sa.String(length=20), nullable=False),
+            sa.Column('descricao', sa.String(length=100), nullable=False),
+            sa.Column('termo', sa.String(length=250), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        ),
+    }
+
+
+def _recriar(bind, tabelas, selects, indices):
+    """
+    Recria cada tabela no formato de `tabelas` com as linhas de `selects`.
+
+    As linhas convertidas passam por uma tabela auxiliar (CREATE TABLE AS),
+    e a tabela é recriada com chave primária e tipos das migrações; os ids
+    (fifo_camada, search_entry) são gerados de novo, sem ajuste de sequência.
+    """
+    if bind.dialect.name == 'sqlite':
+        for trigger in SQLITE_FTS_TRIGGERS:
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+    elif bind.dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_search_entry_termo_trgm')
+
+    inspector = sa.inspect(bind)
+    for tabela, colunas in tabelas.items():
+        auxiliar = f'{tabela}_convertida'
+        op.execute(f'CREATE TABLE {auxiliar} AS {selects[tabela]}')
+        for index in inspector.get_indexes(tabela):
+            op.drop_index(index['name'], table_name=tabela)
+        op.drop_table(tabela)
+        op.create_table(tabela, *colunas)
+        nomes = ', '.join(
+            f'"{coluna.name}"' for coluna in colunas
+            if isinstance(coluna, sa.Column) and coluna.name != 'id'
+        )
+        op.execute(f'INSERT INTO {tabela} ({nomes}) SELECT {nomes} FROM {auxiliar}')
+        op.drop_table(auxiliar)
+
+    for nome, tabela, colunas, opcoes in indices:
+        op.create_index(nome, tabela, colunas, **opcoes)
+
+    if bind.dialect.name == 'sqlite':
+        for ddl in SQLITE_FTS_DDL:
+            op.execute(ddl)
+        op.execute("INSERT INTO search_fts (search_fts) VALUES ('rebuild')")
+    elif bind.dialect.name == 'postgresql':
+        op.execute(
+            'CREATE INDEX IF NOT EXISTS ix_search_entry_termo_trgm '
+            'ON search_entry USING gin (termo gin_trgm_ops)'
+        )
+
+
+def _indices(cliente, produto, produto_da_busca):
+    aberto = {'sqlite_where': sa.text('saldo <> 0'), 'postgresql_where': sa.text('saldo <> 0')}
+    return (
+        ('ix_saldo_consignacao_aberto', 'saldo_consignacao', [cliente, produto, 'nLote'], aberto),
+        ('ix_fifo_camada_chave', 'fifo_camada', [cliente, produto, 'nLote', 'dEmi', 'nfe_item_id'], {}),
+        ('ux_search_entry_chave', 'search_entry', ['chave', 'tipo', produto_da_busca], {'unique': True}),
+    )
+
+
+def upgrade():
+    bind = op.get_bind()
+    if 'cliente_id' in {column['name'] for column in sa.inspect(bind).get_columns('saldo_consignacao')}:
+        return
+    _recriar(bind, _tabelas_por_dimensao(), CONVERSOES, _indices('cliente_id', 'produto_id', 'dimensao_id'))
+
+
+def downgrade():
+    _recriar(op.get_bind(), _tabelas_por_chave_natural(), REVERSOES, _indices('CNPJ_dest', 'cProd', 'cProd'))
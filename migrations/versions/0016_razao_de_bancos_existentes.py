@@ -0,0 +1,58 @@
+"""razão saldo_consignacao preenchido em bancos que já têm NF-es
+
+Revision ID: 0016
+Revises: 0015
+Create Date: 2026-10-19 00:00:00.000000
+
+Bancos anteriores ao razão (inclusive os do antigo db.create_all()) saíam
+do `flask db upgrade` com notas gravadas e saldo_consignacao vazia, e
+/api/balance respondia vazio até a primeira importação (que recalcula o
+razão, src/opme_logic.update_ledger). O razão vazio é preenchido aqui com
+a mesma agregação de rebuild_ledger: quantidade do lote (ou qCom) vezes o
+sinal do CFOP em cfop_rule. Checkpoints, filas FIFO e o índice de busca
+continuam sendo criados na primeira importação ou por
+`python -m src.rebuild_saldo`.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0016'
+down_revision = '0015'
+branch_labels = None
+depends_on = None
+
+REBUILD_SALDO_SQL = """
+    INSERT INTO saldo_consignacao (cliente_id, produto_id, "nLote", saldo)
+    SELECT cliente_id, produto_id, "nLote", SUM(saldo)
+    FROM (
+        SELECT
+            nh.cliente_id,
+            ni.produto_id,
+            COALESCE(NULLIF(li."nLote", ''), 'SEM_LOTE') AS "nLote",
+            CASE
+                WHEN li."qLote" IS NOT NULL AND li."qLote" <> 0 THEN li."qLote"
+                ELSE ni."qCom"
+            END * COALESCE(cr.sinal, 0) AS saldo
+        FROM nfe_header nh
+        JOIN nfe_item ni ON nh.id = ni.nfe_id
+        LEFT JOIN lote_info li ON ni.id = li.nfe_item_id
+        LEFT JOIN cfop_rule cr ON cr."CFOP" = ni."CFOP"
+    ) movimentos
+    GROUP BY cliente_id, produto_id, "nLote"
+"""
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.execute(sa.text('SELECT 1 FROM saldo_consignacao LIMIT 1')).first() is not None:
+        return
+    if bind.execute(sa.text('SELECT 1 FROM nfe_header LIMIT 1')).first() is None:
+        return
+    op.execute(REBUILD_SALDO_SQL)
+
+
+def downgrade():
+    # Os saldos continuam válidos no esquema anterior
+    pass
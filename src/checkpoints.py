@@ -0,0 +1,189 @@
+"""
+Checkpoints de saldo: o saldo acumulado por (cliente_id, produto_id, nLote) ao fim
+de cada período (mensal por padrão; BALANCE_CHECKPOINT_MONTHS meses).
+
+Uma consulta de saldo em uma data (balance_query(as_of=...)) parte do
+checkpoint mais recente até ela e soma só as movimentações posteriores ao
+corte, em vez de refazer todo o histórico.
+
+Os checkpoints são mantidos na mesma transação da importação
+(insert_nfe_records):
+
+- a primeira NF-e emitida depois do fim de um período fecha esse período:
+  o checkpoint é o anterior mais as movimentações do período;
+- uma NF-e com data retroativa (dEmi até o último corte) soma suas
+  variações em todos os checkpoints a partir da sua data.
+
+rebuild_ledger (python -m src.rebuild_saldo) recria todos eles, por exemplo
+depois de alterar cfop_rule.
+"""
+import calendar
+import os
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from src.opme_logic import SIGNED_MOVEMENTS_SQL, ledger_deltas, merge_ledger_deltas, ledger_rows
+
+# Meses por período (1 = mensal, 3 = trimestral...); os períodos são alinhados a janeiro
+DEFAULT_CHECKPOINT_MONTHS = 1
+
+UPSERT_CHECKPOINT_SQL = """
+    INSERT INTO saldo_checkpoint (data_corte, cliente_id, produto_id, "nLote", saldo)
+    VALUES (:data_corte, :cliente_id, :produto_id, :nLote, :saldo)
+    ON CONFLICT (data_corte, cliente_id, produto_id, "nLote") DO UPDATE SET
+        saldo = saldo_checkpoint.saldo + excluded.saldo
+"""
+
+# Checkpoint anterior + movimentações de (anterior, data_corte]; saldos
+# zerados não são levados adiante, e um período já fechado (por outra
+# importação concorrente) fica como está
+CREATE_CHECKPOINT_SQL = f"""
+    INSERT INTO saldo_checkpoint (data_corte, cliente_id, produto_id, "nLote", saldo)
+    SELECT :data_corte, cliente_id, produto_id, "nLote", SUM(saldo)
+    FROM (
+        SELECT cliente_id, produto_id, "nLote", saldo
+        FROM saldo_checkpoint
+        WHERE data_corte = :anterior
+        UNION ALL
+        {SIGNED_MOVEMENTS_SQL}
+        WHERE nh."dEmi" > :anterior AND nh."dEmi" <= :data_corte
+    ) movimentos
+    GROUP BY cliente_id, produto_id, "nLote"
+    HAVING SUM(saldo) <> 0
+    ON CONFLICT (data_corte, cliente_id, produto_id, "nLote") DO NOTHING
+"""
+
+# Data anterior a qualquer NF-e (o "checkpoint" vazio antes do primeiro)
+INICIO = date(1, 1, 1)
+
+
+def checkpoint_months():
+    return max(1, int(os.environ.get("BALANCE_CHECKPOINT_MONTHS", DEFAULT_CHECKPOINT_MONTHS)))
+
+
+def _as_date(valor):
+    # SQLite devolve datas de consultas agregadas (MAX) como texto
+    return date.fromisoformat(valor) if isinstance(valor, str) else valor
+
+
+def period_end(dia, meses=None):
+    """Último dia do período de `meses` meses que contém `dia`."""
+    meses = meses or checkpoint_months()
+    indice = dia.year * 12 + dia.month - 1
+    ano, mes = divmod(indice - indice % meses + meses - 1, 12)
+    return date(ano, mes + 1, calendar.monthrange(ano, mes + 1)[1])
+
+
+def last_checkpoint(connection, ate=None):
+    """Data do checkpoint mais recente (até `ate`, se dado) ou None."""
+    if ate is None:
+        valor = connection.execute(text("SELECT MAX(data_corte) FROM saldo_checkpoint")).scalar()
+    else:
+        valor = connection.execute(
+            text("SELECT MAX(data_corte) FROM saldo_checkpoint WHERE data_corte <= :ate"),
+            {"ate": ate.isoformat()}
+        ).scalar()
+    return _as_date(valor)
+
+
+def _checkpoints_since(connection, inicio):
+    """Datas de corte >= inicio, uma busca no índice por data (sem ler as linhas de saldo)."""
+    cortes = []
+    corte = connection.execute(
+        text("SELECT MIN(data_corte) FROM saldo_checkpoint WHERE data_corte >= :inicio"),
+        {"inicio": inicio.isoformat()}
+    ).scalar()
+    while corte is not None:
+        corte = _as_date(corte)
+        cortes.append(corte)
+        corte = connection.execute(
+            text("SELECT MIN(data_corte) FROM saldo_checkpoint WHERE data_corte > :anterior"),
+            {"anterior": corte.isoformat()}
+        ).scalar()
+    return cortes
+
+
+def create_checkpoint(connection, data_corte, anterior=None):
+    """Grava o checkpoint de data_corte a partir do anterior (ou de todo o histórico)."""
+    connection.execute(text(CREATE_CHECKPOINT_SQL), {
+        "data_corte": data_corte.isoformat(),
+        "anterior": (anterior or INICIO).isoformat()
+    })
+
+
+def ensure_checkpoints(connection, ate, meses=None, ultimo=None):
+    """
+    Cria os checkpoints dos períodos encerrados antes de `ate` que ainda faltam.
+
+    Args:
+        connection: Conexão SQLAlchemy (a transação fica com o chamador)
+        ate (date): Data de emissão mais recente; só períodos que terminam antes dela são fechados
+        meses (int, optional): Meses por período (padrão: BALANCE_CHECKPOINT_MONTHS)
+        ultimo (date, optional): Último checkpoint, se o chamador já o consultou
+
+    Returns:
+        list: Datas de corte criadas
+    """
+    meses = meses or checkpoint_months()
+    if ultimo is None:
+        primeira = _as_date(connection.execute(text('SELECT MIN("dEmi") FROM nfe_header')).scalar())
+        if primeira is None:
+            return []
+        corte = period_end(primeira, meses)
+    else:
+        corte = period_end(ultimo + timedelta(days=1), meses)
+
+    criados = []
+    while corte < ate:
+        create_checkpoint(connection, corte, ultimo)
+        criados.append(corte)
+        ultimo = corte
+        corte = period_end(corte + timedelta(days=1), meses)
+    return criados
+
+
+def update_checkpoints(connection, records, sinais, cliente_ids, produto_ids):
+    """
+    Mantém os checkpoints depois de gravar NF-es (mesma transação do insert).
+
+    NF-es com dEmi até o último corte têm suas variações somadas em cada
+    checkpoint a partir da sua data, com os sinais de cfop_rule em `sinais`
+    (opme_logic.load_cfop_signs) e as chaves das dimensões em cliente_ids e
+    produto_ids; depois são criados os checkpoints dos períodos que a nota
+    mais recente encerrou.
+    """
+    if not records:
+        return
+    emissoes = [(date.fromisoformat(record.dEmi), record) for record in records]
+    ultimo = last_checkpoint(connection)
+
+    if ultimo is not None:
+        retroativas = sorted(
+            ((dia, record) for dia, record in emissoes if dia <= ultimo),
+            key=lambda item: item[0]
+        )
+        if retroativas:
+            rows = []
+            deltas = {}
+            pendentes = iter(retroativas)
+            proxima = next(pendentes, None)
+            # Os deltas são cumulativos: cada corte recebe as notas com data até ele
+            for corte in _checkpoints_since(connection, retroativas[0][0]):
+                while proxima is not None and proxima[0] <= corte:
+                    merge_ledger_deltas(deltas, ledger_deltas(proxima[1], sinais, cliente_ids, produto_ids))
+                    proxima = next(pendentes, None)
+                rows.extend(dict(row, data_corte=corte.isoformat()) for row in ledger_rows(deltas))
+            if rows:
+                connection.execute(text(UPSERT_CHECKPOINT_SQL), rows)
+
+    ensure_checkpoints(connection, max(dia for dia, _ in emissoes), ultimo=ultimo)
+
+
+def rebuild_checkpoints(connection, meses=None):
+    """Apaga e recria todos os checkpoints a partir das NF-es gravadas."""
+    connection.execute(text("DELETE FROM saldo_checkpoint"))
+    ate = _as_date(connection.execute(text('SELECT MAX("dEmi") FROM nfe_header')).scalar())
+    if ate is None:
+        return []
+    return ensure_checkpoints(connection, ate, meses=meses)
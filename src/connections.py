@@ -0,0 +1,219 @@
+"""
+Provedor único de conexões com o banco.
+
+Todos os módulos (rotas, opme_logic, insert_nfe_data, integração Mainô e os
+comandos de linha) usam o engine do Flask-SQLAlchemy configurado por
+create_app() em src/main.py, em vez de abrir sqlite3.connect() por conta própria.
+Fora do app (comandos de linha sem create_app()) o engine é criado aqui, com
+a mesma URL e as mesmas opções:
+
+    with connect() as connection:                 # escrita (transação própria)
+        ...
+    with connect(readonly=True) as connection:    # relatórios
+        ...
+
+No SQLite cada conexão nova recebe WAL e pragmas ajustados, de modo que
+leitores e o escritor não se bloqueiam entre os workers do gunicorn. As
+consultas de relatório usam um pool separado, somente leitura (query_only
+no SQLite, default_transaction_read_only no PostgreSQL).
+
+Um caminho explícito (db_name) continua aceito para bancos SQLite avulsos,
+como nos comandos de manutenção com --db.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+
+from src.extensions import db
+from src.metrics import REGISTRY
+
+DEFAULT_DATABASE_URL = "sqlite:///database/app.db"
+# Pasta instance/ do app Flask (src.main): o Flask-SQLAlchemy resolve a partir
+# dela os caminhos relativos de SQLite, como o do DEFAULT_DATABASE_URL
+INSTANCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "instance")
+
+# Aplicados a cada conexão SQLite nova (journal_mode=WAL persiste no arquivo)
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("busy_timeout", 5000),
+    ("cache_size", -64000),          # ~64 MB de cache de páginas por conexão
+    ("mmap_size", 268435456),        # 256 MB mapeados em memória
+    ("temp_store", "MEMORY"),
+)
+SQLITE_READONLY_PRAGMAS = (
+    ("query_only", "ON"),
+    ("busy_timeout", 5000),
+    ("cache_size", -64000),
+    ("mmap_size", 268435456),
+    ("temp_store", "MEMORY"),
+)
+
+_lock = threading.Lock()
+_app_engine = None
+_read_engines = {}
+_file_engines = {}
+
+
+def database_url():
+    """DATABASE_URL (por ex. Postgres em produção) ou o SQLite padrão do app."""
+    return os.environ.get("DATABASE_URL") or DEFAULT_DATABASE_URL
+
+
+def app_database_url():
+    """
+    URL do banco do app como o Flask-SQLAlchemy a usa: database_url() com o
+    caminho relativo de SQLite resolvido dentro de INSTANCE_DIR.
+    """
+    url = make_url(database_url())
+    if url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:") \
+            and not os.path.isabs(url.database):
+        url = url.set(database=os.path.join(INSTANCE_DIR, url.database))
+    return url
+
+
+def engine_options(url, readonly=False):
+    """Parâmetros de create_engine/SQLALCHEMY_ENGINE_OPTIONS para a URL."""
+    if url.startswith("sqlite"):
+        return {
+            "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+            "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+            # As conexões do pool circulam entre as threads do servidor
+            "connect_args": {"check_same_thread": False, "timeout": 30},
+        }
+    options = {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 20)),
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+    }
+    if readonly:
+        options["connect_args"] = {"options": "-c default_transaction_read_only=on"}
+    return options
+
+
+def install_sqlite_pragmas(engine, readonly=False):
+    """Registra os pragmas no evento connect do engine (só para SQLite)."""
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = SQLITE_READONLY_PRAGMAS if readonly else SQLITE_PRAGMAS
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, _connection_record):
+        cursor = dbapi_connection.cursor()
+        for nome, valor in pragmas:
+            cursor.execute(f"PRAGMA {nome}={valor}")
+        cursor.close()
+
+
+def init_app(app):
+    """Chamado por create_app() depois de db.init_app: registra o engine do app."""
+    global _app_engine
+    with app.app_context():
+        engine = db.engine
+    install_sqlite_pragmas(engine)
+    with _lock:
+        _app_engine = engine
+
+
+def _get_app_engine():
+    global _app_engine
+    with _lock:
+        if _app_engine is None:
+            # Fora do app (ex.: python -m src.rebuild_saldo): um engine só, com a
+            # URL e as opções que create_app() passaria ao Flask-SQLAlchemy, sem
+            # montar o app Flask
+            engine = create_engine(app_database_url(), **engine_options(database_url()))
+            install_sqlite_pragmas(engine)
+            _app_engine = engine
+        return _app_engine
+
+
+def dispose_after_fork():
+    """
+    Chamado no processo filho logo após o fork (gunicorn --preload): descarta
+    as conexões herdadas do processo mestre sem fechá-las, para que cada
+    worker abra as suas.
+    """
+    with _lock:
+        engines = [_app_engine] if _app_engine is not None else []
+        engines.extend(_read_engines.values())
+        engines.extend(_file_engines.values())
+    for engine in engines:
+        engine.dispose(close=False)
+
+
+def _file_engine(db_name):
+    path = os.path.abspath(db_name)
+    with _lock:
+        engine = _file_engines.get(path)
+        if engine is None:
+            url = f"sqlite:///{path}"
+            engine = create_engine(url, **engine_options(url))
+            install_sqlite_pragmas(engine)
+            _file_engines[path] = engine
+        return engine
+
+
+def get_engine(db_name=None, readonly=False):
+    """
+    Engine do banco do app (ou de um arquivo SQLite avulso, se db_name for dado).
+
+    Com readonly=True devolve um engine separado, com pool próprio, cujas
+    conexões não aceitam escrita.
+    """
+    engine = _file_engine(db_name) if db_name else _get_app_engine()
+    if not readonly:
+        return engine
+
+    key = str(engine.url)
+    with _lock:
+        read_engine = _read_engines.get(key)
+        if read_engine is None:
+            read_engine = create_engine(engine.url, **engine_options(key, readonly=True))
+            install_sqlite_pragmas(read_engine, readonly=True)
+            _read_engines[key] = read_engine
+        return read_engine
+
+
+def pool_status():
+    """
+    Uso dos pools do banco do app: conexões em uso, ociosas e o tamanho fixo
+    de cada um (escrita e leitura). Pools sem essas contagens (ex.: NullPool)
+    ficam de fora.
+
+    Returns:
+        list: [(nome do pool, em uso, ociosas, tamanho)]
+    """
+    with _lock:
+        engines = [("escrita", _app_engine)] if _app_engine is not None else []
+        if _app_engine is not None:
+            read_engine = _read_engines.get(str(_app_engine.url))
+            if read_engine is not None:
+                engines.append(("leitura", read_engine))
+    status = []
+    for nome, engine in engines:
+        pool = engine.pool
+        if hasattr(pool, "checkedout"):
+            status.append((nome, pool.checkedout(), pool.checkedin(), pool.size()))
+    return status
+
+
+def _pool_metrics():
+    for nome, em_uso, ociosas, tamanho in pool_status():
+        yield {"pool": nome, "state": "em_uso"}, em_uso
+        yield {"pool": nome, "state": "ociosas"}, ociosas
+        yield {"pool": nome, "state": "tamanho"}, tamanho
+
+
+REGISTRY.gauge("opme_db_pool_connections", "Conexões dos pools do banco do app", ("pool", "state"), _pool_metrics)
+
+
+@contextmanager
+def connect(db_name=None, readonly=False):
+    """Conexão do pool; a transação fica com o chamador (connection.begin())."""
+    with get_engine(db_name, readonly=readonly).connect() as connection:
+        yield connection
@@ -1,34 +1,58 @@
 import sqlite3
 
+from src.opme_logic import CFOP_RULES
+from src.search import SQLITE_FTS_DDL
+
 def setup_database(db_name="opme_control.db"):
     conn = sqlite3.connect(db_name)
     cursor = conn.cursor()
+    # WAL é persistente no arquivo; as conexões do app aplicam o restante dos pragmas
+    cursor.execute('PRAGMA journal_mode=WAL')
+
+    # Dimensões: participantes (emitentes e destinatários) e produtos, com o
+    # nome mais recente recebido (src/dimensions.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cliente (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            CNPJ TEXT NOT NULL,
+            xNome TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS produto (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cProd TEXT NOT NULL,
+            xProd TEXT NOT NULL
+        )
+    ''')
 
     # Tabela para cabeçalho da NF-e
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS nfe_header (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chNFe TEXT,
             nNF TEXT NOT NULL,
             dEmi TEXT NOT NULL,
-            CNPJ_emit TEXT NOT NULL,
-            xNome_emit TEXT NOT NULL,
-            CNPJ_dest TEXT NOT NULL,
-            xNome_dest TEXT NOT NULL
+            emitente_id INTEGER NOT NULL,
+            cliente_id INTEGER NOT NULL,
+            FOREIGN KEY (emitente_id) REFERENCES cliente(id),
+            FOREIGN KEY (cliente_id) REFERENCES cliente(id)
         )
     ''')
 
-    # Tabela para itens da NF-e (produtos)
+    # Tabela para itens da NF-e (produtos); quantidades e valores em inteiros
+    # escalados (src/fixed_point.py)
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS nfe_item (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             nfe_id INTEGER NOT NULL,
-            cProd TEXT NOT NULL,
-            xProd TEXT NOT NULL,
+            produto_id INTEGER NOT NULL,
             CFOP TEXT NOT NULL,
-            qCom REAL NOT NULL,
-            vUnCom REAL NOT NULL,
-            vProd REAL NOT NULL,
-            FOREIGN KEY (nfe_id) REFERENCES nfe_header(id)
+            qCom INTEGER NOT NULL,
+            vUnCom INTEGER NOT NULL,
+            vProd INTEGER NOT NULL,
+            FOREIGN KEY (nfe_id) REFERENCES nfe_header(id),
+            FOREIGN KEY (produto_id) REFERENCES produto(id)
         )
     ''')
 
@@ -38,13 +62,168 @@ def setup_database(db_name="opme_control.db"):
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             nfe_item_id INTEGER NOT NULL,
             nLote TEXT,
-            qLote REAL,
-            dFab TEXT,
-            dVal TEXT,
+            qLote INTEGER,
+            dFab DATE,
+            dVal DATE,
             FOREIGN KEY (nfe_item_id) REFERENCES nfe_item(id)
         )
     ''')
 
+    # Razão de saldos em consignação por cliente, produto e lote
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS saldo_consignacao (
+            cliente_id INTEGER NOT NULL,
+            produto_id INTEGER NOT NULL,
+            nLote TEXT NOT NULL,
+            saldo INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (cliente_id, produto_id, nLote)
+        )
+    ''')
+
+    # Sinal de cada CFOP no saldo, usado na agregação em SQL
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS cfop_rule (
+            CFOP TEXT PRIMARY KEY,
+            sinal INTEGER NOT NULL,
+            descricao TEXT
+        )
+    ''')
+    cursor.executemany(
+        'INSERT OR IGNORE INTO cfop_rule (CFOP, sinal, descricao) VALUES (?, ?, ?)',
+        [(cfop, sinal, descricao) for cfop, (sinal, descricao) in CFOP_RULES.items()]
+    )
+
+    # Hash do conteúdo de cada XML recebido (cópias exatas não são parseadas de novo)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingested_document (
+            sha256 TEXT PRIMARY KEY,
+            chNFe TEXT,
+            criado_em TEXT NOT NULL
+        )
+    ''')
+
+    # Geração dos dados (linha única), usada para invalidar o cache de respostas
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_generation (
+            id INTEGER PRIMARY KEY,
+            generation INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('INSERT OR IGNORE INTO data_generation (id, generation) VALUES (1, 0)')
+
+    # Marca d'água da sincronização incremental com o Mainô
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            conta TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            watermark TEXT NOT NULL,
+            atualizado_em TEXT NOT NULL,
+            PRIMARY KEY (conta, endpoint)
+        )
+    ''')
+
+    # Fila de tarefas em segundo plano (src/jobs.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_job (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tipo TEXT NOT NULL,
+            status TEXT NOT NULL,
+            prioridade INTEGER NOT NULL DEFAULT 0,
+            parametros TEXT,
+            credenciais TEXT,
+            progresso INTEGER NOT NULL DEFAULT 0,
+            total INTEGER,
+            mensagem TEXT,
+            resultado TEXT,
+            erro TEXT,
+            cancelar INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            criado_em TEXT NOT NULL,
+            iniciado_em TEXT,
+            concluido_em TEXT,
+            heartbeat_em TEXT
+        )
+    ''')
+
+    # Saldos acumulados ao fim de cada período (src/checkpoints.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS saldo_checkpoint (
+            data_corte TEXT NOT NULL,
+            cliente_id INTEGER NOT NULL,
+            produto_id INTEGER NOT NULL,
+            nLote TEXT NOT NULL,
+            saldo INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (data_corte, cliente_id, produto_id, nLote)
+        )
+    ''')
+
+    # Filas FIFO de remessas em aberto por chave (src/fifo.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fifo_camada (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cliente_id INTEGER NOT NULL,
+            produto_id INTEGER NOT NULL,
+            nLote TEXT NOT NULL,
+            dEmi TEXT NOT NULL,
+            nfe_item_id INTEGER NOT NULL,
+            quantidade INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fifo_chave (
+            cliente_id INTEGER NOT NULL,
+            produto_id INTEGER NOT NULL,
+            nLote TEXT NOT NULL,
+            ultima_emissao TEXT NOT NULL,
+            PRIMARY KEY (cliente_id, produto_id, nLote)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fifo_idade (
+            cliente_id INTEGER NOT NULL,
+            dEmi TEXT NOT NULL,
+            quantidade INTEGER NOT NULL DEFAULT 0,
+            sem_remessa INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (cliente_id, dEmi)
+        )
+    ''')
+
+    # Clientes, produtos e lotes para a busca por trecho (src/search.py)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS search_entry (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chave TEXT NOT NULL,
+            tipo TEXT NOT NULL,
+            dimensao_id INTEGER NOT NULL,
+            termo TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_search_entry_chave ON search_entry (chave, tipo, dimensao_id)')
+    # Índice de trigramas (FTS5) sincronizado com search_entry por triggers
+    for ddl in SQLITE_FTS_DDL:
+        cursor.execute(ddl)
+
+    # Bancos criados antes da coluna chNFe
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(nfe_header)")]
+    if 'chNFe' not in columns:
+        cursor.execute('ALTER TABLE nfe_header ADD COLUMN chNFe TEXT')
+
+    # Índices das consultas quentes (os mesmos da migração 0002)
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_nfe_header_chNFe ON nfe_header (chNFe)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_cliente_CNPJ ON cliente (CNPJ)')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_produto_cProd ON produto (cProd)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_nfe_header_cliente_id_dEmi ON nfe_header (cliente_id, dEmi)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_nfe_header_nNF ON nfe_header (nNF)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_nfe_header_dEmi ON nfe_header (dEmi)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_nfe_item_nfe_id ON nfe_item (nfe_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_nfe_item_produto_id ON nfe_item (produto_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_lote_info_nfe_item_id ON lote_info (nfe_item_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_lote_info_dVal ON lote_info (dVal)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_ingested_document_chNFe ON ingested_document (chNFe)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_saldo_consignacao_aberto ON saldo_consignacao (cliente_id, produto_id, nLote) WHERE saldo <> 0')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_fifo_camada_chave ON fifo_camada (cliente_id, produto_id, nLote, dEmi, nfe_item_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS ix_ingest_job_status_prioridade ON ingest_job (status, prioridade, id)')
+
     conn.commit()
     conn.close()
 
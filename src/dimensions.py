@@ -0,0 +1,116 @@
+"""
+Tabelas de dimensão cliente e produto (chaves inteiras das NF-es).
+
+nfe_header guarda só emitente_id e cliente_id (cliente.id) e nfe_item só
+produto_id (produto.id): CNPJ, razão social, código e descrição ficam uma
+vez em cada dimensão, e os agrupamentos por cliente/produto comparam
+inteiros. O nome de cada CNPJ (e a descrição de cada código) é o mais
+recente recebido, como em saldo_consignacao.
+
+Na importação as chaves são resolvidas por DimensionCache, um cache LRU em
+memória por importação (NFeBatchIngestor): clientes e produtos se repetem
+em quase todas as notas, e só valores novos ou com nome alterado vão ao
+banco (um upsert e um SELECT por lote).
+"""
+from collections import OrderedDict
+
+from sqlalchemy import bindparam, text
+
+# Entradas mantidas em memória por dimensão
+DEFAULT_DIMENSION_CACHE_SIZE = 10000
+
+
+class DimensionCache:
+    """
+    Cache LRU chave natural -> (id, nome) de uma tabela de dimensão.
+
+    Ids resolvidos dentro de uma transação ficam pendentes até commit(): se
+    a transação (ou um savepoint) for desfeita, rollback() descarta essas
+    chaves também do cache, já que o banco pode reaproveitar os ids e o nome
+    gravado passa a ser incerto.
+    """
+    def __init__(self, tabela, coluna_chave, coluna_nome, capacidade=DEFAULT_DIMENSION_CACHE_SIZE):
+        self.tabela = tabela
+        self.capacidade = max(1, int(capacidade))
+        self.consultas = 0
+        self.acertos = 0
+        self._entradas = OrderedDict()
+        self._pendentes = {}
+        # Só regrava quando o nome mudou
+        self._upsert_sql = text(f"""
+            INSERT INTO {tabela} ("{coluna_chave}", "{coluna_nome}")
+            VALUES (:chave, :nome)
+            ON CONFLICT ("{coluna_chave}") DO UPDATE SET "{coluna_nome}" = excluded."{coluna_nome}"
+            WHERE {tabela}."{coluna_nome}" <> excluded."{coluna_nome}"
+        """)
+        # Público para src/query_plans.py conferir o plano da mesma consulta
+        self.ids_sql = text(
+            f'SELECT "{coluna_chave}", id FROM {tabela} WHERE "{coluna_chave}" IN :chaves'
+        ).bindparams(bindparam("chaves", expanding=True))
+
+    def _get(self, chave):
+        entrada = self._pendentes.get(chave)
+        if entrada is None:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                self._entradas.move_to_end(chave)
+        return entrada
+
+    def resolve(self, connection, valores):
+        """
+        Ids das chaves de `valores` ({chave: nome}), inserindo as novas.
+
+        Args:
+            connection: Connection do SQLAlchemy (a transação fica com o chamador)
+            valores (dict): chave natural -> nome mais recente
+
+        Returns:
+            dict: chave natural -> id
+        """
+        ids = {}
+        faltantes = {}
+        for chave, nome in valores.items():
+            self.consultas += 1
+            entrada = self._get(chave)
+            if entrada is not None and entrada[1] == nome:
+                self.acertos += 1
+                ids[chave] = entrada[0]
+            else:
+                faltantes[chave] = nome
+        if not faltantes:
+            return ids
+
+        connection.execute(self._upsert_sql, [{"chave": chave, "nome": nome} for chave, nome in faltantes.items()])
+        for chave, id_ in connection.execute(self.ids_sql, {"chaves": list(faltantes)}):
+            ids[chave] = id_
+            self._pendentes[chave] = (id_, faltantes[chave])
+        return ids
+
+    def commit(self):
+        """Transação confirmada: os ids pendentes entram no cache."""
+        for chave, entrada in self._pendentes.items():
+            self._entradas[chave] = entrada
+            self._entradas.move_to_end(chave)
+        self._pendentes.clear()
+        while len(self._entradas) > self.capacidade:
+            self._entradas.popitem(last=False)
+
+    def rollback(self):
+        """Transação ou savepoint desfeito: as chaves pendentes voltam a ser consultadas no banco."""
+        for chave in self._pendentes:
+            self._entradas.pop(chave, None)
+        self._pendentes.clear()
+
+    def clear(self):
+        self._entradas.clear()
+        self._pendentes.clear()
+
+
+def cliente_cache(capacidade=DEFAULT_DIMENSION_CACHE_SIZE):
+    """Cache de cliente (CNPJ -> id) para uma importação."""
+    return DimensionCache("cliente", "CNPJ", "xNome", capacidade)
+
+
+def produto_cache(capacidade=DEFAULT_DIMENSION_CACHE_SIZE):
+    """Cache de produto (cProd -> id) para uma importação."""
+    return DimensionCache("produto", "cProd", "xProd", capacidade)
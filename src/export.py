@@ -0,0 +1,148 @@
+"""
+Exportação de relatórios em streaming (CSV e XLSX).
+
+Os geradores recebem o cabeçalho e um iterável de linhas (tuplas, vindas
+direto do cursor do banco) e devolvem blocos de bytes, sem materializar o
+conjunto de dados. O XLSX é escrito com zipfile (uma planilha, strings
+inline), já que o projeto não depende de openpyxl.
+"""
+import csv
+import io
+import zipfile
+import zlib
+from xml.sax.saxutils import escape, quoteattr
+
+# Linhas acumuladas antes de entregar um bloco à resposta
+EXPORT_FLUSH_ROWS = 500
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name={nome} sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_END = '</sheetData></worksheet>'
+
+
+def csv_stream(header, rows):
+    """CSV em UTF-8 com BOM (para o Excel reconhecer os acentos)."""
+    buffer = io.StringIO()
+    buffer.write('\ufeff')
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for contador, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if contador % EXPORT_FLUSH_ROWS == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class _ZipSink:
+    """Destino sem seek para o zipfile: guarda o que foi escrito até ser drenado."""
+    def __init__(self):
+        self._partes = []
+        self._posicao = 0
+
+    def write(self, data):
+        self._partes.append(bytes(data))
+        self._posicao += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._posicao
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._partes)
+        self._partes = []
+        return data
+
+
+def _xlsx_cell(valor):
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return f'<c><v>{valor!r}</v></c>'
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(str(valor))}</t></is></c>'
+
+
+def _xlsx_row(row):
+    return '<row>' + ''.join(_xlsx_cell(valor) for valor in row) + '</row>'
+
+
+def xlsx_stream(header, rows, sheet_name="Planilha1"):
+    """
+    Planilha XLSX gerada incrementalmente.
+
+    O ZIP é escrito em um destino sem seek (o zipfile usa data descriptors),
+    e os bytes já comprimidos saem a cada EXPORT_FLUSH_ROWS linhas.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        zip_file.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        zip_file.writestr('_rels/.rels', _ROOT_RELS)
+        zip_file.writestr('xl/workbook.xml', _WORKBOOK.format(nome=quoteattr(sheet_name[:31])))
+        zip_file.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        yield sink.drain()
+
+        with zip_file.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((_SHEET_START + _xlsx_row(header)).encode('utf-8'))
+            linhas = []
+            for row in rows:
+                linhas.append(_xlsx_row(row))
+                if len(linhas) >= EXPORT_FLUSH_ROWS:
+                    sheet.write(''.join(linhas).encode('utf-8'))
+                    linhas = []
+                    data = sink.drain()
+                    if data:
+                        yield data
+            sheet.write((''.join(linhas) + _SHEET_END).encode('utf-8'))
+    yield sink.drain()
+
+
+def gzip_stream(chunks, level=6):
+    """Comprime um fluxo de bytes em gzip (Content-Encoding: gzip) bloco a bloco."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
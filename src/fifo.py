@@ -0,0 +1,450 @@
+"""
+Idade do material em consignação: casamento FIFO das remessas (5917/6917)
+com os retornos (1918/2918) e retornos simbólicos (1919/2919).
+
+Cada chave (cliente_id, produto_id, nLote) tem uma fila em fifo_camada com as
+remessas ainda em aberto, da mais antiga para a mais recente (dEmi, id do
+item). Um retorno consome a fila pela frente; um retorno sem remessa em
+aberto vira uma camada negativa (crédito), consumida pela próxima remessa.
+A soma da fila é a quantidade em poder do cliente, ou seja, o saldo do
+razão com o sinal trocado. fifo_idade guarda as mesmas quantidades somadas
+por cliente e dia de emissão, para o resumo do relatório de idade.
+
+As filas são mantidas na mesma transação da importação
+(insert_nfe_records), lendo e gravando só as chaves das notas novas. Uma
+nota com data anterior à última já casada na chave
+(fifo_chave.ultima_emissao) refaz a fila daquela chave a partir das
+movimentações gravadas. rebuild_ledger (python -m src.rebuild_saldo)
+recria todas as filas.
+"""
+from collections import deque
+from datetime import date, timedelta
+
+from sqlalchemy import bindparam, text
+
+from src.opme_logic import CLIENTE_ID_SQL, SEM_LOTE, item_quantity
+
+# Faixas do relatório de idade: (rótulo, idade máxima em dias; None = sem limite)
+AGING_BUCKETS = (("0-30", 30), ("31-60", 60), ("61-90", 90), ("90+", None))
+
+# Movimentações com efeito no saldo na ordem do casamento, com a quantidade
+# já no sentido do cliente (remessa > 0, retorno < 0); quem usa acrescenta
+# WHERE/ORDER BY (colunas nh., ni. e li.)
+FIFO_MOVEMENTS_SQL = """
+    SELECT
+        nh.cliente_id,
+        ni.produto_id,
+        COALESCE(NULLIF(li."nLote", ''), 'SEM_LOTE') AS "nLote",
+        nh."dEmi",
+        ni.id,
+        -CASE
+            WHEN li."qLote" IS NOT NULL AND li."qLote" <> 0 THEN li."qLote"
+            ELSE ni."qCom"
+        END * cr.sinal AS quantidade
+    FROM
+        nfe_header nh
+    JOIN
+        nfe_item ni ON nh.id = ni.nfe_id
+    LEFT JOIN
+        lote_info li ON ni.id = li.nfe_item_id
+    JOIN
+        cfop_rule cr ON cr."CFOP" = ni."CFOP" AND cr.sinal <> 0
+"""
+
+INSERT_CAMADA_SQL = """
+    INSERT INTO fifo_camada (cliente_id, produto_id, "nLote", "dEmi", nfe_item_id, quantidade)
+    VALUES (:cliente_id, :produto_id, :nLote, :dEmi, :nfe_item_id, :quantidade)
+"""
+UPDATE_CAMADA_SQL = "UPDATE fifo_camada SET quantidade = :quantidade WHERE id = :id"
+DELETE_CAMADA_SQL = "DELETE FROM fifo_camada WHERE id = :id"
+
+UPSERT_CHAVE_SQL = """
+    INSERT INTO fifo_chave (cliente_id, produto_id, "nLote", ultima_emissao)
+    VALUES (:cliente_id, :produto_id, :nLote, :ultima_emissao)
+    ON CONFLICT (cliente_id, produto_id, "nLote") DO UPDATE SET
+        ultima_emissao = excluded.ultima_emissao
+"""
+
+# Totais em aberto por cliente e dia de emissão, somados às variações das filas
+UPSERT_IDADE_SQL = """
+    INSERT INTO fifo_idade (cliente_id, "dEmi", quantidade, sem_remessa)
+    VALUES (:cliente_id, :dEmi, :quantidade, :sem_remessa)
+    ON CONFLICT (cliente_id, "dEmi") DO UPDATE SET
+        quantidade = fifo_idade.quantidade + excluded.quantidade,
+        sem_remessa = fifo_idade.sem_remessa + excluded.sem_remessa
+"""
+DELETE_IDADE_ZERADA_SQL = """
+    DELETE FROM fifo_idade
+    WHERE cliente_id = :cliente_id AND "dEmi" = :dEmi AND quantidade = 0 AND sem_remessa = 0
+"""
+REBUILD_IDADE_SQL = """
+    INSERT INTO fifo_idade (cliente_id, "dEmi", quantidade, sem_remessa)
+    SELECT
+        cliente_id, "dEmi",
+        SUM(CASE WHEN quantidade > 0 THEN quantidade ELSE 0 END),
+        SUM(CASE WHEN quantidade < 0 THEN -quantidade ELSE 0 END)
+    FROM fifo_camada
+    GROUP BY cliente_id, "dEmi"
+"""
+# Chaves do lote em importação, por conexão (SQLite e PostgreSQL)
+CREATE_CHAVES_LOTE_SQL = """
+    CREATE TEMPORARY TABLE IF NOT EXISTS fifo_lote_chave (
+        cliente_id INTEGER, produto_id INTEGER, "nLote" VARCHAR(20)
+    )
+"""
+INSERT_CHAVES_LOTE_SQL = "INSERT INTO fifo_lote_chave VALUES (:cliente_id, :produto_id, :nLote)"
+_JOIN_CHAVE = (
+    '{t}.cliente_id = fifo_lote_chave.cliente_id AND {t}.produto_id = fifo_lote_chave.produto_id'
+    ' AND {t}."nLote" = fifo_lote_chave."nLote"'
+)
+# Última emissão casada e camadas em aberto das chaves do lote (fifo_lote_chave).
+# Sem ORDER BY no SQL: ordenar pelo índice faria o planejador varrer
+# fifo_camada inteira em vez de partir das chaves do lote
+ULTIMAS_EMISSOES_SQL = f"""
+    SELECT fk.cliente_id, fk.produto_id, fk."nLote", fk.ultima_emissao
+    FROM fifo_lote_chave
+    JOIN fifo_chave fk ON {_JOIN_CHAVE.format(t="fk")}
+"""
+CAMADAS_SQL = f"""
+    SELECT fc.cliente_id, fc.produto_id, fc."nLote", fc."dEmi", fc.nfe_item_id, fc.id, fc.quantidade
+    FROM fifo_lote_chave
+    JOIN fifo_camada fc ON {_JOIN_CHAVE.format(t="fc")}
+"""
+# Movimentações gravadas dos clientes das chaves, na ordem do casamento
+KEY_MOVEMENTS_QUERY = text(FIFO_MOVEMENTS_SQL + """
+    WHERE nh.cliente_id IN :clientes
+    ORDER BY nh."dEmi", ni.id
+""").bindparams(bindparam("clientes", expanding=True))
+
+
+def _as_date(valor):
+    # Por text() o SQLite devolve datas como texto
+    return date.fromisoformat(valor) if isinstance(valor, str) else valor
+
+
+def record_movements(records, item_ids, sinais, cliente_ids, produto_ids):
+    """
+    Movimentações das NF-es recém-gravadas, no formato do casamento.
+
+    Args:
+        records (list): NFeRecord, na ordem do insert
+        item_ids (list): IDs de nfe_item na mesma ordem dos produtos de records
+        sinais (dict): CFOP -> sinal de cfop_rule (opme_logic.load_cfop_signs)
+        cliente_ids (dict): CNPJ -> cliente.id
+        produto_ids (dict): cProd -> produto.id
+
+    Yields:
+        tuple: (chave, dEmi, nfe_item_id, quantidade), remessa > 0 e retorno < 0
+    """
+    ids = iter(item_ids)
+    for record in records:
+        dEmi = date.fromisoformat(record.dEmi)
+        cliente_id = cliente_ids[record.CNPJ_dest]
+        for product in record.products:
+            nfe_item_id = next(ids)
+            quantidade = -sinais.get(product.CFOP, 0) * item_quantity(product)
+            if quantidade:
+                chave = (cliente_id, produto_ids[product.cProd], product.lote_info.nLote or SEM_LOTE)
+                yield chave, dEmi, nfe_item_id, quantidade
+
+
+def match(fila, dEmi, nfe_item_id, quantidade):
+    """
+    Aplica uma movimentação à fila da chave (deque de [id, dEmi, nfe_item_id, quantidade]).
+
+    A movimentação consome pela frente as camadas de sinal oposto (remessas,
+    para um retorno; créditos, para uma remessa); o que sobra vira uma
+    camada nova no fim da fila.
+    """
+    sinal = 1 if quantidade > 0 else -1
+    restante = abs(quantidade)
+    while restante and fila and fila[0][3] * sinal < 0:
+        camada = fila[0]
+        consumido = min(restante, abs(camada[3]))
+        camada[3] += consumido * sinal
+        restante -= consumido
+        if not camada[3]:
+            fila.popleft()
+    if restante:
+        fila.append([None, dEmi, nfe_item_id, restante * sinal])
+
+
+def _load(connection, chaves):
+    """
+    Última emissão casada e fila em aberto de cada chave.
+
+    As chaves do lote vão para uma tabela temporária e as duas tabelas são
+    lidas por join com ela: duas consultas, cada uma com uma busca no índice
+    por chave, em vez de uma consulta por chave.
+    """
+    connection.execute(text(CREATE_CHAVES_LOTE_SQL))
+    connection.execute(text(INSERT_CHAVES_LOTE_SQL), [
+        {"cliente_id": cliente_id, "produto_id": produto_id, "nLote": nLote}
+        for cliente_id, produto_id, nLote in chaves
+    ])
+
+    ultimas = {
+        (cliente_id, produto_id, nLote): _as_date(ultima)
+        for cliente_id, produto_id, nLote, ultima in connection.execute(text(ULTIMAS_EMISSOES_SQL))
+    }
+    camadas = sorted(connection.execute(text(CAMADAS_SQL)))
+    connection.execute(text("DELETE FROM fifo_lote_chave"))
+
+    filas = {chave: deque() for chave in chaves}
+    for cliente_id, produto_id, nLote, dEmi, nfe_item_id, camada_id, quantidade in camadas:
+        filas[(cliente_id, produto_id, nLote)].append([camada_id, _as_date(dEmi), nfe_item_id, quantidade])
+    return ultimas, filas
+
+
+def _key_movements(connection, chaves):
+    """
+    Todas as movimentações gravadas das chaves, na ordem do casamento.
+
+    Uma leitura por cliente (índice cliente_id, dEmi), não por chave: as
+    chaves retroativas de um lote costumam se concentrar em poucos clientes.
+    """
+    movimentos = {chave: [] for chave in chaves}
+    rows = connection.execute(KEY_MOVEMENTS_QUERY, {"clientes": sorted({chave[0] for chave in chaves})})
+    for cliente_id, produto_id, nLote, dEmi, nfe_item_id, quantidade in rows:
+        lista = movimentos.get((cliente_id, produto_id, nLote))
+        if lista is not None:
+            lista.append((_as_date(dEmi), nfe_item_id, quantidade))
+    return movimentos
+
+
+def _camada_row(chave, camada):
+    _, dEmi, nfe_item_id, quantidade = camada
+    return {
+        "cliente_id": chave[0],
+        "produto_id": chave[1],
+        "nLote": chave[2],
+        "dEmi": dEmi.isoformat(),
+        "nfe_item_id": nfe_item_id,
+        "quantidade": quantidade
+    }
+
+
+def _somar_idade(idade, cliente_id, dEmi, quantidade, fator):
+    """Acumula em idade[(cliente_id, dEmi)] = [remessas, sem_remessa] a variação de uma camada."""
+    totais = idade.setdefault((cliente_id, dEmi), [0, 0])
+    if quantidade > 0:
+        totais[0] += quantidade * fator
+    else:
+        totais[1] -= quantidade * fator
+
+
+def _gravar_idade(connection, idade):
+    rows = [{
+        "cliente_id": cliente_id, "dEmi": dEmi.isoformat(),
+        "quantidade": remessas, "sem_remessa": sem_remessa
+    } for (cliente_id, dEmi), (remessas, sem_remessa) in idade.items() if remessas or sem_remessa]
+    if not rows:
+        return
+    connection.execute(text(UPSERT_IDADE_SQL), rows)
+    # Dias que ficaram sem material em aberto saem da tabela
+    zerados = [row for row in rows if row["quantidade"] < 0 or row["sem_remessa"] < 0]
+    if zerados:
+        connection.execute(text(DELETE_IDADE_ZERADA_SQL), zerados)
+
+
+def update_fifo(connection, movements, primeira_nfe_id):
+    """
+    Casa as movimentações das NF-es recém-gravadas (mesma transação do insert).
+
+    Args:
+        connection: Conexão SQLAlchemy (a transação fica com o chamador)
+        movements (iterable): Saída de record_movements
+        primeira_nfe_id (int): Menor id de nfe_header do lote gravado; em um
+            banco com notas anteriores e filas ainda vazias (antes da migração
+            0010), as filas são criadas de uma vez com rebuild_fifo
+    """
+    por_chave = {}
+    for chave, dEmi, nfe_item_id, quantidade in movements:
+        por_chave.setdefault(chave, []).append((dEmi, nfe_item_id, quantidade))
+    if not por_chave:
+        return
+
+    if connection.execute(text("SELECT 1 FROM fifo_chave LIMIT 1")).first() is None and connection.execute(
+        text("SELECT 1 FROM nfe_header WHERE id < :id LIMIT 1"), {"id": primeira_nfe_id}
+    ).first() is not None:
+        rebuild_fifo(connection)
+        return
+
+    chaves = list(por_chave)
+    ultimas, filas = _load(connection, chaves)
+    for novas in por_chave.values():
+        novas.sort()
+
+    # Notas retroativas: a fila da chave é refeita desde a primeira movimentação
+    retroativas = {
+        chave for chave in chaves
+        if chave in ultimas and por_chave[chave][0][0] < ultimas[chave]
+    }
+    if retroativas:
+        por_chave.update(_key_movements(connection, retroativas))
+
+    inserts, updates, deletes, estados = [], [], [], []
+    idade = {}
+    for chave in chaves:
+        novas = por_chave[chave]
+        fila = filas[chave]
+        ultima = ultimas.get(chave)
+        anteriores = {}
+        for camada_id, dEmi, _, quantidade in fila:
+            anteriores[camada_id] = quantidade
+            _somar_idade(idade, chave[0], dEmi, quantidade, -1)
+
+        if chave in retroativas:
+            fila.clear()
+        for dEmi, nfe_item_id, quantidade in novas:
+            match(fila, dEmi, nfe_item_id, quantidade)
+
+        restantes = set()
+        for camada in fila:
+            _somar_idade(idade, chave[0], camada[1], camada[3], 1)
+            if camada[0] is None:
+                inserts.append(_camada_row(chave, camada))
+            else:
+                restantes.add(camada[0])
+                if camada[3] != anteriores[camada[0]]:
+                    updates.append({"id": camada[0], "quantidade": camada[3]})
+        deletes.extend({"id": camada_id} for camada_id in anteriores if camada_id not in restantes)
+
+        maior = max(ultima, novas[-1][0]) if ultima else novas[-1][0]
+        estados.append({
+            "cliente_id": chave[0], "produto_id": chave[1], "nLote": chave[2],
+            "ultima_emissao": maior.isoformat()
+        })
+
+    if deletes:
+        connection.execute(text(DELETE_CAMADA_SQL), deletes)
+    if updates:
+        connection.execute(text(UPDATE_CAMADA_SQL), updates)
+    if inserts:
+        connection.execute(text(INSERT_CAMADA_SQL), inserts)
+    connection.execute(text(UPSERT_CHAVE_SQL), estados)
+    _gravar_idade(connection, idade)
+
+
+def rebuild_fifo(connection):
+    """Apaga e recria todas as filas a partir das NF-es gravadas (regras de cfop_rule)."""
+    connection.execute(text("DELETE FROM fifo_camada"))
+    connection.execute(text("DELETE FROM fifo_chave"))
+    connection.execute(text("DELETE FROM fifo_idade"))
+
+    camadas = []
+    estados = []
+    atual = None
+    fila = deque()
+    ultima = None
+    # A fila da chave anterior é fechada quando a chave muda (e no fim)
+    rows = connection.execute(text(FIFO_MOVEMENTS_SQL + " ORDER BY 1, 2, 3, 4, 5"))
+    for cliente_id, produto_id, nLote, dEmi, nfe_item_id, quantidade in rows:
+        chave = (cliente_id, produto_id, nLote)
+        if chave != atual:
+            if atual is not None:
+                camadas.extend(_camada_row(atual, camada) for camada in fila)
+                estados.append({"cliente_id": atual[0], "produto_id": atual[1], "nLote": atual[2],
+                                "ultima_emissao": ultima.isoformat()})
+            atual, fila = chave, deque()
+        ultima = _as_date(dEmi)
+        if quantidade:
+            match(fila, ultima, nfe_item_id, quantidade)
+    if atual is not None:
+        camadas.extend(_camada_row(atual, camada) for camada in fila)
+        estados.append({"cliente_id": atual[0], "produto_id": atual[1], "nLote": atual[2],
+                        "ultima_emissao": ultima.isoformat()})
+
+    if camadas:
+        connection.execute(text(INSERT_CAMADA_SQL), camadas)
+    if estados:
+        connection.execute(text(UPSERT_CHAVE_SQL), estados)
+    connection.execute(text(REBUILD_IDADE_SQL))
+    return len(camadas)
+
+
+def _faixas(hoje, data, quantidade):
+    """Uma expressão SUM por faixa de AGING_BUCKETS, com os limites de data em params."""
+    params = {}
+    colunas = []
+    for i, (_, dias) in enumerate(AGING_BUCKETS):
+        condicoes = []
+        if dias is not None:
+            condicoes.append(f"{data} >= :limite{i}")
+            params[f"limite{i}"] = (hoje - timedelta(days=dias)).isoformat()
+        if i:
+            condicoes.append(f"{data} < :limite{i - 1}")
+        colunas.append(f"SUM(CASE WHEN {' AND '.join(condicoes)} THEN {quantidade} ELSE 0 END) AS faixa{i}")
+    return colunas, params
+
+
+def aging_query(hoje=None, cnpj_cliente=None, detalhe=False):
+    """
+    Monta o SQL do relatório de idade do material em poder dos clientes.
+
+    Cada remessa ainda não devolvida entra na faixa de AGING_BUCKETS da sua
+    idade (hoje - dEmi). O resumo por cliente lê fifo_idade, com uma linha
+    por cliente e dia de emissão em aberto, e não depende da quantidade de
+    remessas; o detalhe por produto e lote lê as filas (fifo_camada).
+
+    Args:
+        hoje (date, optional): Data de referência (padrão: hoje)
+        cnpj_cliente (str, optional): CNPJ do destinatário
+        detalhe (bool): Uma linha por (cliente, produto, lote) em vez de por cliente
+
+    Returns:
+        tuple: (sql, params); as linhas são (CNPJ_dest, xNome_dest, [cProd,
+            xProd, nLote,] uma quantidade por faixa, sem_remessa,
+            remessa_mais_antiga), ordenadas por cliente
+    """
+    hoje = hoje or date.today()
+    where = ""
+    if cnpj_cliente:
+        where = f"WHERE cliente_id = {CLIENTE_ID_SQL}"
+    # Agregação pelas chaves inteiras; CNPJ, código e nomes vêm das dimensões
+    if detalhe:
+        faixas, params = _faixas(hoje, '"dEmi"', "CASE WHEN quantidade > 0 THEN quantidade ELSE 0 END")
+        query = f"""
+            SELECT
+                c."CNPJ", c."xNome", p."cProd", p."xProd", idade."nLote",
+                {", ".join(f"idade.faixa{i}" for i in range(len(AGING_BUCKETS)))},
+                idade.sem_remessa,
+                idade.mais_antiga
+            FROM (
+                SELECT
+                    cliente_id, produto_id, "nLote",
+                    {", ".join(faixas)},
+                    SUM(CASE WHEN quantidade < 0 THEN -quantidade ELSE 0 END) AS sem_remessa,
+                    MIN(CASE WHEN quantidade > 0 THEN "dEmi" END) AS mais_antiga
+                FROM fifo_camada
+                {where}
+                GROUP BY cliente_id, produto_id, "nLote"
+            ) idade
+            JOIN cliente c ON c.id = idade.cliente_id
+            JOIN produto p ON p.id = idade.produto_id
+            ORDER BY c."CNPJ", p."cProd", idade."nLote"
+        """
+    else:
+        faixas, params = _faixas(hoje, '"dEmi"', "quantidade")
+        query = f"""
+            SELECT
+                c."CNPJ", c."xNome",
+                {", ".join(f"idade.faixa{i}" for i in range(len(AGING_BUCKETS)))},
+                idade.sem_remessa,
+                idade.mais_antiga
+            FROM (
+                SELECT
+                    cliente_id,
+                    {", ".join(faixas)},
+                    SUM(sem_remessa) AS sem_remessa,
+                    MIN(CASE WHEN quantidade > 0 THEN "dEmi" END) AS mais_antiga
+                FROM fifo_idade
+                {where}
+                GROUP BY cliente_id
+            ) idade
+            JOIN cliente c ON c.id = idade.cliente_id
+            ORDER BY c."CNPJ"
+        """
+    if cnpj_cliente:
+        params["cnpj"] = cnpj_cliente
+    return query, params
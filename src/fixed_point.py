@@ -0,0 +1,51 @@
+"""
+Quantidades e valores das NF-es em inteiros escalados (ponto fixo).
+
+Todas as quantidades (nfe_item.qCom, lote_info.qLote e os saldos derivados
+em saldo_consignacao, saldo_checkpoint, fifo_camada e fifo_idade) são
+gravadas em décimos de milésimo da unidade; vProd em centavos e vUnCom com
+as 10 casas do leiaute. Somas e comparações com zero ficam exatas, tanto no
+SQL (SUM de inteiros) quanto em Python.
+
+A conversão acontece só aqui: to_scaled no parser (texto do XML direto para
+inteiro, sem passar por float) e from_scaled na serialização das respostas
+e exportações.
+"""
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Casas decimais de cada grandeza (as máximas do leiaute da NF-e 4.00)
+QUANTIDADE_CASAS = 4
+VALOR_CASAS = 2
+VALOR_UNITARIO_CASAS = 10
+
+_UM = Decimal(1)
+
+
+def to_scaled(texto, casas):
+    """
+    Converte o texto decimal do XML ("12.3456") em inteiro na escala 10**-casas.
+
+    Casas além da escala são arredondadas (meio para cima); texto vazio ou
+    ausente vale 0.
+
+    Raises:
+        ValueError: texto que não é um número
+    """
+    if not texto:
+        return 0
+    # Caminho comum ("2.0000", "300.00"): só dígitos, sem passar por Decimal
+    inteiro, _, fracao = texto.partition(".")
+    if len(fracao) <= casas and inteiro.isdecimal() and (fracao.isdecimal() or not fracao):
+        return int(inteiro + fracao.ljust(casas, "0"))
+    try:
+        return int(Decimal(texto).scaleb(casas).quantize(_UM, rounding=ROUND_HALF_UP))
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"Número inválido: {texto!r}")
+
+
+def from_scaled(valor, casas=QUANTIDADE_CASAS):
+    """Inteiro escalado -> float para JSON/CSV (None continua None)."""
+    if valor is None:
+        return None
+    # int(): no PostgreSQL o SUM de BIGINT chega como Decimal
+    return int(valor) / 10 ** casas
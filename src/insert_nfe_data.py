@@ -1,60 +1,470 @@
-import sqlite3
-from src.parse_nfe_xml import parse_nfe_xml
-
-def insert_nfe_data(xml_content, db_name="opme_control.db", is_file=True):
-    if is_file:
-        nfe_data = parse_nfe_xml(xml_content)
-    else:
-        # Se não for um arquivo, assume que xml_content é o próprio conteúdo XML
-        nfe_data = parse_nfe_xml(xml_content, is_file=False)
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-
-    # Inserir cabeçalho da NF-e
-    cursor.execute("""
-        INSERT INTO nfe_header (nNF, dEmi, CNPJ_emit, xNome_emit, CNPJ_dest, xNome_dest)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (
-        nfe_data["nNF"],
-        nfe_data["dEmi"],
-        nfe_data["CNPJ_emit"],
-        nfe_data["xNome_emit"],
-        nfe_data["CNPJ_dest"],
-        nfe_data["xNome_dest"]
-    ))
-    nfe_id = cursor.lastrowid
-
-    # Inserir itens da NF-e e informações de lote
-    for product in nfe_data["products"]:
-        cursor.execute("""
-            INSERT INTO nfe_item (nfe_id, cProd, xProd, CFOP, qCom, vUnCom, vProd)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            nfe_id,
-            product["cProd"],
-            product["xProd"],
-            product["CFOP"],
-            product["qCom"],
-            product["vUnCom"],
-            product["vProd"]
-        ))
-        nfe_item_id = cursor.lastrowid
-
-        lote_info = product["lote_info"]
-        if lote_info["nLote"]:
-            cursor.execute("""
-                INSERT INTO lote_info (nfe_item_id, nLote, qLote, dFab, dVal)
-                VALUES (?, ?, ?, ?, ?)
-            """, (
-                nfe_item_id,
-                lote_info["nLote"],
-                lote_info["qLote"],
-                lote_info["dFab"],
-                lote_info["dVal"]
-            ))
-
-    conn.commit()
-    conn.close()
+import hashlib
+import logging
+import threading
+import time
+from datetime import date, datetime
+
+from sqlalchemy import insert, select, text, or_
+from sqlalchemy.exc import SQLAlchemyError
+
+from src.connections import connect
+from src.metrics import INGEST_STAGE_SECONDS, INGEST_DOCUMENTS, INGEST_ROWS
+from src.models.nfe import Cliente, NFeHeader, NFeItem, LoteInfo, IngestedDocument
+from src.checkpoints import update_checkpoints
+from src.dimensions import cliente_cache, produto_cache
+from src.fifo import record_movements, update_fifo
+from src.opme_logic import (
+    BUMP_GENERATION_SQL, ledger_deltas, load_cfop_signs, merge_ledger_deltas, update_ledger
+)
+from src.parse_nfe_xml import parse_nfe_record
+from src.search import update_search_index
+
+# Quantidade padrão de NF-es gravadas por transação
+DEFAULT_BATCH_SIZE = 500
+
+STATUS_IMPORTADO = "importado"
+STATUS_DUPLICADO = "duplicado"
+STATUS_ERRO = "erro"
+
+class DocumentCacheStats:
+    """
+    Contadores do cache de documentos por hash (por processo).
+
+    Cada consulta ao cache acontece antes do parsing; um acerto é um XML que
+    deixou de ser parseado e gravado.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.consultas = 0
+            self.acertos = 0
+            self.bytes_evitados = 0
+
+    def registrar(self, acerto, tamanho=0):
+        with self._lock:
+            self.consultas += 1
+            if acerto:
+                self.acertos += 1
+                self.bytes_evitados += tamanho
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "consultas": self.consultas,
+                "acertos": self.acertos,
+                "falhas": self.consultas - self.acertos,
+                "taxa_acerto": self.acertos / self.consultas if self.consultas else 0.0,
+                "bytes_evitados": self.bytes_evitados
+            }
+
+DOCUMENT_CACHE_STATS = DocumentCacheStats()
+
+def document_hash(conteudo):
+    """SHA-256 (hex) dos bytes brutos do XML; texto é considerado em UTF-8."""
+    if isinstance(conteudo, str):
+        conteudo = conteudo.encode("utf-8")
+    return hashlib.sha256(conteudo).hexdigest()
+
+def _read_source(xml_source, is_file):
+    """Lê caminho, file-like, bytes ou str para a memória (XMLs de NF-e são pequenos)."""
+    if not is_file:
+        return xml_source
+    if isinstance(xml_source, str):
+        with open(xml_source, "rb") as xml_file:
+            return xml_file.read()
+    return xml_source.read()
+
+def insert_nfe_data(xml_content, db_name=None, is_file=True):
+    """
+    Importa uma NF-e pelo engine do app (ou no banco SQLite avulso db_name).
+
+    Usa o mesmo caminho das importações em lote (NFeBatchIngestor com lote
+    de uma nota): cache por hash, duplicidade por chave e razão de saldos.
+
+    Returns:
+        bool: False se o XML (mesmo hash) ou a chave de acesso já existiam
+
+    Raises:
+        ValueError: XML inválido ou falha ao gravar a NF-e
+    """
+    with connect(db_name) as connection:
+        ingestor = NFeBatchIngestor(connection, batch_size=1)
+        result = ingestor.add("nfe", xml_content, is_file=is_file)
+        ingestor.close()
+
+    if result["status"] == STATUS_ERRO:
+        raise ValueError(result["erro"])
+    return result["status"] == STATUS_IMPORTADO
+
+def _header_row(record):
+    if not record.nNF:
+        raise ValueError("NF-e sem número (nNF)")
+    return {
+        "chNFe": record.chNFe or None,
+        "nNF": record.nNF,
+        "dEmi": datetime.strptime(record.dEmi, '%Y-%m-%d').date()
+    }
+
+def _lote_date(valor):
+    """Data do rastro (dFab/dVal, AAAA-MM-DD) ou None; uma data inválida não recusa a nota."""
+    try:
+        return date.fromisoformat(valor[:10]) if valor else None
+    except ValueError:
+        return None
+
+def insert_nfe_records(connection, records, clientes=None, produtos=None, sinais=None):
+    """
+    Insere NF-es já parseadas (NFeRecord) com um executemany por tabela.
+
+    Args:
+        connection: Connection do SQLAlchemy (a transação fica com o chamador)
+        records (list): Registros devolvidos por parse_nfe_record
+        clientes (DimensionCache, optional): Cache de cliente da importação
+        produtos (DimensionCache, optional): Cache de produto da importação
+        sinais (dict, optional): Sinais de cfop_rule já carregados pela
+            importação; sem eles, são lidos da tabela nesta chamada
+
+    Returns:
+        list: IDs gerados em nfe_header, na mesma ordem de records
+    """
+    header_table = NFeHeader.__table__
+    item_table = NFeItem.__table__
+    lote_table = LoteInfo.__table__
+    clientes = clientes if clientes is not None else cliente_cache()
+    produtos = produtos if produtos is not None else produto_cache()
+    if sinais is None:
+        sinais = load_cfop_signs(connection)
+
+    # Chaves inteiras das dimensões; a última nota do lote define o nome
+    participantes = {}
+    descricoes = {}
+    for record in records:
+        participantes[record.CNPJ_emit] = record.xNome_emit
+        participantes[record.CNPJ_dest] = record.xNome_dest
+        for product in record.products:
+            descricoes[product.cProd] = product.xProd
+    cliente_ids = clientes.resolve(connection, participantes)
+    produto_ids = produtos.resolve(connection, descricoes)
+
+    header_rows = []
+    for record in records:
+        row = _header_row(record)
+        row["emitente_id"] = cliente_ids[record.CNPJ_emit]
+        row["cliente_id"] = cliente_ids[record.CNPJ_dest]
+        header_rows.append(row)
+    header_ids = connection.execute(
+        insert(header_table).returning(header_table.c.id, sort_by_parameter_order=True),
+        header_rows
+    ).scalars().all()
+    connection.execute(text(BUMP_GENERATION_SQL))
+
+    item_rows = []
+    lotes = []
+    for nfe_id, record in zip(header_ids, records):
+        for product in record.products:
+            item_rows.append({
+                "nfe_id": nfe_id,
+                "produto_id": produto_ids[product.cProd],
+                "CFOP": product.CFOP,
+                "qCom": product.qCom,
+                "vUnCom": product.vUnCom,
+                "vProd": product.vProd
+            })
+            lotes.append(product.lote_info)
+    if not item_rows:
+        return header_ids
+
+    item_ids = connection.execute(
+        insert(item_table).returning(item_table.c.id, sort_by_parameter_order=True),
+        item_rows
+    ).scalars().all()
+
+    lote_rows = [{
+        "nfe_item_id": nfe_item_id,
+        "nLote": lote.nLote,
+        "qLote": lote.qLote,
+        "dFab": _lote_date(lote.dFab),
+        "dVal": _lote_date(lote.dVal)
+    } for nfe_item_id, lote in zip(item_ids, lotes) if lote.nLote]
+    if lote_rows:
+        connection.execute(insert(lote_table), lote_rows)
+
+    # Atualiza o razão de saldos na mesma transação
+    deltas = {}
+    for record in records:
+        merge_ledger_deltas(deltas, ledger_deltas(record, sinais, cliente_ids, produto_ids))
+    update_ledger(connection, deltas, header_ids[0])
+    # Checkpoints de saldo: notas retroativas e períodos encerrados
+    update_checkpoints(connection, records, sinais, cliente_ids, produto_ids)
+    # Filas FIFO de remessas em aberto (idade do material em consignação)
+    update_fifo(connection, record_movements(records, item_ids, sinais, cliente_ids, produto_ids), header_ids[0])
+    # Clientes, produtos e lotes para a busca por trecho
+    update_search_index(connection, records, header_ids[0], cliente_ids, produto_ids)
+
+    return header_ids
+
+def document_query(sha256):
+    """
+    Consulta do cache de documentos (ingested_document) pelo hash do XML.
+
+    Returns:
+        Select: linha (chNFe, nNF da nota gravada) se o XML já foi recebido
+    """
+    document_table = IngestedDocument.__table__
+    header_table = NFeHeader.__table__
+    return select(document_table.c.chNFe, header_table.c.nNF).outerjoin(
+        header_table, header_table.c.chNFe == document_table.c.chNFe
+    ).where(document_table.c.sha256 == sha256)
+
+def duplicates_query(chaves, numeros):
+    """
+    Notas já gravadas com alguma das chaves de acesso ou dos números do lote.
+
+    Returns:
+        Select: linhas (chNFe, CNPJ do emitente, nNF)
+    """
+    header_table = NFeHeader.__table__
+    cliente_table = Cliente.__table__
+    return select(header_table.c.chNFe, cliente_table.c.CNPJ, header_table.c.nNF).join(
+        cliente_table, cliente_table.c.id == header_table.c.emitente_id
+    ).where(
+        or_(header_table.c.chNFe.in_(chaves), header_table.c.nNF.in_(numeros))
+    )
+
+class NFeBatchIngestor:
+    """
+    Importa muitas NF-es gravando em lotes, com uma transação por lote.
+
+    Cada arquivo recebe um resultado próprio em `results`. Antes do parsing o
+    SHA-256 do conteúdo é consultado em ingested_document: cópias exatas de
+    XMLs já recebidos são marcadas como duplicadas sem passar pelo parser.
+    Um arquivo inválido é recusado no parsing e não chega ao banco; se o
+    insert em massa de um lote falhar, o lote é refeito NF-e a NF-e em
+    savepoints, de forma que só o arquivo problemático fica de fora.
+    """
+    def __init__(self, connection, batch_size=DEFAULT_BATCH_SIZE):
+        self.connection = connection
+        self.batch_size = max(1, int(batch_size))
+        self.results = []
+        self.cache_hits = 0
+        self._pending = []
+        # Hashes das notas aceitas nesta importação (cópias dentro do mesmo envio),
+        # com (chNFe, nNF); um XML recusado não entra, e uma segunda cópia dele
+        # é recusada de novo
+        self._hashes = {}
+        # Ids de cliente e produto já resolvidos nesta importação
+        self.clientes = cliente_cache()
+        self.produtos = produto_cache()
+        # Sinais de cfop_rule, lidos no primeiro lote e usados em toda a importação
+        self.sinais = None
+
+    def add(self, nome, xml_source, is_file=True):
+        """Parseia um XML (caminho, file-like, bytes ou str) e o enfileira."""
+        try:
+            conteudo = _read_source(xml_source, is_file)
+        except OSError as e:
+            return self.reject(nome, f"Erro ao ler arquivo: {e}")
+
+        sha256 = document_hash(conteudo)
+        duplicado = self.check_document(nome, sha256, len(conteudo))
+        if duplicado:
+            return duplicado
+
+        try:
+            with INGEST_STAGE_SECONDS.time(stage="parse"):
+                record = parse_nfe_record(conteudo, is_file=False)
+        except Exception as e:
+            return self.reject(nome, f"XML inválido: {e}")
+        return self.add_record(nome, record, sha256=sha256)
+
+    def check_document(self, nome, sha256, tamanho=0):
+        """
+        Consulta o cache de documentos pelo hash do conteúdo bruto.
+
+        Returns:
+            dict: Resultado "duplicado" já registrado (com chNFe e nNF da nota
+                gravada), ou None se o XML é novo
+        """
+        nota = self._hashes.get(sha256)
+        if nota is None:
+            with self.connection.begin():
+                nota = self.connection.execute(document_query(sha256)).first()
+        DOCUMENT_CACHE_STATS.registrar(nota is not None, tamanho)
+        if nota is None:
+            return None
+
+        self.cache_hits += 1
+        INGEST_DOCUMENTS.inc(status=STATUS_DUPLICADO)
+        chNFe, nNF = nota
+        result = {
+            "arquivo": nome, "status": STATUS_DUPLICADO, "cache": True, "nNF": nNF or "", "chNFe": chNFe or ""
+        }
+        self.results.append(result)
+        return result
+
+    def reject(self, nome, erro):
+        """Registra um arquivo recusado antes do parsing (ex.: extensão inválida)."""
+        INGEST_DOCUMENTS.inc(status=STATUS_ERRO)
+        result = {"arquivo": nome, "status": STATUS_ERRO, "erro": erro}
+        self.results.append(result)
+        return result
+
+    def add_record(self, nome, record, sha256=None):
+        """Enfileira uma NF-e já parseada; grava o lote ao atingir batch_size."""
+        try:
+            _header_row(record)
+        except Exception as e:
+            return self.reject(nome, f"XML inválido: {e}")
+
+        if sha256:
+            self._hashes[sha256] = (record.chNFe, record.nNF)
+        result = {"arquivo": nome, "status": None, "nNF": record.nNF, "chNFe": record.chNFe}
+        self.results.append(result)
+        self._pending.append((result, record, sha256))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+        return result
+
+    def _existing(self, pending):
+        """
+        Uma única consulta de duplicidade para o lote.
+
+        Notas com chave de acesso são comparadas pela chave; linhas antigas sem
+        chNFe (e notas sem chave) caem no par emitente + número.
+        """
+        chaves = {record.chNFe for _, record, _ in pending if record.chNFe}
+        numeros = {record.nNF for _, record, _ in pending}
+        rows = self.connection.execute(duplicates_query(chaves, numeros)).all()
+        existentes = {chNFe for chNFe, _, _ in rows if chNFe}
+        existentes.update(("sem_chave", CNPJ_emit, nNF) for chNFe, CNPJ_emit, nNF in rows if not chNFe)
+        existentes.update(("numero", CNPJ_emit, nNF) for _, CNPJ_emit, nNF in rows)
+        return existentes
+
+    def flush(self):
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+
+        inicio = time.perf_counter()
+        try:
+            with self.connection.begin() as transaction:
+                if self.sinais is None:
+                    self.sinais = load_cfop_signs(self.connection)
+                existentes = self._existing(pending)
+
+                novos = []
+                for result, record, sha256 in pending:
+                    numero = (record.CNPJ_emit, record.nNF)
+                    if record.chNFe:
+                        duplicada = record.chNFe in existentes or ("sem_chave",) + numero in existentes
+                    else:
+                        duplicada = ("numero",) + numero in existentes
+                    if duplicada:
+                        result["status"] = STATUS_DUPLICADO
+                        continue
+                    existentes.add(record.chNFe or ("sem_chave",) + numero)
+                    existentes.add(("numero",) + numero)
+                    novos.append((result, record))
+
+                if novos:
+                    try:
+                        with self.connection.begin_nested():
+                            insert_nfe_records(
+                                self.connection, [record for _, record in novos],
+                                self.clientes, self.produtos, self.sinais
+                            )
+                        for result, _ in novos:
+                            result["status"] = STATUS_IMPORTADO
+                    except SQLAlchemyError:
+                        logging.exception("Falha no insert em massa; refazendo o lote NF-e a NF-e")
+                        self._rollback_dimensions()
+                        for result, record in novos:
+                            try:
+                                with self.connection.begin_nested():
+                                    insert_nfe_records(
+                                        self.connection, [record], self.clientes, self.produtos, self.sinais
+                                    )
+                                result["status"] = STATUS_IMPORTADO
+                            except SQLAlchemyError as e:
+                                self._rollback_dimensions()
+                                result["status"] = STATUS_ERRO
+                                result["erro"] = f"Erro ao gravar NF-e: {getattr(e, 'orig', None) or e}"
+
+                self._record_documents(pending)
+                gravado = time.perf_counter()
+                INGEST_STAGE_SECONDS.observe(gravado - inicio, stage="db_write")
+                transaction.commit()
+                INGEST_STAGE_SECONDS.observe(time.perf_counter() - gravado, stage="commit")
+            self.clientes.commit()
+            self.produtos.commit()
+        except SQLAlchemyError as e:
+            logging.exception("Erro ao gravar lote de NF-es")
+            self._rollback_dimensions()
+            for result, _, _ in pending:
+                result["status"] = STATUS_ERRO
+                result["erro"] = f"Erro ao gravar lote: {e}"
+        # Notas que não foram gravadas voltam a ser tentadas se chegarem de novo
+        for result, _, sha256 in pending:
+            if sha256 and result["status"] == STATUS_ERRO:
+                self._hashes.pop(sha256, None)
+        self._count(pending)
+
+    def _rollback_dimensions(self):
+        # Ids resolvidos em uma transação desfeita podem ser reaproveitados pelo banco
+        self.clientes.rollback()
+        self.produtos.rollback()
+
+    def _count(self, pending):
+        """Métricas do lote: documentos por resultado e linhas efetivamente gravadas."""
+        importados = itens = lotes = 0
+        for result, record, _ in pending:
+            INGEST_DOCUMENTS.inc(status=result["status"])
+            if result["status"] == STATUS_IMPORTADO:
+                importados += 1
+                itens += len(record.products)
+                lotes += sum(1 for product in record.products if product.lote_info.nLote)
+        if importados:
+            INGEST_ROWS.inc(importados, table="nfe_header")
+            INGEST_ROWS.inc(itens, table="nfe_item")
+            INGEST_ROWS.inc(lotes, table="lote_info")
+
+    def _record_documents(self, pending):
+        """Grava no cache os hashes das notas importadas ou já existentes no banco."""
+        agora = datetime.now()
+        rows = [
+            {"sha256": sha256, "chNFe": record.chNFe or None, "criado_em": agora}
+            for result, record, sha256 in pending
+            if sha256 and result["status"] != STATUS_ERRO
+        ]
+        if not rows:
+            return
+        try:
+            # O cache é só uma otimização: um conflito (outro envio simultâneo) não derruba o lote
+            with self.connection.begin_nested():
+                self.connection.execute(insert(IngestedDocument.__table__), rows)
+        except SQLAlchemyError:
+            logging.warning("Não foi possível gravar o cache de documentos do lote", exc_info=True)
+
+    def close(self):
+        """Grava o que ainda estiver pendente e devolve o resumo."""
+        self.flush()
+        return self.summary()
+
+    def summary(self):
+        contagem = {STATUS_IMPORTADO: 0, STATUS_DUPLICADO: 0, STATUS_ERRO: 0}
+        for result in self.results:
+            contagem[result["status"]] = contagem.get(result["status"], 0) + 1
+        return {
+            "total": len(self.results),
+            "importados": contagem[STATUS_IMPORTADO],
+            "duplicados": contagem[STATUS_DUPLICADO],
+            "erros": contagem[STATUS_ERRO],
+            "cache_acertos": self.cache_hits,
+            "arquivos": self.results
+        }
 
 if __name__ == '__main__':
     # Exemplo de uso
@@ -0,0 +1,437 @@
+"""
+Fila de tarefas em segundo plano, guardada na tabela ingest_job.
+
+As rotas de importação e de sincronização com o Mainô gravam a tarefa e
+respondem na hora com o id; o andamento é consultado em GET /api/jobs/<id>.
+Não há broker externo: os workers disputam as tarefas pendentes com um
+UPDATE atômico, e a de menor prioridade sai primeiro (uploads interativos
+antes das sincronizações em lote), depois a ordem de chegada.
+
+Workers:
+- no próprio app: JOB_WORKERS threads por processo (0 desliga);
+- separado: python -m src.jobs [--threads N] [--once].
+
+Cada tipo de tarefa é registrado com @job_handler(tipo). O handler recebe um
+JobContext e reporta o progresso por ele; depois de um pedido de
+cancelamento, o próximo progresso interrompe a tarefa (JobCancelado). Os
+lotes já gravados até ali permanecem no banco.
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from src.connections import get_engine
+from src.models.nfe import IngestJob
+
+STATUS_PENDENTE = "pendente"
+STATUS_EXECUTANDO = "executando"
+STATUS_CONCLUIDO = "concluido"
+STATUS_ERRO = "erro"
+STATUS_CANCELADO = "cancelado"
+
+# Menor valor sai primeiro
+PRIORIDADE_INTERATIVA = 0
+PRIORIDADE_LOTE = 10
+
+# Espera entre consultas à fila quando não há tarefa pendente (segundos)
+JOB_POLL_INTERVAL = 2.0
+# Intervalo do heartbeat das tarefas em execução e prazo sem sinal para
+# uma tarefa (de um worker que morreu) voltar para a fila
+JOB_HEARTBEAT_INTERVAL = 30
+JOB_STALE_AFTER = 300
+# Intervalo mínimo entre gravações de progresso de uma tarefa (segundos)
+PROGRESS_MIN_INTERVAL = 1.0
+
+# Arquivos enviados para tarefas de upload ficam aqui até a tarefa terminar
+DEFAULT_SPOOL_DIR = os.path.join(tempfile.gettempdir(), "opme_jobs")
+
+JOB_HANDLERS = {}
+
+# Acorda os workers deste processo assim que uma tarefa é enviada
+_novo_job = threading.Event()
+
+_COLUNAS_PUBLICAS = (
+    "id", "tipo", "status", "prioridade", "progresso", "total", "mensagem",
+    "erro", "worker", "criado_em", "iniciado_em", "concluido_em"
+)
+
+
+class JobCancelado(Exception):
+    """Levantada por JobContext.progress quando o cancelamento foi pedido."""
+
+
+def job_handler(tipo):
+    """Registra handler(ctx) como executor das tarefas do tipo informado."""
+    def registrar(func):
+        JOB_HANDLERS[tipo] = func
+        return func
+    return registrar
+
+
+def spool_dir():
+    path = os.environ.get("JOB_SPOOL_DIR") or DEFAULT_SPOOL_DIR
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def spool_path(nome):
+    """Caminho novo no diretório de arquivos das tarefas (JOB_SPOOL_DIR)."""
+    return os.path.join(spool_dir(), f"{uuid.uuid4().hex}-{os.path.basename(nome)}")
+
+
+def _remover_arquivos(parametros):
+    # Parâmetros com prefixo "_" são internos; "_arquivos" lista (nome, caminho) no spool
+    for _, caminho in parametros.get("_arquivos", ()):
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+
+def _job_dict(row):
+    job = {coluna: getattr(row, coluna) for coluna in _COLUNAS_PUBLICAS}
+    for coluna in ("criado_em", "iniciado_em", "concluido_em"):
+        if job[coluna] is not None:
+            job[coluna] = job[coluna].isoformat()
+    parametros = json.loads(row.parametros or "{}")
+    job["parametros"] = {chave: valor for chave, valor in parametros.items() if not chave.startswith("_")}
+    job["resultado"] = json.loads(row.resultado) if row.resultado else None
+    job["cancelamento_solicitado"] = bool(row.cancelar)
+    return job
+
+
+def submit_job(tipo, parametros=None, prioridade=PRIORIDADE_LOTE, credenciais=None):
+    """
+    Grava a tarefa como pendente e devolve o id.
+
+    Args:
+        tipo (str): Tipo registrado com @job_handler
+        parametros (dict): Parâmetros (JSON) repassados ao handler
+        prioridade (int): PRIORIDADE_INTERATIVA ou PRIORIDADE_LOTE
+        credenciais (dict, optional): Guardadas à parte, nunca devolvidas
+            pela API e apagadas quando a tarefa termina
+    """
+    if tipo not in JOB_HANDLERS:
+        raise ValueError(f"Tipo de tarefa desconhecido: {tipo}")
+    table = IngestJob.__table__
+    with get_engine().begin() as connection:
+        job_id = connection.execute(
+            table.insert().values(
+                tipo=tipo,
+                status=STATUS_PENDENTE,
+                prioridade=prioridade,
+                parametros=json.dumps(parametros or {}),
+                credenciais=json.dumps(credenciais) if credenciais else None,
+                progresso=0,
+                cancelar=False,
+                criado_em=datetime.now()
+            ).returning(table.c.id)
+        ).scalar_one()
+    _novo_job.set()
+    return job_id
+
+
+def get_job(job_id):
+    """Estado da tarefa (dict) ou None se ela não existe."""
+    table = IngestJob.__table__
+    with get_engine().connect() as connection:
+        row = connection.execute(select(table).where(table.c.id == job_id)).first()
+    return _job_dict(row) if row is not None else None
+
+
+def list_jobs(status=None, limite=50):
+    """Tarefas mais recentes primeiro, opcionalmente filtradas por status."""
+    table = IngestJob.__table__
+    query = select(table).order_by(table.c.id.desc()).limit(limite)
+    if status:
+        query = query.where(table.c.status == status)
+    with get_engine().connect() as connection:
+        return [_job_dict(row) for row in connection.execute(query)]
+
+
+def cancel_job(job_id):
+    """
+    Cancela a tarefa: uma pendente é encerrada na hora; uma em execução é
+    interrompida no próximo progresso reportado pelo handler.
+
+    Returns:
+        dict: Estado atualizado, ou None se a tarefa não existe
+    """
+    table = IngestJob.__table__
+    with get_engine().begin() as connection:
+        pendente = connection.execute(
+            update(table)
+            .where(table.c.id == job_id, table.c.status == STATUS_PENDENTE)
+            .values(status=STATUS_CANCELADO, concluido_em=datetime.now(), credenciais=None)
+            .returning(table.c.parametros)
+        ).first()
+        if pendente is None:
+            connection.execute(
+                update(table)
+                .where(table.c.id == job_id, table.c.status == STATUS_EXECUTANDO)
+                .values(cancelar=True)
+            )
+    if pendente is not None:
+        _remover_arquivos(json.loads(pendente.parametros or "{}"))
+    return get_job(job_id)
+
+
+def has_pending_jobs(connection):
+    table = IngestJob.__table__
+    return connection.execute(
+        select(table.c.id).where(table.c.status == STATUS_PENDENTE).limit(1)
+    ).first() is not None
+
+
+def claim_job(connection, worker_id):
+    """
+    Reserva a próxima tarefa pendente para o worker (prioridade, depois id).
+
+    A escolha e a marcação são um único UPDATE; se dois workers disputarem a
+    mesma tarefa, só um recebe a linha de volta. Returns: a linha ou None.
+    """
+    table = IngestJob.__table__
+    proxima = (
+        select(table.c.id)
+        .where(table.c.status == STATUS_PENDENTE)
+        .order_by(table.c.prioridade, table.c.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    agora = datetime.now()
+    return connection.execute(
+        update(table)
+        .where(table.c.id == proxima, table.c.status == STATUS_PENDENTE)
+        .values(status=STATUS_EXECUTANDO, worker=worker_id, iniciado_em=agora, heartbeat_em=agora)
+        .returning(table.c.id, table.c.tipo, table.c.parametros, table.c.credenciais)
+    ).first()
+
+
+def requeue_stale_jobs(connection):
+    """Devolve à fila as tarefas cujo worker parou de dar sinal (ou as cancela, se pedido)."""
+    table = IngestJob.__table__
+    limite = datetime.now() - timedelta(seconds=JOB_STALE_AFTER)
+    abandonadas = (table.c.status == STATUS_EXECUTANDO, table.c.heartbeat_em < limite)
+    connection.execute(
+        update(table).where(*abandonadas, table.c.cancelar.is_(True))
+        .values(status=STATUS_CANCELADO, concluido_em=datetime.now(), credenciais=None)
+    )
+    return connection.execute(
+        update(table).where(*abandonadas).values(status=STATUS_PENDENTE, worker=None)
+    ).rowcount
+
+
+class JobContext:
+    """Passado ao handler: parâmetros, credenciais e registro de progresso."""
+    def __init__(self, engine, job_id, parametros, credenciais):
+        self.engine = engine
+        self.job_id = job_id
+        self.parametros = parametros
+        self.credenciais = credenciais
+        self.cancelado = False
+        self._ultimo_progresso = 0.0
+
+    def progress(self, processados, total=None, nome=None):
+        """
+        Grava o progresso (no máximo a cada PROGRESS_MIN_INTERVAL) e confere
+        o pedido de cancelamento. Mesma assinatura do progress(processados,
+        total, nome) de MainoAPI.baixar_e_processar_xmls.
+
+        Raises:
+            JobCancelado: o cancelamento da tarefa foi pedido
+        """
+        agora = time.monotonic()
+        if processados != total and agora - self._ultimo_progresso < PROGRESS_MIN_INTERVAL:
+            return
+        self._ultimo_progresso = agora
+
+        table = IngestJob.__table__
+        with self.engine.begin() as connection:
+            connection.execute(
+                update(table).where(table.c.id == self.job_id).values(
+                    progresso=processados,
+                    total=total,
+                    mensagem=str(nome)[:200] if nome else None
+                )
+            )
+            cancelar = connection.execute(
+                select(table.c.cancelar).where(table.c.id == self.job_id)
+            ).scalar()
+        if cancelar:
+            self.cancelado = True
+            raise JobCancelado(f"Tarefa {self.job_id} cancelada")
+
+
+class JobWorker:
+    """Threads que executam as tarefas da fila até stop()."""
+    def __init__(self, app, threads=1, poll_interval=JOB_POLL_INTERVAL):
+        self.app = app
+        self.threads = max(1, int(threads))
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._parar = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for numero in range(self.threads):
+            thread = threading.Thread(target=self._loop, name=f"job-worker-{numero}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        logging.info(f"Worker de tarefas {self.worker_id} iniciado ({self.threads} thread(s))")
+        return self
+
+    def request_stop(self):
+        """Para de pegar tarefas novas (seguro em handlers de sinal)."""
+        self._parar.set()
+        _novo_job.set()
+
+    def stop(self, timeout=None):
+        """Para de pegar tarefas novas e espera as em execução terminarem."""
+        self.request_stop()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def wait(self):
+        """Bloqueia até request_stop()/stop()."""
+        while not self._parar.wait(1):
+            pass
+
+    def run_pending(self):
+        """Executa uma tarefa pendente, se houver. Returns: True se executou."""
+        engine = get_engine()
+        # Leitura barata antes, em transação própria: sem tarefa pendente,
+        # nenhuma escrita na fila
+        with engine.connect() as connection:
+            if not has_pending_jobs(connection):
+                return False
+        with engine.begin() as connection:
+            job = claim_job(connection, self.worker_id)
+        if job is None:
+            return False
+        self._executar(engine, job)
+        return True
+
+    def _executar(self, engine, job):
+        parametros = json.loads(job.parametros or "{}")
+        credenciais = json.loads(job.credenciais) if job.credenciais else {}
+        ctx = JobContext(engine, job.id, parametros, credenciais)
+        status, resultado, erro = STATUS_CONCLUIDO, None, None
+
+        logging.info(f"Tarefa {job.id} ({job.tipo}) iniciada")
+        try:
+            handler = JOB_HANDLERS.get(job.tipo)
+            if handler is None:
+                raise ValueError(f"Tipo de tarefa desconhecido: {job.tipo}")
+            with self.app.app_context():
+                resultado = handler(ctx)
+        except JobCancelado:
+            pass
+        except Exception as e:
+            logging.exception(f"Erro na tarefa {job.id} ({job.tipo})")
+            status, erro = STATUS_ERRO, str(e)
+        finally:
+            _remover_arquivos(parametros)
+        if ctx.cancelado:
+            # O handler pode ter convertido JobCancelado em resultado de erro
+            status, erro = STATUS_CANCELADO, None
+
+        table = IngestJob.__table__
+        with engine.begin() as connection:
+            connection.execute(
+                update(table)
+                .where(table.c.id == job.id, table.c.worker == self.worker_id)
+                .values(
+                    status=status,
+                    resultado=json.dumps(resultado, default=str) if resultado is not None else None,
+                    erro=erro,
+                    credenciais=None,
+                    concluido_em=datetime.now()
+                )
+            )
+        logging.info(f"Tarefa {job.id} ({job.tipo}) terminou: {status}")
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                executou = self.run_pending()
+            except Exception:
+                logging.exception("Erro no worker de tarefas")
+                executou = False
+            if not executou:
+                _novo_job.wait(self.poll_interval)
+                _novo_job.clear()
+
+    def _heartbeat(self):
+        table = IngestJob.__table__
+        while not self._parar.wait(JOB_HEARTBEAT_INTERVAL):
+            try:
+                with get_engine().begin() as connection:
+                    connection.execute(
+                        update(table)
+                        .where(table.c.worker == self.worker_id, table.c.status == STATUS_EXECUTANDO)
+                        .values(heartbeat_em=datetime.now())
+                    )
+                    requeue_stale_jobs(connection)
+            except Exception:
+                logging.exception("Erro no heartbeat das tarefas")
+
+
+_app_worker = None
+_app_worker_lock = threading.Lock()
+
+
+def start_app_worker(app):
+    """Inicia, uma vez por processo, as JOB_WORKERS threads de tarefas do app."""
+    global _app_worker
+    if _app_worker is not None or app.config.get("JOB_WORKERS", 1) <= 0:
+        return _app_worker
+    with _app_worker_lock:
+        if _app_worker is None:
+            _app_worker = JobWorker(app, threads=app.config.get("JOB_WORKERS", 1)).start()
+    return _app_worker
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Executa as tarefas em segundo plano (ingest_job)")
+    parser.add_argument("--threads", type=int, default=None, help="Threads de execução (padrão: JOB_WORKERS ou 1)")
+    parser.add_argument("--once", action="store_true", help="Executa as tarefas pendentes e termina")
+    args = parser.parse_args(argv)
+
+    # Registra os handlers (rotas) e o engine do app
+    from src.main import create_app
+    app = create_app()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    worker = JobWorker(app, threads=args.threads or app.config.get("JOB_WORKERS") or 1)
+    if args.once:
+        while worker.run_pending():
+            pass
+        return 0
+
+    signal.signal(signal.SIGTERM, lambda *_: worker.request_stop())
+    worker.start()
+    try:
+        worker.wait()
+    except KeyboardInterrupt:
+        pass
+    worker.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,144 +1,237 @@
 import os
-import sys
+import time
 from datetime import datetime, timedelta
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Blueprint, Flask, current_app, request, jsonify, send_from_directory, g, Response
 from flask_cors import CORS
+from flask_migrate import Migrate
 
 # importa a instância única do SQLAlchemy (extensions.py)
 from .extensions import db
+from . import connections
+
+# Os models precisam estar registrados no metadata usado pelas migrações
+from .models.nfe import NFeHeader, NFeItem, LoteInfo, EstoqueConsignacao
+
+from .routes.opme import opme_bp
+from .routes.maino import maino_bp
+from .routes.jobs import jobs_bp
+from .query_plans import check_query_plans_command
+from .response_cache import RESPONSE_CACHE, cached_response
+from .jobs import job_handler, submit_job, start_app_worker, PRIORIDADE_LOTE, STATUS_PENDENTE
+from .metrics import REGISTRY, HTTP_REQUESTS, HTTP_REQUEST_SECONDS, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from .services import get_service
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+main_bp = Blueprint('main', __name__)
+
+
+def create_app(config=None):
+    """
+    Cria e configura o app Flask.
+
+    A importação deste módulo não abre conexões nem cria serviços: o engine
+    só conecta na primeira consulta e XMLProcessor, EstoqueService e MainoAPI
+    são criados no primeiro uso (src/services). O esquema é aplicado à parte,
+    com `flask --app src.main db upgrade`. Com `gunicorn --preload` o app é
+    criado uma vez no processo mestre e os workers o herdam pelo fork (veja
+    gunicorn.conf.py).
+
+    Args:
+        config (dict, optional): Valores que sobrescrevem a configuração do ambiente
+    """
+    app = Flask(__name__, static_folder='static')
+    app.config['SECRET_KEY'] = 'sua_chave_secreta_aqui'
+
+    # Usa DATABASE_URL se disponível (por ex. Postgres em produção). Caso contrário, usa SQLite em /app/database/app.db
+    app.config['SQLALCHEMY_DATABASE_URI'] = connections.database_url()
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Quantidade de NF-es gravadas por transação nas importações em lote
+    app.config['NFE_BATCH_SIZE'] = int(os.environ.get("NFE_BATCH_SIZE", 500))
+    # Processos de parsing na sincronização com o Mainô (1 = serial)
+    app.config['MAINO_INGEST_WORKERS'] = int(os.environ.get("MAINO_INGEST_WORKERS", 1))
+    # Downloads simultâneos de XML por chave e limite de requisições por segundo à API do Mainô
+    app.config['MAINO_FETCH_WORKERS'] = int(os.environ.get("MAINO_FETCH_WORKERS", 8))
+    app.config['MAINO_REQUESTS_PER_SECOND'] = float(os.environ.get("MAINO_REQUESTS_PER_SECOND", 5))
+    # Timeouts (segundos) de conexão e de leitura de cada requisição à API do Mainô
+    app.config['MAINO_TIMEOUT'] = (
+        float(os.environ.get("MAINO_CONNECT_TIMEOUT", 10)),
+        float(os.environ.get("MAINO_READ_TIMEOUT", 60))
+    )
+    # Credenciais da sincronização por chave (/api/sincronizar-maino)
+    app.config['MAINO_API_KEY'] = os.environ.get("MAINO_API_KEY")
+    app.config['MAINO_BEARER_TOKEN'] = os.environ.get("MAINO_BEARER_TOKEN")
+    # Limite em bytes do cache de respostas de saldo/estoque (por processo)
+    app.config['RESPONSE_CACHE_MAX_BYTES'] = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+    # Threads que executam as tarefas em segundo plano em cada processo do app
+    # (0 = só o worker separado, `python -m src.jobs`)
+    app.config['JOB_WORKERS'] = int(os.environ.get("JOB_WORKERS", 1))
+    if config:
+        app.config.update(config)
+
+    db_uri = app.config['SQLALCHEMY_DATABASE_URI']
+    # Pool do engine (DB_POOL_SIZE/DB_MAX_OVERFLOW); WAL e pragmas do SQLite são
+    # aplicados a cada conexão nova por connections.init_app
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', connections.engine_options(db_uri))
+
+    # Habilita CORS para todas as rotas
+    CORS(app)
+
+    # Se for sqlite com arquivo, garante que o diretório exista antes de conectar/criar tabelas
+    if db_uri.startswith("sqlite"):
+        import re
+        m = re.match(r"sqlite:/*(.+)", db_uri)
+        if m:
+            # normaliza para caminho absoluto dentro do container
+            db_file = "/" + m.group(1).lstrip("/")
+            db_dir = os.path.dirname(db_file)
+            try:
+                os.makedirs(db_dir, exist_ok=True)
+            except Exception:
+                app.logger.exception("Não foi possível criar diretório do banco de dados: %s", db_dir)
+
+    # Inicializa o SQLAlchemy com a aplicação Flask
+    db.init_app(app)
+    connections.init_app(app)
+
+    # O esquema é gerenciado pelo Flask-Migrate (migrations/); aplique com
+    # `flask --app src.main db upgrade` antes de subir a aplicação
+    Migrate(app, db, directory=MIGRATIONS_DIR, render_as_batch=db_uri.startswith("sqlite"))
+
+    # Registra as rotas OPME e Mainô sob /api (usadas por static/index.html)
+    app.register_blueprint(opme_bp, url_prefix='/api')
+    app.register_blueprint(maino_bp, url_prefix='/api')
+    app.register_blueprint(jobs_bp, url_prefix='/api')
+    app.register_blueprint(main_bp)
+
+    app.cli.add_command(check_query_plans_command)
+
+    RESPONSE_CACHE.max_bytes = app.config['RESPONSE_CACHE_MAX_BYTES']
+
+    # Latência e contagem por rota (regra do Flask, não a URL), expostas em /metrics
+    app.before_request(_iniciar_cronometro)
+    app.after_request(_registrar_metricas)
+
+    # Worker de tarefas no próprio processo, iniciado na primeira requisição
+    # (assim comandos como `flask db upgrade` não disputam a fila, e com
+    # --preload as threads nascem em cada worker, não no processo mestre)
+    @app.before_request
+    def _iniciar_worker_de_tarefas():
+        start_app_worker(app)
+
+    return app
+
+
+def _iniciar_cronometro():
+    g.inicio_requisicao = time.perf_counter()
+
+
+def _registrar_metricas(response):
+    inicio = g.pop('inicio_requisicao', None)
+    if inicio is not None:
+        rota = request.url_rule.rule if request.url_rule else 'sem_rota'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - inicio, method=request.method, route=rota)
+        HTTP_REQUESTS.inc(method=request.method, route=rota, status=response.status_code)
+    return response
 
-# Configuração do Flask
-app = Flask(__name__, static_folder='static')
-app.config['SECRET_KEY'] = 'sua_chave_secreta_aqui'
-
-# Habilita CORS para todas as rotas
-CORS(app)
-
-# Configuração do banco de dados
-# Usa DATABASE_URL se disponível (por ex. Postgres em produção). Caso contrário, usa SQLite em /app/database/app.db
-db_uri = os.environ.get("DATABASE_URL") or "sqlite:///database/app.db"
-app.config['SQLALCHEMY_DATABASE_URI'] = db_uri
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Se for sqlite com arquivo, garante que o diretório exista antes de conectar/criar tabelas
-if db_uri.startswith("sqlite"):
-    import re
-    m = re.match(r"sqlite:/*(.+)", db_uri)
-    if m:
-        # normaliza para caminho absoluto dentro do container
-        db_file = "/" + m.group(1).lstrip("/")
-        db_dir = os.path.dirname(db_file)
-        try:
-            os.makedirs(db_dir, exist_ok=True)
-        except Exception:
-            app.logger.exception("Não foi possível criar diretório do banco de dados: %s", db_dir)
-
-# Inicializa o SQLAlchemy com a aplicação Flask
-db.init_app(app)
-
-# Cria as tabelas do banco de dados se não existirem (faz isso dentro do app_context)
-with app.app_context():
-    db.create_all()
-
-# Agora que o DB está inicializado, importe serviços e models
-from .services.xml_processor import XMLProcessor
-from .services.estoque_service import EstoqueService
-from .services.maino_api import MainoAPI
-from .models.nfe import NFeHeader, NFeItem, EstoqueConsignacao
-
-# Inicializa serviços
-xml_processor = XMLProcessor()
-estoque_service = EstoqueService()
-maino_api = MainoAPI()
 
 # Rotas da API
-@app.route('/api/processar-xml', methods=['POST'])
+@main_bp.route('/api/processar-xml', methods=['POST'])
 def processar_xml():
     xml_content = request.json.get('xml_content')
     if not xml_content:
         return jsonify({'error': 'XML content is required'}), 400
 
     try:
-        nfe_data = xml_processor.parse_nfe_xml(xml_content)
-        estoque_service.process_nfe(nfe_data)
+        nfe_data = get_service("xml_processor").parse_nfe_xml(xml_content)
+        get_service("estoque_service").process_nfe(nfe_data)
         return jsonify({'message': 'XML processed successfully', 'nfe_data': nfe_data}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/estoque/resumo', methods=['GET'])
+@main_bp.route('/api/estoque/resumo', methods=['GET'])
+@cached_response
 def get_estoque_resumo():
-    resumo = estoque_service.get_estoque_resumo()
+    try:
+        resumo = get_service("estoque_service").get_estoque_resumo(as_of=request.args.get('as_of'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify(resumo)
 
-@app.route('/api/estoque/por-produto/<string:codigo_produto>', methods=['GET'])
+@main_bp.route('/api/estoque/por-produto/<string:codigo_produto>', methods=['GET'])
+@cached_response
 def get_estoque_por_produto(codigo_produto):
-    estoque = estoque_service.get_estoque_por_produto(codigo_produto)
+    try:
+        estoque = get_service("estoque_service").get_estoque_por_produto(
+            codigo_produto, as_of=request.args.get('as_of')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify(estoque)
 
-@app.route('/api/estoque/por-cliente/<string:cnpj_cliente>', methods=['GET'])
+@main_bp.route('/api/estoque/por-cliente/<string:cnpj_cliente>', methods=['GET'])
+@cached_response
 def get_estoque_por_cliente(cnpj_cliente):
-    estoque = estoque_service.get_estoque_por_cliente(cnpj_cliente)
+    try:
+        estoque = get_service("estoque_service").get_estoque_por_cliente(
+            cnpj_cliente, as_of=request.args.get('as_of')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify(estoque)
 
-@app.route('/api/sincronizar-maino', methods=['POST'])
+def _sincronizar_maino(dias_atras, completo, progress=None):
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=dias_atras)
+    with connections.connect() as connection:
+        return get_service("maino_api").sincronizar_por_chave(
+            connection, start_date, end_date, completo=completo,
+            batch_size=current_app.config['NFE_BATCH_SIZE'],
+            max_workers=current_app.config['MAINO_FETCH_WORKERS'],
+            progress=progress
+        )
+
+@job_handler("sincronizar_maino")
+def _job_sincronizar_maino(ctx):
+    resultado = _sincronizar_maino(ctx.parametros["dias_atras"], ctx.parametros["completo"], progress=ctx.progress)
+    if not resultado["sucesso"]:
+        raise RuntimeError(resultado["erro"])
+    return resultado
+
+@main_bp.route('/api/sincronizar-maino', methods=['POST'])
 def sincronizar_maino():
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     dias_atras = data.get("dias_atras", 7)
-    
+    # completo=true ignora a marca d'água e relista toda a janela de dias_atras
+    completo = bool(data.get("completo", False))
+
+    # Por padrão a sincronização vira uma tarefa em segundo plano;
+    # aguardar=true mantém o modo antigo, dentro da requisição
+    if not data.get("aguardar", False):
+        job_id = submit_job(
+            "sincronizar_maino", {"dias_atras": dias_atras, "completo": completo},
+            prioridade=PRIORIDADE_LOTE
+        )
+        return jsonify({"sucesso": True, "job_id": job_id, "status": STATUS_PENDENTE}), 202
+
     try:
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=dias_atras)
-        resultado_nfes = maino_api.get_nfes_emitidas(start_date, end_date)
-
-        if not resultado_nfes["sucesso"]:
-            return jsonify(resultado_nfes), 400
-        
-        nfes_para_processar = resultado_nfes["nfes"]
-        
-        xmls_processados = 0
-        nfes_saida = 0
-        nfes_entrada = 0
-        erros = []
-        
-        for nfe_item in nfes_para_processar:
-            chave_acesso = nfe_item.get("chaveAcesso")
-            if not chave_acesso:
-                erros.append(f"NF-e sem chave de acesso: {nfe_item.get('numero')}")
-                continue
-
-            resultado_xml_completo = maino_api.get_nfe_xml_by_chave(chave_acesso)
-            if not resultado_xml_completo["sucesso"]:
-                erros.append(f"Erro ao buscar XML da NF-e {chave_acesso}: {resultado_xml_completo['erro']}")
-                continue
-            xml_content = resultado_xml_completo["xml_content"]
+        resultado = _sincronizar_maino(dias_atras, completo)
+        if not resultado["sucesso"]:
+            return jsonify(resultado), 400
+        return jsonify(resultado)
 
-            try:
-                nfe_data = xml_processor.parse_nfe_xml(xml_content)
-                estoque_service.process_nfe(nfe_data)
-                xmls_processados += 1
-                if nfe_data['cfop'][0] == '5' or nfe_data['cfop'][0] == '6':
-                    nfes_saida += 1
-                else:
-                    nfes_entrada += 1
-            except Exception as e:
-                erros.append(f"Erro ao processar NF-e {chave_acesso}: {str(e)}")
-        
-        return jsonify({
-            "sucesso": True,
-            "nfes_encontradas": len(nfes_para_processar),
-            "nfes_processadas": xmls_processados,
-            "nfes_saida": nfes_saida,
-            "nfes_entrada": nfes_entrada,
-            "erros": erros
-        })
-        
     except Exception as e:
         return jsonify({"sucesso": False, "erro": f"Erro na sincronização: {e}"}), 500
 
+@main_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas deste processo no formato texto do Prometheus"""
+    return Response(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
+
 # Rota para servir arquivos estáticos (frontend)
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
+@main_bp.route('/', defaults={'path': ''})
+@main_bp.route('/<path:path>')
 def serve(path):
     if path != "" and os.path.exists(os.path.join('static', path)):
         return send_from_directory('static', path)
@@ -146,6 +239,6 @@ def serve(path):
         return send_from_directory('static', 'index.html')
 
 
-@app.route("/test")
+@main_bp.route("/test")
 def test_route():
     return "Hello from Flask!"
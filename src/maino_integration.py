@@ -1,16 +1,112 @@
 import requests
+import hashlib
 import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
+from requests.adapters import HTTPAdapter
 import tempfile
 import zipfile
 import os
-from src.insert_nfe_data import insert_nfe_data
+from src.connections import connect
+from src.metrics import INGEST_STAGE_SECONDS, MAINO_REQUESTS, MAINO_REQUEST_SECONDS
+from src.insert_nfe_data import NFeBatchIngestor, DEFAULT_BATCH_SIZE, STATUS_IMPORTADO, STATUS_ERRO, document_hash
+from src.parse_nfe_xml import parse_nfe_record
+from src.sync_state import get_watermark, set_watermark, known_keys
+
+# Quantas NF-es cada processo de trabalho pode ter em andamento ao mesmo tempo
+PARSE_QUEUE_PER_WORKER = 4
+# Download do ZIP: blocos lidos da resposta e limite em memória antes de ir para o disco
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+ZIP_SPOOL_MAX_SIZE = 32 * 1024 * 1024
+
+def _parse_xml(item):
+    """
+    Parseia (nome, bytes); executado também nos processos de trabalho, por
+    isso a duração volta junto com o resultado em vez de ir direto às métricas.
+    """
+    nome, conteudo = item
+    inicio = time.perf_counter()
+    try:
+        return nome, parse_nfe_record(conteudo, is_file=False), None, time.perf_counter() - inicio
+    except Exception as e:
+        return nome, None, str(e), time.perf_counter() - inicio
+
+def _parse_result(resultado):
+    """Registra a duração do parsing (no processo principal) e devolve (nome, record, erro)."""
+    nome, record, erro, segundos = resultado
+    INGEST_STAGE_SECONDS.observe(segundos, stage="parse")
+    return nome, record, erro
+
+# Respostas que valem nova tentativa (com espera exponencial)
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# Espera máxima (segundos) aceita de um Retry-After; valores maiores são limitados a ela
+RETRY_AFTER_MAX = 60
+# (conexão, leitura) em segundos de cada requisição; no download em streaming
+# a leitura vale para cada bloco, não para o ZIP inteiro
+DEFAULT_TIMEOUT = (10, 60)
+# Endpoints com marca d'água própria em sync_state
+ENDPOINT_EXPORTACAO = "nfes_emitidas"
+ENDPOINT_NOTAS = "notas_fiscais_emitidas"
+# Rótulos das métricas para o XML por chave e o download do ZIP exportado
+ENDPOINT_XML = "xml"
+ENDPOINT_ZIP = "zip"
+
+_CHAVE_ACESSO = re.compile(r"\d{44}")
+
+def _chave_no_nome(nome):
+    """Chave de acesso contida no nome do arquivo (ex.: 3525...-nfe.xml), se houver."""
+    encontrada = _CHAVE_ACESSO.search(os.path.basename(nome))
+    return encontrada.group(0) if encontrada else None
+
+def _log_progress(processados, total, nome):
+    if processados == total or processados % 100 == 0:
+        logging.info(f"Importação Mainô: {processados}/{total} XMLs processados")
+
+class RateLimiter:
+    """Limita as requisições por segundo, compartilhado entre as threads."""
+    def __init__(self, requests_per_second):
+        self.intervalo = 1.0 / requests_per_second if requests_per_second else 0.0
+        self._proximo = 0.0
+        self._lock = threading.Lock()
+
+    def aguardar(self):
+        if not self.intervalo:
+            return
+        # Reserva o próximo horário livre sob o lock e dorme fora dele
+        with self._lock:
+            agora = time.monotonic()
+            horario = max(agora, self._proximo)
+            self._proximo = horario + self.intervalo
+        if horario > agora:
+            time.sleep(horario - agora)
 
 class MainoAPI:
-    def __init__(self, api_key=None, bearer_token=None):
-        self.base_url = "https://api.maino.com.br/api/v2"
+    def __init__(self, api_key=None, bearer_token=None, requests_per_second=5,
+                 max_retries=4, backoff_base=0.5, pool_size=10, base_url="https://api.maino.com.br/api/v2",
+                 conta=None, retry_after_max=RETRY_AFTER_MAX, timeout=DEFAULT_TIMEOUT):
+        self.base_url = base_url
         self.api_key = api_key
         self.bearer_token = bearer_token
+        # Identifica a conta em sync_state sem gravar a credencial no banco
+        credencial = bearer_token or api_key or ""
+        self.conta = conta or hashlib.sha256(credencial.encode("utf-8")).hexdigest()[:16]
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.retry_after_max = retry_after_max
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.rate_limiter = RateLimiter(requests_per_second)
+        
+        # Sessão única: reaproveita conexões (e o handshake TLS) entre as chamadas
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         
     def _get_headers(self):
         """Retorna os headers para autenticação"""
@@ -23,6 +119,44 @@ class MainoAPI:
         
         return headers
     
+    def _request(self, url, endpoint, **kwargs):
+        """
+        GET pela sessão compartilhada, respeitando o limite de requisições por
+        segundo. Em 429/5xx e falhas de conexão tenta de novo até max_retries
+        vezes, com espera exponencial (ou o Retry-After enviado pelo servidor,
+        limitado a retry_after_max segundos). Sem timeout= explícito vale o do
+        construtor (conexão, leitura): um servidor que não responde conta como
+        falha de conexão em vez de prender a thread.
+
+        endpoint é o nome curto usado nas métricas (a URL pode conter a chave).
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        tentativa = 0
+        while True:
+            self.rate_limiter.aguardar()
+            inicio = time.perf_counter()
+            try:
+                response = self.session.get(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                MAINO_REQUEST_SECONDS.observe(time.perf_counter() - inicio, endpoint=endpoint)
+                MAINO_REQUESTS.inc(endpoint=endpoint, status="erro")
+                if tentativa >= self.max_retries:
+                    raise
+            else:
+                MAINO_REQUEST_SECONDS.observe(time.perf_counter() - inicio, endpoint=endpoint)
+                MAINO_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+                if response.status_code not in RETRY_STATUS or tentativa >= self.max_retries:
+                    response.raise_for_status()
+                    return response
+                espera = response.headers.get("Retry-After")
+                response.close()
+                if espera and espera.isdigit():
+                    time.sleep(min(int(espera), self.retry_after_max))
+                    tentativa += 1
+                    continue
+            time.sleep(self.backoff_base * (2 ** tentativa))
+            tentativa += 1
+    
     def listar_notas_fiscais_emitidas(self, data_inicio, data_fim, numero_nfe=None, cnpj_destinatario=None, exibir_xmls=False):
         """
         Lista notas fiscais emitidas
@@ -51,11 +185,10 @@ class MainoAPI:
             params["cnpj_destinatario"] = cnpj_destinatario
         
         try:
-            response = requests.get(endpoint, headers=self._get_headers(), params=params)
-            response.raise_for_status()
+            response = self._request(endpoint, ENDPOINT_NOTAS, headers=self._get_headers(), params=params)
             return response.json()
         except requests.exceptions.RequestException as e:
-            print(f"Erro ao listar notas fiscais: {e}")
+            logging.warning(f"Erro ao listar notas fiscais: {e}")
             return None
     
     def exportar_xmls_nfes_emitidas(self, data_inicio, data_fim):
@@ -77,26 +210,211 @@ class MainoAPI:
         }
         
         try:
-            response = requests.get(endpoint, headers=self._get_headers(), params=params)
-            response.raise_for_status()
+            response = self._request(endpoint, ENDPOINT_EXPORTACAO, headers=self._get_headers(), params=params)
             result = response.json()
             return result.get("zip_url")
         except requests.exceptions.RequestException as e:
-            print(f"Erro ao exportar XMLs: {e}")
+            logging.warning(f"Erro ao exportar XMLs: {e}")
             return None
     
-    def baixar_e_processar_xmls(self, data_inicio, data_fim, db_path="database/app.db"):
+    def get_nfes_emitidas(self, data_inicio, data_fim):
+        """
+        Lista as NF-es emitidas entre duas datas (datetime).
+
+        Returns:
+            dict: {"sucesso": True, "nfes": [...]} ou {"sucesso": False, "erro": ...}
+        """
+        notas = self.listar_notas_fiscais_emitidas(
+            data_inicio.strftime("%d/%m/%Y"),
+            data_fim.strftime("%d/%m/%Y")
+        )
+        if notas is None:
+            return {"sucesso": False, "erro": "Erro ao listar notas fiscais do Mainô"}
+        return {"sucesso": True, "nfes": notas.get("notas_fiscais", [])}
+    
+    def get_nfe_xml_by_chave(self, chave_acesso):
+        """
+        Baixa o XML de uma NF-e pela chave de acesso.
+
+        Returns:
+            dict: {"sucesso": True, "xml_content": bytes} ou {"sucesso": False, "erro": ...}
+        """
+        endpoint = f"{self.base_url}/notas_fiscais_emitidas/{chave_acesso}/xml"
+        
+        try:
+            with INGEST_STAGE_SECONDS.time(stage="download"):
+                response = self._request(endpoint, ENDPOINT_XML, headers=self._get_headers())
+            return {"sucesso": True, "xml_content": response.content}
+        except requests.exceptions.RequestException as e:
+            return {"sucesso": False, "erro": str(e)}
+    
+    def buscar_xmls_por_chave(self, chaves, max_workers=None):
+        """
+        Baixa os XMLs de várias chaves em paralelo (pool de threads limitado).
+
+        Os resultados saem na ordem em que ficam prontos, para que o chamador
+        possa gravá-los enquanto os demais ainda estão sendo baixados. No
+        máximo 2 * max_workers downloads ficam pendentes ao mesmo tempo.
+
+        Yields:
+            tuple: (chave, resultado de get_nfe_xml_by_chave)
+        """
+        max_workers = max_workers or self.pool_size
+        chaves = iter(chaves)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pendentes = {}
+            for chave in chaves:
+                pendentes[executor.submit(self.get_nfe_xml_by_chave, chave)] = chave
+                if len(pendentes) >= 2 * max_workers:
+                    break
+            try:
+                while pendentes:
+                    prontos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+                    for future in prontos:
+                        yield pendentes.pop(future), future.result()
+                        chave = next(chaves, None)
+                        if chave is not None:
+                            pendentes[executor.submit(self.get_nfe_xml_by_chave, chave)] = chave
+            finally:
+                # Consumidor interrompido (ex.: tarefa cancelada): downloads ainda na fila não começam
+                for future in pendentes:
+                    future.cancel()
+    
+    def _parse_xmls(self, arquivos, workers):
+        """
+        Parseia (nome, bytes) e devolve (nome, NFeRecord ou None, erro) na ordem de entrada.
+
+        Com workers > 1 o parsing roda em um pool de processos; no máximo
+        workers * PARSE_QUEUE_PER_WORKER arquivos ficam em andamento, para
+        limitar a memória.
+        """
+        if workers <= 1:
+            for item in arquivos:
+                yield _parse_result(_parse_xml(item))
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            em_andamento = deque()
+            for item in arquivos:
+                em_andamento.append(executor.submit(_parse_xml, item))
+                if len(em_andamento) >= workers * PARSE_QUEUE_PER_WORKER:
+                    yield _parse_result(em_andamento.popleft().result())
+            while em_andamento:
+                yield _parse_result(em_andamento.popleft().result())
+
+    def _ingerir_xmls(self, arquivos, total, connection, workers=1, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+        """
+        Grava os XMLs com um único escritor em lotes (NFeBatchIngestor).
+
+        Args:
+            arquivos: Iterável de (nome, bytes do XML)
+            total (int): Quantidade de arquivos, para o progresso
+            connection: Conexão SQLAlchemy com o banco de destino
+            workers (int): Processos de parsing (1 = no próprio processo)
+            batch_size (int): NF-es por transação
+            progress (callable, optional): progress(processados, total, nome)
+
+        Returns:
+            dict: Resumo do NFeBatchIngestor, com o resultado de cada arquivo
+        """
+        progress = progress or _log_progress
+        ingestor = NFeBatchIngestor(connection, batch_size=batch_size)
+        processados = [0]
+        hashes = deque()
+
+        def avancar(nome):
+            processados[0] += 1
+            progress(processados[0], total, nome)
+
+        def nao_recebidos():
+            # O hash é conferido antes do parsing: cópias exatas nem chegam aos processos
+            for nome, conteudo in arquivos:
+                sha256 = document_hash(conteudo)
+                if ingestor.check_document(nome, sha256, len(conteudo)):
+                    avancar(nome)
+                    continue
+                hashes.append(sha256)
+                yield nome, conteudo
+
+        # _parse_xmls preserva a ordem, então os hashes saem da fila na mesma sequência
+        for nome, record, erro in self._parse_xmls(nao_recebidos(), workers):
+            sha256 = hashes.popleft()
+            if record is None:
+                ingestor.reject(nome, f"XML inválido: {erro}")
+            else:
+                ingestor.add_record(nome, record, sha256=sha256)
+            avancar(nome)
+        return ingestor.close()
+
+    def _baixar_zip(self, zip_url):
+        """
+        Baixa o ZIP em blocos para um arquivo temporário "spooled": fica em
+        memória até ZIP_SPOOL_MAX_SIZE e passa para o disco acima disso.
+
+        Returns:
+            SpooledTemporaryFile: Arquivo posicionado no início (o chamador fecha)
+        """
+        spool = tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_SIZE, suffix='.zip')
+        try:
+            with INGEST_STAGE_SECONDS.time(stage="download"), \
+                    self._request(zip_url, ENDPOINT_ZIP, stream=True) as zip_response:
+                for chunk in zip_response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    spool.write(chunk)
+            spool.seek(0)
+            return spool
+        except Exception:
+            spool.close()
+            raise
+
+    def _membros_xml(self, zip_ref, membros):
+        """
+        Percorre os XMLs do ZIP sem extrair nada para o disco.
+
+        Cada membro é lido com ZipFile.open() só quando é pedido, de modo que
+        apenas os XMLs em andamento ficam em memória.
+        """
+        for info in membros:
+            nome = os.path.basename(info.filename)
+            with INGEST_STAGE_SECONDS.time(stage="unzip"), zip_ref.open(info) as membro:
+                conteudo = membro.read()
+            yield nome, conteudo
+
+    def baixar_e_processar_xmls(self, data_inicio, data_fim, db_path=None,
+                                workers=1, batch_size=DEFAULT_BATCH_SIZE, progress=None,
+                                incremental=False):
         """
         Baixa XMLs do Mainô e processa automaticamente
         
         Args:
             data_inicio (str): Data de início no formato DD/MM/AAAA
             data_fim (str): Data de fim no formato DD/MM/AAAA
-            db_path (str): Caminho para o banco de dados
+            db_path (str, optional): Banco SQLite avulso; por padrão, o banco do app
+            workers (int): Processos usados no parsing dos XMLs (1 = serial)
+            batch_size (int): NF-es gravadas por transação
+            progress (callable, optional): progress(processados, total, nome)
+            incremental (bool): Começa na marca d'água salva em sync_state (se
+                for posterior a data_inicio) e a avança ao final
         
         Returns:
             dict: Resultado do processamento
         """
+        with connect(db_path) as connection:
+            return self._baixar_e_processar_xmls(
+                connection, data_inicio, data_fim, workers, batch_size, progress, incremental
+            )
+
+    def _baixar_e_processar_xmls(self, connection, data_inicio, data_fim, workers, batch_size, progress, incremental):
+        watermark = None
+        if incremental:
+            inicio = datetime.strptime(data_inicio, "%d/%m/%Y").date()
+            fim = datetime.strptime(data_fim, "%d/%m/%Y").date()
+            with connection.begin():
+                watermark = get_watermark(connection, self.conta, ENDPOINT_EXPORTACAO)
+            if watermark and watermark > inicio:
+                # O dia da marca é exportado de novo: notas emitidas depois da última execução
+                inicio = min(watermark, fim)
+                data_inicio = inicio.strftime("%d/%m/%Y")
+        
         # Exportar XMLs
         zip_url = self.exportar_xmls_nfes_emitidas(data_inicio, data_fim)
         
@@ -104,47 +422,151 @@ class MainoAPI:
             return {"success": False, "message": "Erro ao obter URL do ZIP"}
         
         try:
-            # Baixar o arquivo ZIP
-            zip_response = requests.get(zip_url)
-            zip_response.raise_for_status()
-            
-            # Salvar temporariamente
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.zip') as temp_zip:
-                temp_zip.write(zip_response.content)
-                temp_zip_path = temp_zip.name
-            
-            # Extrair e processar XMLs
-            processed_count = 0
-            errors = []
-            
-            with zipfile.ZipFile(temp_zip_path, 'r') as zip_ref:
-                # Criar diretório temporário para extração
-                with tempfile.TemporaryDirectory() as temp_dir:
-                    zip_ref.extractall(temp_dir)
+            # Baixar o arquivo ZIP em blocos, sem carregá-lo inteiro na memória
+            with self._baixar_zip(zip_url) as zip_file:
+                # Ler os XMLs direto do ZIP, membro a membro
+                with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+                    membros = [
+                        info for info in zip_ref.infolist()
+                        if not info.is_dir() and info.filename.lower().endswith('.xml')
+                    ]
+                    # Arquivos nomeados pela chave de acesso já importada nem são lidos
+                    chaves = {info: _chave_no_nome(info.filename) for info in membros}
+                    with connection.begin():
+                        conhecidas = known_keys(connection, chaves.values())
+                    membros = [info for info in membros if chaves[info] not in conhecidas]
                     
-                    # Processar cada arquivo XML
-                    for filename in os.listdir(temp_dir):
-                        if filename.lower().endswith('.xml'):
-                            xml_path = os.path.join(temp_dir, filename)
-                            try:
-                                insert_nfe_data(xml_path, db_path)
-                                processed_count += 1
-                            except Exception as e:
-                                errors.append(f"Erro ao processar {filename}: {str(e)}")
-            
-            # Limpar arquivo ZIP temporário
-            os.unlink(temp_zip_path)
+                    resumo = self._ingerir_xmls(
+                        self._membros_xml(zip_ref, membros), len(membros), connection,
+                        workers=workers, batch_size=batch_size, progress=progress
+                    )
             
+            processed_count = resumo["importados"]
+            errors = [
+                f"Erro ao processar {r['arquivo']}: {r['erro']}"
+                for r in resumo["arquivos"] if r["status"] == STATUS_ERRO
+            ]
+
+            # A marca só avança se o período sincronizado emenda com ela e nenhum
+            # XML falhou (parsing ou gravação): senão a nota ficaria antes da marca
+            if incremental and not errors and (watermark is None or inicio <= watermark):
+                with connection.begin():
+                    set_watermark(connection, self.conta, ENDPOINT_EXPORTACAO, fim)
             return {
                 "success": True,
                 "processed_count": processed_count,
+                "duplicate_count": resumo["duplicados"],
+                "cache_hits": resumo["cache_acertos"],
+                "skipped_count": len(chaves) - len(membros),
                 "errors": errors,
                 "message": f"Processados {processed_count} XMLs com sucesso"
             }
             
         except Exception as e:
+            logging.exception("Erro ao processar XMLs exportados do Mainô")
             return {"success": False, "message": f"Erro ao processar XMLs: {str(e)}"}
 
+    def sincronizar_por_chave(self, connection, data_inicio, data_fim, completo=False,
+                              batch_size=DEFAULT_BATCH_SIZE, max_workers=None, progress=None):
+        """
+        Lista as NF-es do período e grava o XML de cada chave ainda não importada.
+
+        Começa na marca d'água de ENDPOINT_NOTAS (salvo com completo=True); os
+        XMLs são baixados em paralelo e gravados em lotes conforme chegam. A
+        marca só avança se nenhuma nota falhar no download, no parsing ou na
+        gravação.
+
+        Args:
+            connection: Conexão SQLAlchemy com o banco de destino
+            data_inicio (datetime): Início da janela (quando não há marca)
+            data_fim (datetime): Fim da janela
+            completo (bool): Ignora a marca d'água e relista toda a janela
+            batch_size (int): NF-es por transação
+            max_workers (int, optional): Downloads simultâneos
+            progress (callable, optional): progress(processados, total, chave)
+
+        Returns:
+            dict: Resumo (resposta de /api/sincronizar-maino) ou
+                {"sucesso": False, "erro": ...} se a listagem falhar
+        """
+        with connection.begin():
+            watermark = get_watermark(connection, self.conta, ENDPOINT_NOTAS)
+        if watermark and not completo:
+            # Continua da última sincronização; o próprio dia é relistado
+            data_inicio = datetime.combine(watermark, datetime.min.time())
+        resultado_nfes = self.get_nfes_emitidas(data_inicio, data_fim)
+
+        if not resultado_nfes["sucesso"]:
+            return resultado_nfes
+
+        nfes_para_processar = resultado_nfes["nfes"]
+        erros = []
+        chaves = []
+        for nfe_item in nfes_para_processar:
+            chave_acesso = nfe_item.get("chaveAcesso")
+            if not chave_acesso:
+                erros.append(f"NF-e sem chave de acesso: {nfe_item.get('numero')}")
+                continue
+            chaves.append(chave_acesso)
+
+        # Chaves já importadas não são baixadas de novo
+        with connection.begin():
+            conhecidas = known_keys(connection, chaves)
+        chaves = [chave for chave in chaves if chave not in conhecidas]
+
+        progress = progress or _log_progress
+        # Notas baixadas, parseadas ou gravadas sem sucesso
+        falhas = 0
+        saidas = {}
+        ingestor = NFeBatchIngestor(connection, batch_size=batch_size)
+        for processados, (chave_acesso, resultado_xml) in enumerate(
+                self.buscar_xmls_por_chave(chaves, max_workers=max_workers), 1):
+            if not resultado_xml["sucesso"]:
+                falhas += 1
+                erros.append(f"Erro ao buscar XML da NF-e {chave_acesso}: {resultado_xml['erro']}")
+            else:
+                xml_content = resultado_xml["xml_content"]
+                sha256 = document_hash(xml_content)
+                if not ingestor.check_document(chave_acesso, sha256, len(xml_content)):
+                    try:
+                        with INGEST_STAGE_SECONDS.time(stage="parse"):
+                            record = parse_nfe_record(xml_content, is_file=False)
+                    except Exception as e:
+                        falhas += 1
+                        erros.append(f"Erro ao processar NF-e {chave_acesso}: {str(e)}")
+                    else:
+                        saidas[chave_acesso] = bool(record.products) and record.products[0].CFOP[:1] in ('5', '6')
+                        ingestor.add_record(chave_acesso, record, sha256=sha256)
+            progress(processados, len(chaves), chave_acesso)
+        resumo = ingestor.close()
+
+        xmls_processados = nfes_saida = nfes_entrada = 0
+        for result in resumo["arquivos"]:
+            if result["status"] == STATUS_IMPORTADO:
+                xmls_processados += 1
+                if saidas[result["arquivo"]]:
+                    nfes_saida += 1
+                else:
+                    nfes_entrada += 1
+            elif result["status"] == STATUS_ERRO:
+                falhas += 1
+                erros.append(f"Erro ao processar NF-e {result['arquivo']}: {result['erro']}")
+
+        # Com alguma falha a marca fica parada, para a nota ser buscada de novo
+        if falhas == 0:
+            with connection.begin():
+                set_watermark(connection, self.conta, ENDPOINT_NOTAS, data_fim.date())
+
+        return {
+            "sucesso": True,
+            "nfes_encontradas": len(nfes_para_processar),
+            "nfes_ja_importadas": len(conhecidas),
+            "nfes_processadas": xmls_processados,
+            "nfes_saida": nfes_saida,
+            "nfes_entrada": nfes_entrada,
+            "erros": erros
+        }
+
 # Exemplo de uso
 def exemplo_uso():
     """Exemplo de como usar a integração com o Mainô"""
@@ -0,0 +1,220 @@
+"""
+Métricas do processo no formato texto do Prometheus (GET /metrics).
+
+Contadores e histogramas simples, sem dependência externa, no mesmo espírito
+de DOCUMENT_CACHE_STATS: cada observação é uma soma sob um lock, barata o
+bastante para ficar nos caminhos quentes (uma requisição, um lote gravado,
+um XML parseado). Os valores são por processo; com vários workers do
+gunicorn, o Prometheus agrega as séries de cada um.
+
+    with INGEST_STAGE_SECONDS.time(stage="parse"):
+        record = parse_nfe_record(conteudo, is_file=False)
+    INGEST_ROWS.inc(len(item_rows), table="nfe_item")
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Limites (em segundos) dos histogramas de latência
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_pairs(nomes, valores):
+    return ",".join(f'{nome}="{_escape(valor)}"' for nome, valor in zip(nomes, valores))
+
+
+def _escape(valor):
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(valor):
+    if valor == float("inf"):
+        return "+Inf"
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor)
+
+
+class _Metric:
+    tipo = None
+
+    def __init__(self, nome, descricao, labels=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _chave(self, labels):
+        # Labels em ordem fixa: a chave da série é a tupla dos valores
+        return tuple(str(labels[nome]) for nome in self.labels)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} {self.tipo}"]
+        with self._lock:
+            series = sorted(self._series.items())
+            linhas.extend(self._linhas(series))
+        return linhas
+
+
+class Counter(_Metric):
+    """Contador que só cresce (documentos importados, requisições...)."""
+    tipo = "counter"
+
+    def inc(self, valor=1, **labels):
+        chave = self._chave(labels)
+        with self._lock:
+            self._series[chave] = self._series.get(chave, 0) + valor
+
+    def value(self, **labels):
+        with self._lock:
+            return self._series.get(self._chave(labels), 0)
+
+    def _linhas(self, series):
+        for chave, valor in series:
+            rotulos = _label_pairs(self.labels, chave)
+            yield f"{self.nome}{{{rotulos}}} {_format(valor)}" if rotulos else f"{self.nome} {_format(valor)}"
+
+
+class Histogram(_Metric):
+    """Distribuição de durações em buckets cumulativos, com soma e contagem."""
+    tipo = "histogram"
+
+    def __init__(self, nome, descricao, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(nome, descricao, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, valor, **labels):
+        chave = self._chave(labels)
+        # Índice do primeiro bucket que comporta o valor (len = só no +Inf)
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observa a duração do bloco (também quando ele levanta exceção)."""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - inicio, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            serie = self._series.get(self._chave(labels))
+            return serie[2] if serie else 0
+
+    def _linhas(self, series):
+        for chave, (contagens, soma, total) in series:
+            rotulos = _label_pairs(self.labels, chave)
+            prefixo = rotulos + "," if rotulos else ""
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + (float("inf"),), contagens):
+                acumulado += contagem
+                yield f'{self.nome}_bucket{{{prefixo}le="{_format(float(limite))}"}} {acumulado}'
+            sufixo = f"{{{rotulos}}}" if rotulos else ""
+            yield f"{self.nome}_sum{sufixo} {_format(soma)}"
+            yield f"{self.nome}_count{sufixo} {total}"
+
+
+class Gauge(_Metric):
+    """
+    Valor instantâneo lido na hora da coleta.
+
+    callback() devolve uma lista de (dict de labels, valor); assim o estado
+    (pool de conexões, caches) não precisa ser copiado a cada alteração.
+    """
+    tipo = "gauge"
+
+    def __init__(self, nome, descricao, labels=(), callback=None):
+        super().__init__(nome, descricao, labels)
+        self.callback = callback
+
+    def render(self):
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} {self.tipo}"]
+        for labels, valor in self.callback() if self.callback else ():
+            rotulos = _label_pairs(self.labels, self._chave(labels))
+            linhas.append(f"{self.nome}{{{rotulos}}} {_format(valor)}" if rotulos else f"{self.nome} {_format(valor)}")
+        return linhas
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.nome in self._metrics:
+                raise ValueError(f"Métrica já registrada: {metric.nome}")
+            self._metrics[metric.nome] = metric
+        return metric
+
+    def counter(self, nome, descricao, labels=()):
+        return self.register(Counter(nome, descricao, labels))
+
+    def histogram(self, nome, descricao, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(nome, descricao, labels, buckets))
+
+    def gauge(self, nome, descricao, labels=(), callback=None):
+        return self.register(Gauge(nome, descricao, labels, callback))
+
+    def reset(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def render(self):
+        """Texto da exposição (formato 0.0.4), uma métrica após a outra."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        linhas = []
+        for metric in metrics:
+            linhas.extend(metric.render())
+        return "\n".join(linhas) + "\n"
+
+
+REGISTRY = Registry()
+
+# Requisições HTTP, por regra de rota (/api/estoque/por-cliente/<cnpj_cliente>),
+# não pela URL, para não criar uma série por parâmetro
+HTTP_REQUESTS = REGISTRY.counter(
+    "opme_http_requests_total", "Requisições HTTP atendidas", ("method", "route", "status")
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "opme_http_request_duration_seconds",
+    "Tempo até a resposta (em streaming, até o primeiro bloco)", ("method", "route")
+)
+
+# Etapas da importação: download, unzip, parse, db_write e commit
+INGEST_STAGE_SECONDS = REGISTRY.histogram(
+    "opme_ingest_stage_seconds", "Duração de cada etapa da importação de NF-e", ("stage",)
+)
+INGEST_DOCUMENTS = REGISTRY.counter(
+    "opme_ingest_documents_total", "XMLs de NF-e recebidos, por resultado", ("status",)
+)
+INGEST_ROWS = REGISTRY.counter(
+    "opme_ingest_rows_total", "Linhas gravadas pela importação, por tabela", ("table",)
+)
+
+# Chamadas à API do Mainô (cada tentativa conta; status "erro" = falha de conexão/timeout)
+MAINO_REQUESTS = REGISTRY.counter(
+    "opme_maino_requests_total", "Requisições à API do Mainô", ("endpoint", "status")
+)
+MAINO_REQUEST_SECONDS = REGISTRY.histogram(
+    "opme_maino_request_duration_seconds", "Latência das requisições à API do Mainô", ("endpoint",)
+)
@@ -1,27 +1,221 @@
 from ..extensions import db
 
+class Cliente(db.Model):
+    """
+    Participante das NF-es (destinatário ou emitente), um por CNPJ, com o
+    nome mais recente recebido. Mantida por src/dimensions.py.
+    """
+    __tablename__ = 'cliente'
+    __table_args__ = (
+        db.Index('ux_cliente_CNPJ', 'CNPJ', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    CNPJ = db.Column(db.String(14), nullable=False)
+    xNome = db.Column(db.String(100), nullable=False)
+
+class Produto(db.Model):
+    """Produto por código (cProd), com a descrição mais recente recebida. Mantida por src/dimensions.py."""
+    __tablename__ = 'produto'
+    __table_args__ = (
+        db.Index('ux_produto_cProd', 'cProd', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    cProd = db.Column(db.String(20), nullable=False)
+    xProd = db.Column(db.String(100), nullable=False)
+
 class NFeHeader(db.Model):
     __tablename__ = 'nfe_header'
+    __table_args__ = (
+        db.Index('ux_nfe_header_chNFe', 'chNFe', unique=True),
+        db.Index('ix_nfe_header_cliente_id_dEmi', 'cliente_id', 'dEmi'),
+        db.Index('ix_nfe_header_nNF', 'nNF'),
+        db.Index('ix_nfe_header_dEmi', 'dEmi'),
+    )
     id = db.Column(db.Integer, primary_key=True)
+    # Chave de acesso (44 dígitos); nula em notas importadas antes da coluna existir
+    chNFe = db.Column(db.String(44))
     nNF = db.Column(db.String(20), nullable=False)
     dEmi = db.Column(db.Date, nullable=False)
-    CNPJ_emit = db.Column(db.String(14), nullable=False)
-    xNome_emit = db.Column(db.String(100), nullable=False)
-    CNPJ_dest = db.Column(db.String(14), nullable=False)
-    xNome_dest = db.Column(db.String(100), nullable=False)
+    # CNPJ e nome do emitente e do destinatário ficam em cliente
+    emitente_id = db.Column(db.Integer, db.ForeignKey('cliente.id', name='fk_nfe_header_emitente_id'), nullable=False)
+    cliente_id = db.Column(db.Integer, db.ForeignKey('cliente.id', name='fk_nfe_header_cliente_id'), nullable=False)
 
 class NFeItem(db.Model):
     __tablename__ = 'nfe_item'
+    __table_args__ = (
+        db.Index('ix_nfe_item_nfe_id', 'nfe_id'),
+        db.Index('ix_nfe_item_produto_id', 'produto_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    nfe_header_id = db.Column(db.Integer, db.ForeignKey('nfe_header.id'), nullable=False)
-    cProd = db.Column(db.String(20), nullable=False)
-    xProd = db.Column(db.String(100), nullable=False)
+    # A coluna física se chama nfe_id, como em database_setup.py
+    nfe_header_id = db.Column('nfe_id', db.Integer, db.ForeignKey('nfe_header.id'), nullable=False)
+    # cProd e xProd ficam em produto
+    produto_id = db.Column(db.Integer, db.ForeignKey('produto.id', name='fk_nfe_item_produto_id'), nullable=False)
     CFOP = db.Column(db.String(4), nullable=False)
-    uCom = db.Column(db.String(10), nullable=False)
-    qCom = db.Column(db.Float, nullable=False)
-    vUnCom = db.Column(db.Float, nullable=False)
+    # Inteiros escalados (src/fixed_point.py): qCom em 1/10000 da unidade,
+    # vUnCom com 10 casas e vProd em centavos
+    qCom = db.Column(db.BigInteger, nullable=False)
+    vUnCom = db.Column(db.BigInteger, nullable=False)
+    vProd = db.Column(db.BigInteger, nullable=False)
+
+class LoteInfo(db.Model):
+    __tablename__ = 'lote_info'
+    __table_args__ = (
+        db.Index('ix_lote_info_nfe_item_id', 'nfe_item_id'),
+        db.Index('ix_lote_info_dVal', 'dVal'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    nfe_item_id = db.Column(db.Integer, db.ForeignKey('nfe_item.id'), nullable=False)
     nLote = db.Column(db.String(20))
-    qLote = db.Column(db.Float)
+    # 1/10000 da unidade, como nfe_item.qCom
+    qLote = db.Column(db.BigInteger)
+    # Nulas quando o rastro não traz a data (ou ela não está no formato AAAA-MM-DD)
+    dFab = db.Column(db.Date)
+    dVal = db.Column(db.Date)
+
+class SaldoConsignacao(db.Model):
+    """
+    Razão de saldos em consignação, atualizado a cada NF-e importada. As
+    chaves são as das dimensões; CNPJ, código e nomes vêm de cliente e produto.
+    """
+    __tablename__ = 'saldo_consignacao'
+    __table_args__ = (
+        # Só as chaves com material em aberto (saldo exato: zerado é 0)
+        db.Index(
+            'ix_saldo_consignacao_aberto', 'cliente_id', 'produto_id', 'nLote',
+            sqlite_where=db.text('saldo <> 0'), postgresql_where=db.text('saldo <> 0')
+        ),
+    )
+    cliente_id = db.Column(db.Integer, primary_key=True)
+    produto_id = db.Column(db.Integer, primary_key=True)
+    nLote = db.Column(db.String(20), primary_key=True)
+    saldo = db.Column(db.BigInteger, nullable=False, default=0)
+
+class SaldoCheckpoint(db.Model):
+    """
+    Saldo acumulado por (cliente_id, produto_id, nLote) ao fim de cada
+    período: todas as NF-es com dEmi <= data_corte. Mantido por src/checkpoints.py.
+    """
+    __tablename__ = 'saldo_checkpoint'
+    data_corte = db.Column(db.Date, primary_key=True)
+    cliente_id = db.Column(db.Integer, primary_key=True)
+    produto_id = db.Column(db.Integer, primary_key=True)
+    nLote = db.Column(db.String(20), primary_key=True)
+    saldo = db.Column(db.BigInteger, nullable=False, default=0)
+
+class FifoCamada(db.Model):
+    """
+    Remessa em consignação ainda não devolvida (quantidade > 0) ou retorno
+    sem remessa em aberto (< 0), na fila FIFO da chave. Mantida por src/fifo.py.
+    """
+    __tablename__ = 'fifo_camada'
+    __table_args__ = (
+        db.Index('ix_fifo_camada_chave', 'cliente_id', 'produto_id', 'nLote', 'dEmi', 'nfe_item_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    cliente_id = db.Column(db.Integer, nullable=False)
+    produto_id = db.Column(db.Integer, nullable=False)
+    nLote = db.Column(db.String(20), nullable=False)
+    dEmi = db.Column(db.Date, nullable=False)
+    nfe_item_id = db.Column(db.Integer, nullable=False)
+    quantidade = db.Column(db.BigInteger, nullable=False)
+
+class FifoChave(db.Model):
+    """Última emissão já casada em cada chave; notas anteriores a ela refazem a fila."""
+    __tablename__ = 'fifo_chave'
+    cliente_id = db.Column(db.Integer, primary_key=True)
+    produto_id = db.Column(db.Integer, primary_key=True)
+    nLote = db.Column(db.String(20), primary_key=True)
+    ultima_emissao = db.Column(db.Date, nullable=False)
+
+class FifoIdade(db.Model):
+    """Quantidade em aberto por cliente e dia de emissão (resumo do relatório de idade)."""
+    __tablename__ = 'fifo_idade'
+    cliente_id = db.Column(db.Integer, primary_key=True)
+    dEmi = db.Column(db.Date, primary_key=True)
+    # Remessas ainda não devolvidas
+    quantidade = db.Column(db.BigInteger, nullable=False, default=0)
+    # Retornos sem remessa em aberto
+    sem_remessa = db.Column(db.BigInteger, nullable=False, default=0)
+
+class SearchEntry(db.Model):
+    """
+    Cliente, produto ou lote para a busca por trecho (GET /api/search). Mantida
+    por src/search.py; o índice de trigramas sobre termo é criado pela
+    migração 0011 (FTS5 no SQLite, pg_trgm no PostgreSQL).
+    """
+    __tablename__ = 'search_entry'
+    __table_args__ = (
+        db.Index('ux_search_entry_chave', 'chave', 'tipo', 'dimensao_id', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    # CNPJ (cliente), cProd (produto) ou nLote (lote)
+    chave = db.Column(db.String(20), nullable=False)
+    tipo = db.Column(db.String(10), nullable=False)
+    # cliente.id (tipo cliente) ou produto.id (produto e lote); a descrição
+    # exibida vem da dimensão
+    dimensao_id = db.Column(db.Integer, nullable=False)
+    # Código e descrição normalizados (maiúsculas, sem acentos)
+    termo = db.Column(db.String(250), nullable=False)
+
+class CfopRule(db.Model):
+    """Efeito de cada CFOP no saldo de consignação (-1, 0 ou +1)."""
+    __tablename__ = 'cfop_rule'
+    CFOP = db.Column(db.String(4), primary_key=True)
+    sinal = db.Column(db.Integer, nullable=False)
+    descricao = db.Column(db.String(100))
+
+class IngestedDocument(db.Model):
+    """Hash (SHA-256) do conteúdo bruto de cada XML já recebido."""
+    __tablename__ = 'ingested_document'
+    __table_args__ = (
+        db.Index('ix_ingested_document_chNFe', 'chNFe'),
+    )
+    sha256 = db.Column(db.String(64), primary_key=True)
+    chNFe = db.Column(db.String(44))
+    criado_em = db.Column(db.DateTime, nullable=False)
+
+class DataGeneration(db.Model):
+    """Contador (linha única, id=1) incrementado a cada gravação de NF-es."""
+    __tablename__ = 'data_generation'
+    id = db.Column(db.Integer, primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+
+class SyncState(db.Model):
+    """Marca d'água da sincronização com o Mainô por conta e endpoint."""
+    __tablename__ = 'sync_state'
+    conta = db.Column(db.String(64), primary_key=True)
+    endpoint = db.Column(db.String(50), primary_key=True)
+    # Último dia (inclusive) sincronizado com sucesso
+    watermark = db.Column(db.Date, nullable=False)
+    atualizado_em = db.Column(db.DateTime, nullable=False)
+
+class IngestJob(db.Model):
+    """Tarefa em segundo plano (importação ou sincronização), executada por src/jobs.py."""
+    __tablename__ = 'ingest_job'
+    __table_args__ = (
+        db.Index('ix_ingest_job_status_prioridade', 'status', 'prioridade', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(30), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    # Menor valor sai primeiro (uploads interativos antes das sincronizações em lote)
+    prioridade = db.Column(db.Integer, nullable=False, default=0)
+    parametros = db.Column(db.Text)
+    # Credenciais da tarefa; nunca devolvidas pela API e apagadas ao terminar
+    credenciais = db.Column(db.Text)
+    progresso = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    mensagem = db.Column(db.String(200))
+    resultado = db.Column(db.Text)
+    erro = db.Column(db.Text)
+    cancelar = db.Column(db.Boolean, nullable=False, default=False)
+    worker = db.Column(db.String(100))
+    criado_em = db.Column(db.DateTime, nullable=False)
+    iniciado_em = db.Column(db.DateTime)
+    concluido_em = db.Column(db.DateTime)
+    # Atualizado periodicamente pelo worker; tarefas sem sinal voltam para a fila
+    heartbeat_em = db.Column(db.DateTime)
 
 class EstoqueConsignacao(db.Model):
     __tablename__ = 'estoque_consignacao'
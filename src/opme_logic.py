@@ -1,49 +1,167 @@
-import sqlite3
+from datetime import date, timedelta
 
-def get_opme_movements(db_name="opme_control.db", cnpj_cliente=None):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
+from sqlalchemy import text
 
+from src.connections import get_engine
+from src.search import rebuild_search_index
+
+# Lote usado nas chaves de saldo quando o item não tem rastro
+SEM_LOTE = "SEM_LOTE"
+
+# Conteúdo inicial da tabela cfop_rule (database_setup.py; a migração 0003
+# grava as mesmas regras). Os saldos leem os sinais sempre da tabela
+# (load_cfop_signs), nunca destas listas.
+
+# CFOPs de saída para consignação
+CFOP_SAIDA_CONSIGNACAO = ("5917", "6917")
+# CFOPs de retorno de consignação
+CFOP_RETORNO_CONSIGNACAO = ("1918", "2918")
+# CFOPs de retorno simbólico (utilizado)
+CFOP_RETORNO_SIMBOLICO = ("1919", "2919")
+# CFOPs de faturamento (venda)
+CFOP_FATURAMENTO = ("5114", "6114")
+
+# CFOP -> (sinal no saldo, descrição), para popular cfop_rule
+CFOP_RULES = {
+    **{cfop: (-1, "Saída para consignação") for cfop in CFOP_SAIDA_CONSIGNACAO},
+    **{cfop: (1, "Retorno de consignação") for cfop in CFOP_RETORNO_CONSIGNACAO},
+    **{cfop: (1, "Retorno simbólico (material utilizado)") for cfop in CFOP_RETORNO_SIMBOLICO},
+    **{cfop: (0, "Faturamento (venda)") for cfop in CFOP_FATURAMENTO},
+}
+
+# Upsert do razão de saldos, pelas chaves das dimensões (cliente_id,
+# produto_id, nLote); válido em SQLite (3.24+) e PostgreSQL e aceito tanto
+# pelo sqlite3 (parâmetros nomeados) quanto por sqlalchemy.text()
+UPSERT_SALDO_SQL = """
+    INSERT INTO saldo_consignacao (cliente_id, produto_id, "nLote", saldo)
+    VALUES (:cliente_id, :produto_id, :nLote, :saldo)
+    ON CONFLICT (cliente_id, produto_id, "nLote") DO UPDATE SET
+        saldo = saldo_consignacao.saldo + excluded.saldo
+"""
+
+# Geração dos dados: incrementada na mesma transação de toda gravação que
+# altera saldos/movimentações; invalida o cache de respostas de todos os processos
+BUMP_GENERATION_SQL = "UPDATE data_generation SET generation = generation + 1 WHERE id = 1"
+CURRENT_GENERATION_SQL = "SELECT generation FROM data_generation WHERE id = 1"
+
+# Uma linha por item na chave do saldo (cliente_id, produto_id, nLote), com
+# o sinal do CFOP (cfop_rule) já aplicado; quem usa acrescenta o WHERE
+# (colunas nh., ni. e li.). Base do recálculo do razão, das consultas de
+# saldo em uma data (as_of) e dos checkpoints de src/checkpoints.py
+SIGNED_MOVEMENTS_SQL = """
+    SELECT
+        nh.cliente_id,
+        ni.produto_id,
+        COALESCE(NULLIF(li."nLote", ''), 'SEM_LOTE') AS "nLote",
+        CASE
+            WHEN li."qLote" IS NOT NULL AND li."qLote" <> 0 THEN li."qLote"
+            ELSE ni."qCom"
+        END * COALESCE(cr.sinal, 0) AS saldo
+    FROM
+        nfe_header nh
+    JOIN
+        nfe_item ni ON nh.id = ni.nfe_id
+    LEFT JOIN
+        lote_info li ON ni.id = li.nfe_item_id
+    LEFT JOIN
+        cfop_rule cr ON cr."CFOP" = ni."CFOP"
+"""
+
+# Razão inteiro recalculado a partir dos itens (rebuild_ledger)
+REBUILD_SALDO_SQL = f"""
+    INSERT INTO saldo_consignacao (cliente_id, produto_id, "nLote", saldo)
+    SELECT cliente_id, produto_id, "nLote", SUM(saldo)
+    FROM ({SIGNED_MOVEMENTS_SQL}) movimentos
+    GROUP BY cliente_id, produto_id, "nLote"
+"""
+
+# CNPJ, código e nomes (os mais recentes) das linhas de saldo: só as
+# dimensões guardam esses textos
+SALDO_NOMES_SQL = """
+    SELECT c."CNPJ", c."xNome", p."cProd", p."xProd", saldos."nLote", saldos.saldo
+    FROM ({saldos}) saldos
+    JOIN cliente c ON c.id = saldos.cliente_id
+    JOIN produto p ON p.id = saldos.produto_id
+"""
+
+# Id do cliente/produto pela chave natural (índices únicos ux_cliente_CNPJ e
+# ux_produto_cProd): os filtros das agregações comparam os inteiros das notas
+CLIENTE_ID_SQL = '(SELECT id FROM cliente WHERE "CNPJ" = :cnpj)'
+PRODUTO_ID_SQL = '(SELECT id FROM produto WHERE "cProd" = :cProd)'
+
+CFOP_SIGNS_SQL = 'SELECT "CFOP", sinal FROM cfop_rule'
+
+# Data anterior a qualquer NF-e, usada quando ainda não há checkpoint
+INICIO_HISTORICO = "0001-01-01"
+
+def load_cfop_signs(connection):
+    """
+    Sinal de cada CFOP no saldo, lido de cfop_rule.
+
+    As agregações em SQL fazem o join com cfop_rule; o razão, os checkpoints
+    e as filas FIFO mantidos na importação usam este mapa, carregado uma vez
+    por importação, para seguir as mesmas regras. CFOPs fora da tabela têm
+    sinal 0.
+
+    Returns:
+        dict: CFOP -> sinal (-1 saída em consignação, +1 retorno, 0 sem efeito)
+    """
+    return dict(connection.execute(text(CFOP_SIGNS_SQL)).all())
+
+def get_cfop_signs(db_name=None):
+    """load_cfop_signs pelo pool somente leitura."""
+    with get_engine(db_name, readonly=True).connect() as conn:
+        return load_cfop_signs(conn)
+
+def get_opme_movements(db_name=None, cnpj_cliente=None):
+    """
+    Movimentações item a item, pelo pool somente leitura.
+
+    Args:
+        db_name (str, optional): Banco SQLite avulso; por padrão, o banco do app
+        cnpj_cliente (str, optional): CNPJ do destinatário
+    """
     query = """
         SELECT
-            nh.nNF,
-            nh.dEmi,
-            nh.CNPJ_dest,
-            nh.xNome_dest,
-            ni.cProd,
-            ni.xProd,
-            ni.CFOP,
-            ni.qCom,
-            li.nLote,
-            li.qLote
+            nh."nNF",
+            nh."dEmi",
+            c."CNPJ",
+            c."xNome",
+            p."cProd",
+            p."xProd",
+            ni."CFOP",
+            ni."qCom",
+            li."nLote",
+            li."qLote"
         FROM
             nfe_header nh
         JOIN
             nfe_item ni ON nh.id = ni.nfe_id
+        JOIN
+            cliente c ON c.id = nh.cliente_id
+        JOIN
+            produto p ON p.id = ni.produto_id
         LEFT JOIN
             lote_info li ON ni.id = li.nfe_item_id
     """
-    params = []
+    params = {}
 
     if cnpj_cliente:
-        query += " WHERE nh.CNPJ_dest = ?"
-        params.append(cnpj_cliente)
+        query += f' WHERE nh.cliente_id = {CLIENTE_ID_SQL}'
+        params["cnpj"] = cnpj_cliente
+
+    with get_engine(db_name, readonly=True).connect() as conn:
+        return [tuple(row) for row in conn.execute(text(query), params)]
 
-    cursor.execute(query, params)
-    movements = cursor.fetchall()
-    conn.close()
-    return movements
+def calculate_balance(movements, sinais):
+    """
+    Saldo por movimentação (get_opme_movements), com os sinais de cfop_rule.
 
-def calculate_balance(movements):
+    Args:
+        movements (list): Linhas de get_opme_movements
+        sinais (dict): CFOP -> sinal (load_cfop_signs/get_cfop_signs)
+    """
     balance = {}
-    # CFOPs de saída para consignação
-    cfop_saida_consignacao = ["5917", "6917"]
-    # CFOPs de retorno de consignação
-    cfop_retorno_consignacao = ["1918", "2918"]
-    # CFOPs de retorno simbólico (utilizado)
-    cfop_retorno_simbolico = ["1919", "2919"]
-    # CFOPs de faturamento (venda)
-    cfop_faturamento = ["5114", "6114"]
 
     for movement in movements:
         nNF, dEmi, CNPJ_dest, xNome_dest, cProd, xProd, CFOP, qCom, nLote, qLote_lote_info = movement
@@ -51,21 +169,380 @@ def calculate_balance(movements):
         # Usar qCom do item da NF, se qLote da lote_info não estiver disponível ou for 0
         quantity = qLote_lote_info if qLote_lote_info else qCom
 
-        key = (CNPJ_dest, xNome_dest, cProd, xProd, nLote if nLote else "SEM_LOTE")
+        key = (CNPJ_dest, xNome_dest, cProd, xProd, nLote if nLote else SEM_LOTE)
 
         if key not in balance:
-            balance[key] = 0.0
+            balance[key] = 0
 
-        if CFOP in cfop_saida_consignacao:
-            balance[key] -= quantity
-        elif CFOP in cfop_retorno_consignacao or CFOP in cfop_retorno_simbolico:
-            balance[key] += quantity
-        # CFOPs de faturamento (5114, 6114) não afetam o saldo de consignação diretamente
-        # pois representam a venda do material que já estava em consignação.
-        # O controle de saldo aqui é sobre o que está em posse do cliente.
+        # Faturamento (sinal 0) não altera o saldo: é a venda do material que já
+        # estava em consignação. O controle de saldo aqui é sobre o que está em posse do cliente.
+        balance[key] += sinais.get(CFOP, 0) * quantity
 
     return balance
 
+def item_quantity(product):
+    """Quantidade (escalada) de um item parseado: qLote quando o item tem lote, qCom caso contrário."""
+    lote = product.lote_info
+    qLote = lote.qLote if lote.nLote else None
+    return qLote if qLote else product.qCom
+
+def ledger_deltas(record, sinais, cliente_ids, produto_ids):
+    """
+    Variações de saldo de uma NF-e parseada, por (cliente_id, produto_id, nLote).
+
+    Segue as mesmas regras de calculate_balance: a quantidade é qLote quando
+    o item tem lote e qCom caso contrário, com o sinal do CFOP em `sinais`
+    (load_cfop_signs).
+
+    Args:
+        record (NFeRecord): NF-e parseada
+        sinais (dict): CFOP -> sinal de cfop_rule
+        cliente_ids (dict): CNPJ -> cliente.id (DimensionCache.resolve)
+        produto_ids (dict): cProd -> produto.id
+
+    Returns:
+        dict: chave -> variação
+    """
+    deltas = {}
+    cliente_id = cliente_ids[record.CNPJ_dest]
+    for product in record.products:
+        key = (cliente_id, produto_ids[product.cProd], product.lote_info.nLote or SEM_LOTE)
+        deltas[key] = deltas.get(key, 0) + sinais.get(product.CFOP, 0) * item_quantity(product)
+    return deltas
+
+def merge_ledger_deltas(target, deltas):
+    """Acumula deltas (de ledger_deltas) em target."""
+    for key, delta in deltas.items():
+        target[key] = target.get(key, 0) + delta
+    return target
+
+def ledger_rows(deltas):
+    """Converte deltas em parâmetros nomeados para UPSERT_SALDO_SQL."""
+    return [{
+        "cliente_id": cliente_id,
+        "produto_id": produto_id,
+        "nLote": nLote,
+        "saldo": delta
+    } for (cliente_id, produto_id, nLote), delta in deltas.items()]
+
+def update_ledger(connection, deltas, primeira_nfe_id):
+    """
+    Soma ao razão as variações das NF-es recém-gravadas (mesma transação do insert).
+
+    Args:
+        connection: Conexão SQLAlchemy (a transação fica com o chamador)
+        deltas (dict): chave -> variação (ledger_deltas/merge_ledger_deltas)
+        primeira_nfe_id (int): Menor id de nfe_header do lote gravado; em um
+            banco com notas anteriores e razão ainda vazio (saldo_consignacao
+            criada vazia por `flask db upgrade`), o razão é recalculado de uma
+            vez com REBUILD_SALDO_SQL, que já inclui as notas do lote
+    """
+    if not deltas:
+        return
+    if connection.execute(text("SELECT 1 FROM saldo_consignacao LIMIT 1")).first() is None and connection.execute(
+        text("SELECT 1 FROM nfe_header WHERE id < :id LIMIT 1"), {"id": primeira_nfe_id}
+    ).first() is not None:
+        connection.execute(text(REBUILD_SALDO_SQL))
+        return
+    connection.execute(text(UPSERT_SALDO_SQL), ledger_rows(deltas))
+
+def balance_query(cnpj_cliente=None, codigo_produto=None, lote=None,
+                  data_inicio=None, data_fim=None, from_ledger=None, as_of=None, em_aberto=False):
+    """
+    Monta o SQL de saldo por (CNPJ_dest, cProd, nLote), agregado no banco.
+
+    Sem filtro de período a leitura vem do razão saldo_consignacao. Com
+    período, os itens são agregados com GROUP BY/SUM pelas chaves inteiras
+    (cliente_id, produto_id, lote), usando o sinal de cada CFOP na tabela
+    cfop_rule. Com as_of, o saldo em uma data parte do checkpoint mais
+    recente até ela (saldo_checkpoint) e soma só as movimentações
+    posteriores ao corte. Em todos os casos CNPJ, código e nomes (os mais
+    recentes) vêm das dimensões cliente e produto, só para as linhas
+    agregadas, que são as únicas que saem do banco. O SQL usa parâmetros nomeados e serve tanto
+    para o sqlite3 quanto para sqlalchemy.text().
+
+    Os saldos são inteiros escalados (src/fixed_point.py), exatos: um saldo
+    zerado é 0. Com em_aberto, o razão é lido pelo índice parcial
+    ix_saldo_consignacao_aberto e as agregações descartam as somas zeradas
+    no próprio banco (HAVING).
+
+    Args:
+        cnpj_cliente (str, optional): CNPJ do destinatário
+        codigo_produto (str, optional): Código do produto (cProd)
+        lote (str, optional): Número do lote (SEM_LOTE para itens sem rastro)
+        data_inicio (str, optional): Data inicial de emissão (AAAA-MM-DD)
+        data_fim (str, optional): Data final de emissão (AAAA-MM-DD)
+        from_ledger (bool, optional): Força (ou impede) a leitura do razão
+        as_of (str, optional): Saldo ao fim deste dia (AAAA-MM-DD), inclusive;
+            só as chaves com saldo diferente de zero
+        em_aberto (bool): Só as chaves com saldo diferente de zero
+
+    Returns:
+        tuple: (sql, params); as linhas são
+            (CNPJ_dest, xNome_dest, cProd, xProd, nLote, saldo)
+    """
+    if as_of:
+        try:
+            date.fromisoformat(as_of)
+        except (TypeError, ValueError):
+            raise ValueError("as_of deve ser uma data no formato AAAA-MM-DD")
+        if data_inicio or data_fim or from_ledger:
+            raise ValueError("as_of não pode ser combinado com período nem com o razão")
+        return _as_of_query(as_of, cnpj_cliente, codigo_produto, lote)
+
+    if from_ledger is None:
+        from_ledger = not (data_inicio or data_fim)
+    if from_ledger and (data_inicio or data_fim):
+        raise ValueError("O razão de saldos não pode ser filtrado por período")
+
+    conditions = []
+    params = {}
+
+    if from_ledger:
+        query = """
+            SELECT cliente_id, produto_id, "nLote", saldo
+            FROM saldo_consignacao
+        """
+        filters = {
+            "cnpj": f"cliente_id = {CLIENTE_ID_SQL}",
+            "cProd": f"produto_id = {PRODUTO_ID_SQL}",
+            "nLote": '"nLote" = :nLote'
+        }
+    else:
+        query = """
+            SELECT
+                nh.cliente_id,
+                ni.produto_id,
+                COALESCE(NULLIF(li."nLote", ''), 'SEM_LOTE') AS "nLote",
+                SUM(CASE
+                    WHEN li."qLote" IS NOT NULL AND li."qLote" <> 0 THEN li."qLote"
+                    ELSE ni."qCom"
+                END * COALESCE(cr.sinal, 0)) AS saldo
+            FROM
+                nfe_header nh
+            JOIN
+                nfe_item ni ON nh.id = ni.nfe_id
+            LEFT JOIN
+                lote_info li ON ni.id = li.nfe_item_id
+            LEFT JOIN
+                cfop_rule cr ON cr."CFOP" = ni."CFOP"
+        """
+        filters = {
+            "cnpj": f"nh.cliente_id = {CLIENTE_ID_SQL}",
+            "cProd": f"ni.produto_id = {PRODUTO_ID_SQL}",
+            "nLote": "COALESCE(NULLIF(li.\"nLote\", ''), 'SEM_LOTE') = :nLote"
+        }
+
+    if from_ledger and em_aberto:
+        # Mesma condição do índice parcial, para o planejador poder usá-lo
+        conditions.append("saldo <> 0")
+    if cnpj_cliente:
+        conditions.append(filters["cnpj"])
+        params["cnpj"] = cnpj_cliente
+    if codigo_produto:
+        conditions.append(filters["cProd"])
+        params["cProd"] = codigo_produto
+    if lote:
+        conditions.append(filters["nLote"])
+        params["nLote"] = lote
+    if data_inicio:
+        conditions.append('nh."dEmi" >= :data_inicio')
+        params["data_inicio"] = data_inicio
+    if data_fim:
+        conditions.append('nh."dEmi" <= :data_fim')
+        params["data_fim"] = data_fim
+
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if not from_ledger:
+        query += """
+            GROUP BY nh.cliente_id, ni.produto_id, COALESCE(NULLIF(li."nLote", ''), 'SEM_LOTE')
+        """
+        if em_aberto:
+            query += """
+            HAVING SUM(CASE
+                WHEN li."qLote" IS NOT NULL AND li."qLote" <> 0 THEN li."qLote"
+                ELSE ni."qCom"
+            END * COALESCE(cr.sinal, 0)) <> 0
+            """
+    query = SALDO_NOMES_SQL.format(saldos=query) + " ORDER BY 1, 3, 5"
+    return query, params
+
+def _as_of_query(as_of, cnpj_cliente=None, codigo_produto=None, lote=None):
+    """
+    Saldo em as_of: checkpoint mais recente até a data + movimentações depois
+    do corte. Só as chaves com saldo diferente de zero: os checkpoints não
+    guardam saldos zerados, e o resultado não depende de onde cai o corte.
+    """
+    corte = "(SELECT MAX(data_corte) FROM saldo_checkpoint WHERE data_corte <= :as_of)"
+    checkpoint_conditions = [f"sc.data_corte = {corte}"]
+    movement_conditions = [
+        'nh."dEmi" <= :as_of',
+        f'nh."dEmi" > COALESCE({corte}, :inicio)'
+    ]
+    params = {"as_of": as_of, "inicio": INICIO_HISTORICO}
+
+    if cnpj_cliente:
+        checkpoint_conditions.append(f"sc.cliente_id = {CLIENTE_ID_SQL}")
+        movement_conditions.append(f"nh.cliente_id = {CLIENTE_ID_SQL}")
+        params["cnpj"] = cnpj_cliente
+    if codigo_produto:
+        checkpoint_conditions.append(f"sc.produto_id = {PRODUTO_ID_SQL}")
+        movement_conditions.append(f"ni.produto_id = {PRODUTO_ID_SQL}")
+        params["cProd"] = codigo_produto
+    if lote:
+        checkpoint_conditions.append('sc."nLote" = :nLote')
+        movement_conditions.append("COALESCE(NULLIF(li.\"nLote\", ''), 'SEM_LOTE') = :nLote")
+        params["nLote"] = lote
+
+    saldos = f"""
+        SELECT cliente_id, produto_id, "nLote", SUM(saldo) AS saldo
+        FROM (
+            SELECT sc.cliente_id, sc.produto_id, sc."nLote", sc.saldo
+            FROM saldo_checkpoint sc
+            WHERE {" AND ".join(checkpoint_conditions)}
+            UNION ALL
+            {SIGNED_MOVEMENTS_SQL}
+            WHERE {" AND ".join(movement_conditions)}
+        ) movimentos
+        GROUP BY cliente_id, produto_id, "nLote"
+        HAVING SUM(saldo) <> 0
+    """
+    return SALDO_NOMES_SQL.format(saldos=saldos) + " ORDER BY 1, 3, 5", params
+
+def get_balance(db_name=None, **filtros):
+    """
+    Executa balance_query pelo pool somente leitura.
+
+    Args:
+        db_name (str, optional): Banco SQLite avulso; por padrão, o banco do app
+
+    Returns:
+        list: tuplas (CNPJ_dest, xNome_dest, cProd, xProd, nLote, saldo),
+            saldo em inteiro escalado (src/fixed_point.py)
+    """
+    query, params = balance_query(**filtros)
+
+    with get_engine(db_name, readonly=True).connect() as conn:
+        return [tuple(row) for row in conn.execute(text(query), params)]
+
+def expiring_lots_query(dias, hoje=None, cnpj_cliente=None, vencidos=False):
+    """
+    Monta o SQL dos lotes em consignação que vencem nos próximos `dias` dias.
+
+    A busca parte do índice de lote_info.dVal (só as linhas dentro da janela
+    de validade são lidas), chega ao cliente pela NF-e do item e mantém só
+    os lotes com material em poder do cliente no razão saldo_consignacao
+    (saldo negativo, pelas regras de CFOP).
+
+    Args:
+        dias (int): Janela de vencimento a partir de hoje (0 = vence hoje)
+        hoje (date, optional): Data de referência (padrão: hoje)
+        cnpj_cliente (str, optional): CNPJ do destinatário
+        vencidos (bool): Inclui também os lotes já vencidos
+
+    Returns:
+        tuple: (sql, params); as linhas são
+            (CNPJ_dest, xNome_dest, cProd, xProd, nLote, dVal, quantidade),
+            ordenadas por cliente e validade
+    """
+    if dias < 0:
+        raise ValueError("dias deve ser maior ou igual a zero")
+    hoje = hoje or date.today()
+
+    conditions = ['li."dVal" <= :limite', "li.\"nLote\" <> ''"]
+    params = {"limite": (hoje + timedelta(days=dias)).isoformat()}
+    if not vencidos:
+        conditions.append('li."dVal" >= :hoje')
+        params["hoje"] = hoje.isoformat()
+    if cnpj_cliente:
+        conditions.append(f"nh.cliente_id = {CLIENTE_ID_SQL}")
+        params["cnpj"] = cnpj_cliente
+
+    query = f"""
+        SELECT
+            c."CNPJ", c."xNome", p."cProd", p."xProd", sc."nLote",
+            validade."dVal", -sc.saldo AS quantidade
+        FROM (
+            SELECT nh.cliente_id, ni.produto_id, li."nLote", MIN(li."dVal") AS "dVal"
+            FROM lote_info li
+            JOIN nfe_item ni ON ni.id = li.nfe_item_id
+            JOIN nfe_header nh ON nh.id = ni.nfe_id
+            WHERE {" AND ".join(conditions)}
+            GROUP BY nh.cliente_id, ni.produto_id, li."nLote"
+        ) validade
+        JOIN cliente c ON c.id = validade.cliente_id
+        JOIN produto p ON p.id = validade.produto_id
+        JOIN saldo_consignacao sc
+            ON sc.cliente_id = validade.cliente_id
+            AND sc.produto_id = validade.produto_id
+            AND sc."nLote" = validade."nLote"
+        WHERE sc.saldo < 0
+        ORDER BY c."CNPJ", validade."dVal", p."cProd", sc."nLote"
+    """
+    return query, params
+
+def get_expiring_lots(db_name=None, **filtros):
+    """
+    Executa expiring_lots_query pelo pool somente leitura.
+
+    Returns:
+        list: tuplas (CNPJ_dest, xNome_dest, cProd, xProd, nLote, dVal, quantidade)
+    """
+    query, params = expiring_lots_query(**filtros)
+
+    with get_engine(db_name, readonly=True).connect() as conn:
+        return [tuple(row) for row in conn.execute(text(query), params)]
+
+def rebuild_ledger(db_name=None, check_only=False, tolerance=0):
+    """
+    Recalcula saldo_consignacao a partir dos itens brutos e compara com a tabela atual.
+
+    O recálculo usa a agregação em SQL de balance_query (regras de cfop_rule);
+    rode-o também depois de alterar cfop_rule. Sem check_only, os checkpoints
+    de saldo (src/checkpoints.py), as filas FIFO (src/fifo.py) e o índice de
+    busca (src/search.py) também são recriados.
+
+    Args:
+        db_name (str, optional): Banco SQLite avulso; por padrão, o banco do app
+        check_only (bool): Apenas compara, sem regravar a tabela
+        tolerance (int): Diferença máxima aceita entre os saldos, na escala de
+            src/fixed_point.py (os saldos são exatos: por padrão, nenhuma)
+
+    Returns:
+        list: divergências (chave, saldo atual, saldo recalculado)
+    """
+    expected = {
+        (CNPJ_dest, cProd, nLote): saldo
+        for CNPJ_dest, _, cProd, _, nLote, saldo
+        in get_balance(db_name, from_ledger=False)
+    }
+    live = {
+        (CNPJ_dest, cProd, nLote): saldo
+        for CNPJ_dest, _, cProd, _, nLote, saldo
+        in get_balance(db_name, from_ledger=True)
+    }
+
+    divergencias = []
+    for key in sorted(set(live) | set(expected), key=lambda k: tuple(str(part) for part in k)):
+        atual = live.get(key)
+        recalculado = expected.get(key)
+        if atual is None or recalculado is None or abs(atual - recalculado) > tolerance:
+            divergencias.append((key, atual, recalculado))
+
+    if not check_only:
+        with get_engine(db_name).begin() as conn:
+            conn.execute(text("DELETE FROM saldo_consignacao"))
+            conn.execute(text(REBUILD_SALDO_SQL))
+            # Importados aqui: src.checkpoints e src.fifo dependem deste módulo
+            from src.checkpoints import rebuild_checkpoints
+            from src.fifo import rebuild_fifo
+            rebuild_checkpoints(conn)
+            rebuild_fifo(conn)
+            rebuild_search_index(conn)
+            conn.execute(text(BUMP_GENERATION_SQL))
+    return divergencias
+
 if __name__ == '__main__':
     # Exemplo de uso
     # from insert_nfe_data import insert_nfe_data
@@ -74,13 +551,13 @@ if __name__ == '__main__':
     all_movements = get_opme_movements()
     print("Todos os movimentos:", all_movements)
 
-    saldo_geral = calculate_balance(all_movements)
+    saldo_geral = calculate_balance(all_movements, get_cfop_signs())
     print("Saldo Geral:", saldo_geral)
 
     # Exemplo com CNPJ específico (substitua pelo CNPJ do destinatário do seu XML de exemplo)
     # movements_cliente = get_opme_movements(cnpj_cliente="00000000000191")
     # print("Movimentos para cliente específico:", movements_cliente)
-    # saldo_cliente = calculate_balance(movements_cliente)
+    # saldo_cliente = calculate_balance(movements_cliente, get_cfop_signs())
     # print("Saldo para cliente específico:", saldo_cliente)
 
 
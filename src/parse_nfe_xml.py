@@ -1,70 +1,233 @@
-import xml.etree.ElementTree as ET
+import io
+import re
 
-def parse_nfe_xml(xml_source, is_file=True):
-    if is_file:
-        tree = ET.parse(xml_source)
-        root = tree.getroot()
-    else:
-        root = ET.fromstring(xml_source)
-
-    # Namespace para a NF-e
-    ns = {"nfe": "http://www.portalfiscal.inf.br/nfe"}
-
-    # Extrair informações da NF-e
-    ide = root.find(".//nfe:ide", ns)
-    dEmi = ide.find("nfe:dEmi", ns).text if ide is not None and ide.find("nfe:dEmi", ns) is not None else ""
-    nNF = ide.find("nfe:nNF", ns).text if ide is not None and ide.find("nfe:nNF", ns) is not None else ""
-
-    emit = root.find(".//nfe:emit", ns)
-    CNPJ_emit = emit.find("nfe:CNPJ", ns).text if emit is not None and emit.find("nfe:CNPJ", ns) is not None else ""
-    xNome_emit = emit.find("nfe:xNome", ns).text if emit is not None and emit.find("nfe:xNome", ns) is not None else ""
-
-    dest = root.find(".//nfe:dest", ns)
-    CNPJ_dest = dest.find("nfe:CNPJ", ns).text if dest is not None and dest.find("nfe:CNPJ", ns) is not None else ""
-    xNome_dest = dest.find("nfe:xNome", ns).text if dest is not None and dest.find("nfe:xNome", ns) is not None else ""
-
-    products = []
-    for det in root.findall(".//nfe:det", ns):
-        prod = det.find("nfe:prod", ns)
-        cProd = prod.find("nfe:cProd", ns).text if prod is not None and prod.find("nfe:cProd", ns) is not None else ""
-        xProd = prod.find("nfe:xProd", ns).text if prod is not None and prod.find("nfe:xProd", ns) is not None else ""
-        CFOP = prod.find("nfe:CFOP", ns).text if prod is not None and prod.find("nfe:CFOP", ns) is not None else ""
-        qCom = prod.find("nfe:qCom", ns).text if prod is not None and prod.find("nfe:qCom", ns) is not None else "0.0"
-        vUnCom = prod.find("nfe:vUnCom", ns).text if prod is not None and prod.find("nfe:vUnCom", ns) is not None else "0.0"
-        vProd = prod.find("nfe:vProd", ns).text if prod is not None and prod.find("nfe:vProd", ns) is not None else "0.0"
-
-        lote_info = {
-            "nLote": "",
-            "qLote": "",
-            "dFab": "",
-            "dVal": ""
+from lxml import etree
+
+from src.fixed_point import (
+    QUANTIDADE_CASAS, VALOR_CASAS, VALOR_UNITARIO_CASAS, from_scaled, to_scaled
+)
+
+# Namespace para a NF-e
+NFE_NS = "http://www.portalfiscal.inf.br/nfe"
+_PREFIX = "{%s}" % NFE_NS
+_PREFIX_LEN = len(_PREFIX)
+
+# Elementos tratados pelo iterparse assim que são fechados
+_TAG_IDE = _PREFIX + "ide"
+_TAG_EMIT = _PREFIX + "emit"
+_TAG_DEST = _PREFIX + "dest"
+_TAG_DET = _PREFIX + "det"
+_TAGS = (_TAG_IDE, _TAG_EMIT, _TAG_DEST, _TAG_DET)
+
+_XML_DECL = re.compile(r"^\s*<\?xml[^>]*\?>")
+
+
+class LoteRecord:
+    """
+    Informações de rastreabilidade (grupo rastro) de um item; qLote escalado
+    (src/fixed_point.py) ou None, e qLote_texto como veio no XML (to_dict).
+    """
+    __slots__ = ("nLote", "qLote", "qLote_texto", "dFab", "dVal")
+
+    def __init__(self, nLote="", qLote=None, dFab="", dVal="", qLote_texto=""):
+        self.nLote = nLote
+        self.qLote = qLote
+        self.qLote_texto = qLote_texto
+        self.dFab = dFab
+        self.dVal = dVal
+
+    def to_dict(self):
+        return {
+            "nLote": self.nLote,
+            "qLote": self.qLote_texto,
+            "dFab": self.dFab,
+            "dVal": self.dVal
+        }
+
+
+class ItemRecord:
+    """Item (det/prod) da NF-e; qCom, vUnCom e vProd em inteiros escalados (src/fixed_point.py)."""
+    __slots__ = ("cProd", "xProd", "CFOP", "qCom", "vUnCom", "vProd", "lote_info")
+
+    def __init__(self, cProd, xProd, CFOP, qCom, vUnCom, vProd, lote_info):
+        self.cProd = cProd
+        self.xProd = xProd
+        self.CFOP = CFOP
+        self.qCom = qCom
+        self.vUnCom = vUnCom
+        self.vProd = vProd
+        self.lote_info = lote_info
+
+    def to_dict(self):
+        return {
+            "cProd": self.cProd,
+            "xProd": self.xProd,
+            "CFOP": self.CFOP,
+            "qCom": from_scaled(self.qCom, QUANTIDADE_CASAS),
+            "vUnCom": from_scaled(self.vUnCom, VALOR_UNITARIO_CASAS),
+            "vProd": from_scaled(self.vProd, VALOR_CASAS),
+            "lote_info": self.lote_info.to_dict()
         }
-        rastro = prod.find("nfe:rastro", ns)
-        if rastro is not None:
-            lote_info["nLote"] = rastro.find("nfe:nLote", ns).text if rastro.find("nfe:nLote", ns) is not None else ""
-            lote_info["qLote"] = rastro.find("nfe:qLote", ns).text if rastro.find("nfe:qLote", ns) is not None else ""
-            lote_info["dFab"] = rastro.find("nfe:dFab", ns).text if rastro.find("nfe:dFab", ns) is not None else ""
-            lote_info["dVal"] = rastro.find("nfe:dVal", ns).text if rastro.find("nfe:dVal", ns) is not None else ""
-
-        products.append({
-            "cProd": cProd,
-            "xProd": xProd,
-            "CFOP": CFOP,
-            "qCom": float(qCom),
-            "vUnCom": float(vUnCom),
-            "vProd": float(vProd),
-            "lote_info": lote_info
-        })
-
-    return {
-        "dEmi": dEmi,
-        "nNF": nNF,
-        "CNPJ_emit": CNPJ_emit,
-        "xNome_emit": xNome_emit,
-        "CNPJ_dest": CNPJ_dest,
-        "xNome_dest": xNome_dest,
-        "products": products
-    }
+
+
+class NFeRecord:
+    """
+    Cabeçalho da NF-e com a lista de itens. dEmi cai para a data de dhEmi
+    (leiaute 4.00); dEmi_texto guarda só a tag dEmi, para to_dict.
+    """
+    __slots__ = (
+        "chNFe", "dEmi", "dEmi_texto", "nNF", "CNPJ_emit", "xNome_emit", "CNPJ_dest", "xNome_dest", "products"
+    )
+
+    def __init__(self):
+        self.chNFe = ""
+        self.dEmi = ""
+        self.dEmi_texto = ""
+        self.nNF = ""
+        self.CNPJ_emit = ""
+        self.xNome_emit = ""
+        self.CNPJ_dest = ""
+        self.xNome_dest = ""
+        self.products = []
+
+    def to_dict(self):
+        """Dicionário no formato de parse_nfe_xml (sem chNFe, qLote como texto)."""
+        return {
+            "dEmi": self.dEmi_texto,
+            "nNF": self.nNF,
+            "CNPJ_emit": self.CNPJ_emit,
+            "xNome_emit": self.xNome_emit,
+            "CNPJ_dest": self.CNPJ_dest,
+            "xNome_dest": self.xNome_dest,
+            "products": [product.to_dict() for product in self.products]
+        }
+
+
+def _child_texts(elem):
+    """Percorre os filhos diretos uma única vez e devolve {nome_local: texto}.
+
+    Assim como find(), vale a primeira ocorrência de cada tag.
+    """
+    texts = {}
+    for child in elem:
+        tag = child.tag
+        # Comentários e instruções de processamento não têm tag string
+        if isinstance(tag, str) and tag.startswith(_PREFIX):
+            name = tag[_PREFIX_LEN:]
+            if name not in texts:
+                texts[name] = child.text
+    return texts
+
+
+def _first_child(elem, tag):
+    for child in elem:
+        if child.tag == tag:
+            return child
+    return None
+
+
+def _parse_det(det):
+    prod = _first_child(det, _PREFIX + "prod")
+    fields = _child_texts(prod) if prod is not None else {}
+
+    lote_info = LoteRecord()
+    rastro = _first_child(prod, _PREFIX + "rastro") if prod is not None else None
+    if rastro is not None:
+        rastro_fields = _child_texts(rastro)
+        lote_info.nLote = rastro_fields.get("nLote", "")
+        qLote = rastro_fields.get("qLote", "")
+        lote_info.qLote = to_scaled(qLote, QUANTIDADE_CASAS) if qLote else None
+        lote_info.qLote_texto = qLote
+        lote_info.dFab = rastro_fields.get("dFab", "")
+        lote_info.dVal = rastro_fields.get("dVal", "")
+
+    return ItemRecord(
+        fields.get("cProd", ""),
+        fields.get("xProd", ""),
+        fields.get("CFOP", ""),
+        to_scaled(fields.get("qCom"), QUANTIDADE_CASAS),
+        to_scaled(fields.get("vUnCom"), VALOR_UNITARIO_CASAS),
+        to_scaled(fields.get("vProd"), VALOR_CASAS),
+        lote_info
+    )
+
+
+def _as_stream(xml_source, is_file):
+    if is_file:
+        # Caminho ou objeto file-like: o lxml lê diretamente em blocos
+        return xml_source
+    if isinstance(xml_source, str):
+        # A declaração de encoding não vale mais para um texto já decodificado
+        xml_source = _XML_DECL.sub("", xml_source, count=1).encode("utf-8")
+    if isinstance(xml_source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(xml_source)
+    return xml_source
+
+
+def parse_nfe_record(xml_source, is_file=True):
+    """Extrai a NF-e em um único passe com lxml.iterparse.
+
+    Aceita caminho, objeto file-like, bytes ou str. Cada ide/emit/dest/det é
+    tratado assim que o elemento é fechado e descartado em seguida, de modo que
+    a árvore completa nunca fica em memória.
+
+    Returns:
+        NFeRecord: registro compacto (com __slots__) da NF-e
+    """
+    record = NFeRecord()
+    seen = set()
+
+    context = etree.iterparse(
+        _as_stream(xml_source, is_file),
+        events=("end",),
+        tag=_TAGS,
+        resolve_entities=False,
+        no_network=True
+    )
+    for _event, elem in context:
+        tag = elem.tag
+        if tag == _TAG_DET:
+            record.products.append(_parse_det(elem))
+        elif tag not in seen:
+            # Vale a primeira ocorrência, como em root.find(".//nfe:ide")
+            seen.add(tag)
+            fields = _child_texts(elem)
+            if tag == _TAG_IDE:
+                # A chave de acesso vem no atributo Id de infNFe ("NFe" + 44 dígitos)
+                parent = elem.getparent()
+                access_key = parent.get("Id", "") if parent is not None else ""
+                record.chNFe = access_key[3:] if access_key.startswith("NFe") else access_key
+                if "dEmi" in fields:
+                    record.dEmi = record.dEmi_texto = fields["dEmi"]
+                elif fields.get("dhEmi"):
+                    # Leiaute 4.00: só existe dhEmi (data e hora com fuso)
+                    record.dEmi = fields["dhEmi"][:10]
+                record.nNF = fields.get("nNF", "")
+            elif tag == _TAG_EMIT:
+                record.CNPJ_emit = fields.get("CNPJ", "")
+                record.xNome_emit = fields.get("xNome", "")
+            else:
+                record.CNPJ_dest = fields.get("CNPJ", "")
+                record.xNome_dest = fields.get("xNome", "")
+
+        # Libera o elemento processado e os irmãos anteriores já tratados
+        elem.clear(keep_tail=True)
+        parent = elem.getparent()
+        if parent is not None:
+            while elem.getprevious() is not None:
+                del parent[0]
+    del context
+
+    return record
+
+
+def parse_nfe_xml(xml_source, is_file=True):
+    """
+    NF-e como dicionário, no mesmo formato de sempre: sem chNFe, qLote como
+    texto e dEmi só da tag dEmi. chNFe, qLote escalado e a data de dhEmi
+    estão no NFeRecord de parse_nfe_record.
+    """
+    return parse_nfe_record(xml_source, is_file=is_file).to_dict()
 
 if __name__ == "__main__":
     # Exemplo de uso (substitua "caminho/para/sua/nfe.xml" pelo caminho real do arquivo)
@@ -73,5 +236,3 @@ if __name__ == "__main__":
     # xml_data = parse_nfe_xml("nfe_exemplo.xml")
     # print(xml_data)
     pass
-
-
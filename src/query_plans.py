@@ -0,0 +1,200 @@
+"""
+Verificação dos planos de execução das consultas quentes.
+
+Garante que filtros por cliente, joins de itens/lotes e checagens de
+duplicidade usem os índices criados pelas migrações, tanto em SQLite
+quanto em PostgreSQL:
+
+    flask --app src.main check-query-plans
+
+As consultas não são copiadas aqui: hot_queries() as monta pelas mesmas
+funções que as rotas, a importação e os relatórios usam (balance_query,
+movements_query, DimensionCache...), de modo que o EXPLAIN acompanha
+qualquer mudança nelas. tests/test_query_plans.py roda a verificação.
+"""
+import json
+from datetime import date
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, text
+
+from src.checkpoints import CREATE_CHECKPOINT_SQL
+from src.dimensions import cliente_cache, produto_cache
+from src.extensions import db
+from src.fifo import CAMADAS_SQL, CREATE_CHAVES_LOTE_SQL, KEY_MOVEMENTS_QUERY, ULTIMAS_EMISSOES_SQL, aging_query
+from src.insert_nfe_data import document_query, duplicates_query
+from src.opme_logic import balance_query, expiring_lots_query
+from src.routes.opme import MOVEMENTS_PAGE_MAX, movements_query
+from src.search import search_query
+
+# Valores de exemplo: o plano não depende de haver linhas com eles
+CNPJ = "00000000000000"
+CPROD = "PROD-0001"
+LOTE = "L0001"
+HOJE = date(2025, 1, 15)
+
+# Tabelas lidas inteiras por definição: as chaves do lote em importação
+# (tabela temporária de src/fifo.py) são o ponto de partida dos joins
+VARREDURAS_ESPERADAS = {"fifo_lote_chave"}
+
+
+def hot_queries(dialect):
+    """
+    Consultas quentes montadas pelos construtores reais.
+
+    Args:
+        dialect (str): "sqlite" ou "postgresql" (a busca muda com o dialeto)
+
+    Returns:
+        dict: nome -> (consulta, parâmetros); a consulta é SQL (str) ou um
+            statement do SQLAlchemy
+    """
+    cursor = (HOJE, 0)
+    return {
+        # /api/balance e exportações
+        "saldo_por_chave": balance_query(CNPJ, CPROD, LOTE),
+        "saldo_por_cliente": balance_query(cnpj_cliente=CNPJ),
+        "saldos_em_aberto": balance_query(em_aberto=True),
+        "saldo_agregado_por_cliente": balance_query(cnpj_cliente=CNPJ, from_ledger=False),
+        "saldo_agregado_por_produto": balance_query(codigo_produto=CPROD, from_ledger=False),
+        "saldo_por_periodo_e_cliente": balance_query(
+            cnpj_cliente=CNPJ, data_inicio="2025-01-01", data_fim="2025-01-31", em_aberto=True
+        ),
+        "saldo_em_data": balance_query(as_of=HOJE.isoformat()),
+        "saldo_em_data_por_cliente": balance_query(as_of=HOJE.isoformat(), cnpj_cliente=CNPJ),
+        "saldo_em_data_por_produto": balance_query(as_of=HOJE.isoformat(), codigo_produto=CPROD),
+        # /api/movements: lista completa, página por chave (keyset) e exportação
+        "movimentacoes_por_cliente": (movements_query(CNPJ), None),
+        "movimentacoes_keyset": (movements_query(CNPJ, cursor).limit(MOVEMENTS_PAGE_MAX + 1), None),
+        "movimentacoes_keyset_todos_os_clientes": (movements_query(None, cursor).limit(MOVEMENTS_PAGE_MAX + 1), None),
+        # /api/lotes_vencendo e /api/aging
+        "lotes_vencendo": expiring_lots_query(30, hoje=HOJE),
+        "lotes_vencendo_por_cliente": expiring_lots_query(30, hoje=HOJE, cnpj_cliente=CNPJ),
+        "idade_por_cliente": aging_query(HOJE, cnpj_cliente=CNPJ),
+        "idade_detalhada_por_cliente": aging_query(HOJE, cnpj_cliente=CNPJ, detalhe=True),
+        # /api/search
+        "busca_por_inicio_do_codigo": search_query("PR", dialect),
+        "busca_por_trecho": search_query("parafuso titanio", dialect),
+        # Importação (NFeBatchIngestor, DimensionCache, checkpoints e filas FIFO)
+        "cache_documento": (document_query("0" * 64), None),
+        "duplicidade_do_lote": (duplicates_query({"0" * 44}, {"1"}), None),
+        "dimensao_cliente": (cliente_cache().ids_sql, {"chaves": [CNPJ]}),
+        "dimensao_produto": (produto_cache().ids_sql, {"chaves": [CPROD]}),
+        "checkpoint_novo": (CREATE_CHECKPOINT_SQL, {"data_corte": "2025-01-31", "anterior": "2024-12-31"}),
+        "fifo_ultimas_emissoes": (ULTIMAS_EMISSOES_SQL, None),
+        "fifo_camadas_do_lote": (CAMADAS_SQL, None),
+        "fifo_movimentacoes_das_chaves": (KEY_MOVEMENTS_QUERY, {"clientes": [1]}),
+    }
+
+
+def _explain(connection, consulta, params, prefixo):
+    """
+    Executa a consulta com `prefixo` (EXPLAIN ...) antes do SQL compilado.
+
+    O prefixo entra no evento before_cursor_execute: o SQLAlchemy compila o
+    statement como na execução real (inclusive parâmetros expandidos de IN),
+    e as linhas do plano são lidas direto do cursor.
+    """
+    linhas = []
+
+    def before(_conn, _cursor, statement, parameters, _context, _executemany):
+        return prefixo + statement, parameters
+
+    def after(_conn, cursor, _statement, _parameters, _context, _executemany):
+        linhas.extend(cursor.fetchall())
+
+    if isinstance(consulta, str):
+        consulta = text(consulta)
+    event.listen(connection, "before_cursor_execute", before, retval=True)
+    event.listen(connection, "after_cursor_execute", after)
+    try:
+        connection.execute(consulta, params or {}).close()
+    finally:
+        event.remove(connection, "before_cursor_execute", before)
+        event.remove(connection, "after_cursor_execute", after)
+    return linhas
+
+
+def _sqlite_full_scans(connection, consulta, params):
+    rows = _explain(connection, consulta, params, "EXPLAIN QUERY PLAN ")
+    # "SCAN tabela" sem índice é leitura da tabela inteira; buscas aparecem
+    # como "SEARCH". Subconsultas materializadas também aparecem como SCAN.
+    subconsultas = {
+        row[-1].split()[-1] for row in rows if row[-1].startswith(("CO-ROUTINE ", "MATERIALIZE "))
+    }
+    scans = []
+    for row in rows:
+        detalhe = row[-1]
+        if not detalhe.startswith("SCAN ") or " INDEX " in detalhe:
+            continue
+        nome = detalhe.split()[1]
+        if nome not in subconsultas and nome not in VARREDURAS_ESPERADAS:
+            scans.append(detalhe)
+    return scans
+
+
+def _postgresql_full_scans(connection, consulta, params):
+    # Com tabelas pequenas o planejador prefere Seq Scan mesmo havendo índice;
+    # desligando-o, um Seq Scan restante indica que não há índice utilizável.
+    connection.execute(text("SET LOCAL enable_seqscan = off"))
+    plan = _explain(connection, consulta, params, "EXPLAIN (FORMAT JSON) ")[0][0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+
+    scans = []
+    pending = [plan[0]["Plan"]]
+    while pending:
+        node = pending.pop()
+        if node.get("Node Type") == "Seq Scan" and node.get("Relation Name") not in VARREDURAS_ESPERADAS:
+            scans.append(f"Seq Scan em {node.get('Relation Name')}")
+        pending.extend(node.get("Plans", []))
+    return scans
+
+
+def check_query_plans(connection):
+    """
+    Executa EXPLAIN em cada consulta de hot_queries().
+
+    Cada consulta roda em uma transação desfeita ao final (o INSERT do
+    checkpoint e a tabela temporária das filas FIFO não ficam no banco).
+
+    Returns:
+        dict: nome da consulta -> lista de varreduras completas (vazia se ok)
+    """
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        full_scans = _sqlite_full_scans
+    elif dialect == "postgresql":
+        full_scans = _postgresql_full_scans
+    else:
+        raise ValueError(f"Dialeto não suportado: {dialect}")
+
+    resultado = {}
+    for nome, (consulta, params) in hot_queries(dialect).items():
+        transaction = connection.begin()
+        try:
+            connection.execute(text(CREATE_CHAVES_LOTE_SQL))
+            resultado[nome] = full_scans(connection, consulta, params)
+        finally:
+            transaction.rollback()
+    return resultado
+
+
+@click.command("check-query-plans")
+@with_appcontext
+def check_query_plans_command():
+    """Falha se alguma consulta quente fizer varredura completa de tabela."""
+    with db.engine.connect() as connection:
+        resultado = check_query_plans(connection)
+
+    falhas = 0
+    for nome, scans in resultado.items():
+        if scans:
+            falhas += 1
+            click.echo(f"FALHA {nome}: {'; '.join(scans)}")
+        else:
+            click.echo(f"ok    {nome}")
+
+    if falhas:
+        raise SystemExit(1)
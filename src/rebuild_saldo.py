@@ -0,0 +1,36 @@
+"""
+Recalcula a tabela saldo_consignacao a partir dos itens de NF-e já importados.
+
+Uso:
+    python -m src.rebuild_saldo [--db caminho/do/banco.db] [--check]
+
+Com --check apenas compara o razão atual com o recalculado e termina com
+código 1 se houver divergência.
+"""
+import argparse
+import sys
+
+from src.fixed_point import from_scaled
+from src.opme_logic import rebuild_ledger
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recalcula o razão de saldos em consignação")
+    parser.add_argument("--db", default=None, help="Banco SQLite avulso (padrão: o banco do app, DATABASE_URL)")
+    parser.add_argument("--check", action="store_true", help="Somente compara, sem regravar a tabela")
+    args = parser.parse_args(argv)
+
+    divergencias = rebuild_ledger(args.db, check_only=args.check)
+    for (CNPJ_dest, cProd, nLote), atual, recalculado in divergencias:
+        print(f"{CNPJ_dest} {cProd} {nLote}: atual={from_scaled(atual)} recalculado={from_scaled(recalculado)}")
+
+    if args.check:
+        print(f"{len(divergencias)} divergência(s) encontrada(s)")
+        return 1 if divergencias else 0
+
+    print(f"Razão recalculado ({len(divergencias)} divergência(s) corrigida(s))")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
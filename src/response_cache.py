@@ -0,0 +1,160 @@
+"""
+Cache de respostas das rotas de saldo e estoque.
+
+Os dados só mudam quando uma NF-e é importada (ou o razão é recalculado), e
+toda gravação incrementa data_generation na própria transação. Cada entrada
+guarda a geração em que foi calculada; com uma geração nova ela deixa de
+valer, em qualquer processo do gunicorn, sem precisar de invalidação
+explícita.
+
+- chave: caminho + parâmetros da requisição;
+- LRU limitado pelo total de bytes guardados;
+- ETag derivado da geração e da chave, respondendo 304 a If-None-Match
+  sem nem consultar o cache;
+- misses simultâneos da mesma chave são agrupados: só uma requisição
+  calcula, as demais esperam o resultado.
+"""
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import current_app, request
+from sqlalchemy import text
+
+from src.connections import connect
+from src.opme_logic import CURRENT_GENERATION_SQL
+
+# Limite padrão de bytes guardados (somatório dos corpos das respostas)
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+
+class CachedResponse:
+    __slots__ = ("generation", "body", "mimetype")
+
+    def __init__(self, generation, body, mimetype):
+        self.generation = generation
+        self.body = body
+        self.mimetype = mimetype
+
+
+class ResponseCache:
+    """LRU de respostas por chave, validadas pela geração dos dados."""
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, generation, compute):
+        """
+        Devolve a CachedResponse da chave na geração pedida ou a calcula.
+
+        compute() deve devolver um flask.Response; só respostas 200 são
+        guardadas (as demais voltam como estão para quem calculou).
+        """
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.generation == generation:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry
+                pendente = self._inflight.get(key)
+                if pendente is None:
+                    pendente = self._inflight[key] = threading.Event()
+                    self.misses += 1
+                    break
+                self.coalesced += 1
+            # Outra requisição já está calculando esta chave
+            pendente.wait()
+
+        try:
+            response = compute()
+            if response.status_code != 200:
+                return response
+            entry = CachedResponse(generation, response.get_data(), response.mimetype)
+            self._store(key, entry)
+            return entry
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            pendente.set()
+
+    def _store(self, key, entry):
+        with self._lock:
+            antiga = self._entries.pop(key, None)
+            if antiga is not None:
+                self._bytes -= len(antiga.body)
+            if len(entry.body) > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self._bytes += len(entry.body)
+            while self._bytes > self.max_bytes:
+                _, removida = self._entries.popitem(last=False)
+                self._bytes -= len(removida.body)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def snapshot(self):
+        with self._lock:
+            consultas = self.hits + self.misses + self.coalesced
+            return {
+                "entradas": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "acertos": self.hits,
+                "falhas": self.misses,
+                "agrupadas": self.coalesced,
+                "despejos": self.evictions,
+                "taxa_acerto": (self.hits + self.coalesced) / consultas if consultas else 0.0
+            }
+
+
+RESPONSE_CACHE = ResponseCache()
+
+
+def current_generation():
+    """Geração atual, lida pelo pool somente leitura como as rotas que o cache atende."""
+    with connect(readonly=True) as connection:
+        return connection.execute(text(CURRENT_GENERATION_SQL)).scalar() or 0
+
+
+def _etag(generation, key):
+    digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:16]
+    return f"g{generation}-{digest}"
+
+
+def cached_response(view):
+    """Decorator das rotas GET de leitura: cache por geração com ETag/304."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        generation = current_generation()
+        key = (request.path, tuple(sorted(request.args.items(multi=True))))
+        etag = _etag(generation, key)
+
+        if request.if_none_match.contains(etag):
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            return response
+
+        resultado = RESPONSE_CACHE.get_or_compute(
+            key, generation,
+            lambda: current_app.make_response(view(*args, **kwargs))
+        )
+        if not isinstance(resultado, CachedResponse):
+            return resultado
+
+        response = current_app.response_class(resultado.body, mimetype=resultado.mimetype)
+        response.set_etag(etag)
+        return response
+    return wrapper
@@ -0,0 +1,27 @@
+from flask import Blueprint, request, jsonify
+from src.jobs import get_job, list_jobs, cancel_job
+
+jobs_bp = Blueprint('jobs', __name__)
+
+@jobs_bp.route('/jobs', methods=['GET'])
+def listar_jobs():
+    """Tarefas mais recentes (?status=pendente|executando|concluido|erro|cancelado)"""
+    limite = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    return jsonify(list_jobs(status=request.args.get('status'), limite=limite)), 200
+
+@jobs_bp.route('/jobs/<int:job_id>', methods=['GET'])
+def consultar_job(job_id):
+    """Status, progresso, resultado e erro de uma tarefa"""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Tarefa não encontrada'}), 404
+    return jsonify(job), 200
+
+@jobs_bp.route('/jobs/<int:job_id>', methods=['DELETE'])
+@jobs_bp.route('/jobs/<int:job_id>/cancelar', methods=['POST'])
+def cancelar_job(job_id):
+    """Cancela a tarefa (pendente: na hora; em execução: no próximo progresso)"""
+    job = cancel_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Tarefa não encontrada'}), 404
+    return jsonify(job), 200
@@ -1,9 +1,30 @@
-from flask import Blueprint, request, jsonify
-import os
-from src.maino_integration import MainoAPI
+from flask import Blueprint, request, jsonify, current_app
+from src.maino_integration import DEFAULT_TIMEOUT, MainoAPI
+from src.jobs import job_handler, submit_job, PRIORIDADE_LOTE, STATUS_PENDENTE
 
 maino_bp = Blueprint('maino', __name__)
 
+def _maino_api(**credenciais):
+    """MainoAPI com os timeouts da configuração (MAINO_TIMEOUT)."""
+    return MainoAPI(timeout=current_app.config.get('MAINO_TIMEOUT', DEFAULT_TIMEOUT), **credenciais)
+
+def _sync_maino(maino_api, parametros, progress=None):
+    return maino_api.baixar_e_processar_xmls(
+        parametros['data_inicio'],
+        parametros['data_fim'],
+        workers=parametros['workers'],
+        batch_size=parametros['batch_size'],
+        progress=progress,
+        incremental=parametros['incremental']
+    )
+
+@job_handler('sync_maino')
+def _job_sync_maino(ctx):
+    resultado = _sync_maino(_maino_api(**ctx.credenciais), ctx.parametros, progress=ctx.progress)
+    if not resultado['success']:
+        raise RuntimeError(resultado['message'])
+    return resultado
+
 @maino_bp.route('/sync_maino', methods=['POST'])
 def sync_maino():
     """Sincronizar dados do Mainô"""
@@ -20,26 +41,35 @@ def sync_maino():
         if not api_key and not bearer_token:
             return jsonify({'error': 'api_key ou bearer_token é obrigatório'}), 400
         
-        # Inicializar API do Mainô
-        if api_key:
-            maino_api = MainoAPI(api_key=api_key)
-        else:
-            maino_api = MainoAPI(bearer_token=bearer_token)
+        # Processos de parsing (1 = serial); o padrão vem da configuração
+        workers = int(data.get('workers') or current_app.config.get('MAINO_INGEST_WORKERS', 1))
+        if workers < 1:
+            return jsonify({'error': 'workers deve ser um inteiro positivo'}), 400
+        
+        parametros = {
+            'data_inicio': data['data_inicio'],
+            'data_fim': data['data_fim'],
+            'workers': workers,
+            'batch_size': current_app.config.get('NFE_BATCH_SIZE', 500),
+            'incremental': bool(data.get('incremental', False))
+        }
+        credenciais = {'api_key': api_key} if api_key else {'bearer_token': bearer_token}
         
-        # Caminho do banco de dados
-        db_path = os.path.join(os.path.dirname(__file__), '..', 'database', 'app.db')
+        # Por padrão vira uma tarefa em segundo plano (acompanhe em /api/jobs/<id>);
+        # aguardar=true baixa e processa dentro da requisição, como antes
+        if not data.get('aguardar', False):
+            job_id = submit_job('sync_maino', parametros, prioridade=PRIORIDADE_LOTE, credenciais=credenciais)
+            return jsonify({'job_id': job_id, 'status': STATUS_PENDENTE}), 202
         
         # Baixar e processar XMLs
-        resultado = maino_api.baixar_e_processar_xmls(
-            data['data_inicio'],
-            data['data_fim'],
-            db_path
-        )
+        resultado = _sync_maino(_maino_api(**credenciais), parametros)
         
         if resultado['success']:
             return jsonify({
                 'message': resultado['message'],
                 'processed_count': resultado['processed_count'],
+                'duplicate_count': resultado['duplicate_count'],
+                'skipped_count': resultado['skipped_count'],
                 'errors': resultado['errors']
             }), 200
         else:
@@ -66,9 +96,9 @@ def list_nfes_maino():
         
         # Inicializar API do Mainô
         if api_key:
-            maino_api = MainoAPI(api_key=api_key)
+            maino_api = _maino_api(api_key=api_key)
         else:
-            maino_api = MainoAPI(bearer_token=bearer_token)
+            maino_api = _maino_api(bearer_token=bearer_token)
         
         # Listar notas fiscais
         notas = maino_api.listar_notas_fiscais_emitidas(
@@ -1,58 +1,74 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+import base64
+import json
 import logging
-from datetime import datetime
-from sqlalchemy.exc import SQLAlchemyError
-from src.models import db, NFeHeader, NFeItem
-from src.utils.parse_nfe_xml import parse_nfe_xml
+import zipfile
+from datetime import date, datetime
+from sqlalchemy import text, select, or_, and_
+from src.models.nfe import Cliente, Produto, NFeHeader, NFeItem, LoteInfo
+from src.opme_logic import balance_query, expiring_lots_query
+from src.fifo import AGING_BUCKETS, aging_query
+from src.search import search_query, DEFAULT_SEARCH_LIMIT, TIPO_CLIENTE, TIPO_PRODUTO
+from src.fixed_point import from_scaled
+from src.export import csv_stream, xlsx_stream, gzip_stream, XLSX_MIMETYPE
+from src.response_cache import cached_response
+from src.connections import connect
+from src.metrics import INGEST_STAGE_SECONDS
+from src.jobs import job_handler, submit_job, spool_path, PRIORIDADE_INTERATIVA, STATUS_PENDENTE
+from src.insert_nfe_data import (
+    NFeBatchIngestor, DEFAULT_BATCH_SIZE, STATUS_IMPORTADO, STATUS_DUPLICADO, DOCUMENT_CACHE_STATS
+)
 
 opme_bp = Blueprint('opme', __name__)
 
+# Linhas buscadas por vez do cursor do banco nas respostas em streaming
+STREAM_CHUNK_SIZE = 1000
+# Tamanho máximo de página em /movements?limit=
+MOVEMENTS_PAGE_MAX = 1000
+
+# Colunas das exportações (os mesmos nomes das respostas JSON)
+BALANCE_COLUMNS = ('cnpj_cliente', 'nome_cliente', 'codigo_produto', 'descricao_produto', 'lote', 'saldo')
+MOVEMENT_COLUMNS = (
+    'numero_nf', 'data_emissao', 'cnpj_cliente', 'nome_cliente', 'codigo_produto',
+    'descricao_produto', 'cfop', 'quantidade', 'lote', 'quantidade_lote'
+)
+
 def parse_and_save_nfe(xml_content):
     try:
-        # Parseia o XML
-        parsed_data = parse_nfe_xml(xml_content)
-        
-        # Verifica se a NF já existe
-        existing_nf = NFeHeader.query.filter_by(nNF=parsed_data['nNF']).first()
-        if existing_nf:
-            logging.warning(f"NF-e {parsed_data['nNF']} já existe no banco")
-            return False
-
-        # Cria cabeçalho
-        header = NFeHeader(
-            nNF=parsed_data['nNF'],
-            dEmi=datetime.strptime(parsed_data['dEmi'], '%Y-%m-%d').date(),
-            CNPJ_emit=parsed_data['CNPJ_emit'],
-            xNome_emit=parsed_data['xNome_emit'],
-            CNPJ_dest=parsed_data['CNPJ_dest'],
-            xNome_dest=parsed_data['xNome_dest']
-        )
-        db.session.add(header)
-        db.session.flush()  # Obtém ID para os itens
-
-        # Adiciona itens
-        for item in parsed_data['items']:
-            nfe_item = NFeItem(
-                nfe_header_id=header.id,
-                cProd=item['cProd'],
-                xProd=item['xProd'],
-                CFOP=item['CFOP'],
-                uCom=item['uCom'],
-                qCom=float(item['qCom']),
-                vUnCom=float(item['vUnCom']),
-                nLote=item.get('nLote', ''),
-                qLote=float(item.get('qLote', 0))
-            )
-            db.session.add(nfe_item)
-        
-        db.session.commit()
-        return True
-        
+        with connect() as connection:
+            ingestor = NFeBatchIngestor(connection, batch_size=1)
+            result = ingestor.add('upload', xml_content, is_file=False)
+            ingestor.close()
+
+        if result['status'] == STATUS_DUPLICADO:
+            logging.warning(f"NF-e {result.get('nNF', '')} já existe no banco")
+        elif result['status'] != STATUS_IMPORTADO:
+            logging.error(f"Erro ao processar NF-e: {result.get('erro')}")
+        return result['status'] == STATUS_IMPORTADO
+
     except Exception as e:
-        db.session.rollback()
         logging.exception(f"Erro ao processar NF-e: {str(e)}")
         return False
 
+def _ingest_upload(ingestor, filename, stream):
+    """Enfileira um arquivo enviado; ZIPs são lidos membro a membro, sem extrair."""
+    filename = filename or ''
+    if filename.lower().endswith('.zip'):
+        try:
+            with zipfile.ZipFile(stream) as zip_ref:
+                for info in zip_ref.infolist():
+                    if info.is_dir() or not info.filename.lower().endswith('.xml'):
+                        continue
+                    with INGEST_STAGE_SECONDS.time(stage="unzip"), zip_ref.open(info) as member:
+                        conteudo = member.read()
+                    ingestor.add(f"{filename}/{info.filename}", conteudo, is_file=False)
+        except zipfile.BadZipFile:
+            ingestor.reject(filename, 'ZIP inválido')
+    elif filename.lower().endswith('.xml'):
+        ingestor.add(filename, stream)
+    else:
+        ingestor.reject(filename, 'Apenas XML ou ZIP são aceitos')
+
 @opme_bp.route('/upload_xml', methods=['POST'])
 def upload_xml():
     try:
@@ -65,7 +81,7 @@ def upload_xml():
         
         if file.filename.lower().endswith('.xml'):
             try:
-                xml_content = file.read().decode('utf-8')
+                xml_content = file.read()
                 
                 if parse_and_save_nfe(xml_content):
                     return jsonify({'message': 'XML processado com sucesso'}), 200
@@ -82,92 +98,451 @@ def upload_xml():
         logging.exception("Erro geral no upload")
         return jsonify({'error': f'Erro geral: {str(e)}'}), 500
 
+@job_handler('upload_xmls')
+def _job_upload_xmls(ctx):
+    arquivos = ctx.parametros['_arquivos']
+    with connect() as connection:
+        ingestor = NFeBatchIngestor(connection, batch_size=ctx.parametros['batch_size'])
+        for enviados, (nome, caminho) in enumerate(arquivos):
+            ctx.progress(enviados, len(arquivos), nome)
+            with open(caminho, 'rb') as stream:
+                _ingest_upload(ingestor, nome, stream)
+        resumo = ingestor.close()
+    ctx.progress(len(arquivos), len(arquivos))
+    return resumo
+
+@opme_bp.route('/upload_xmls', methods=['POST'])
+def upload_xmls():
+    """Importa vários XMLs e/ou ZIPs de uma vez, gravando em lotes"""
+    try:
+        files = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+        if not files:
+            return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+
+        batch_size = request.values.get('batch_size', type=int) or \
+            current_app.config.get('NFE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+        # assincrono=1: os arquivos vão para o spool e a importação vira uma
+        # tarefa de prioridade interativa (à frente das sincronizações)
+        if request.values.get('assincrono', '').lower() in ('1', 'true', 'sim'):
+            arquivos = []
+            for file in files:
+                caminho = spool_path(file.filename)
+                file.save(caminho)
+                arquivos.append((file.filename, caminho))
+            job_id = submit_job(
+                'upload_xmls',
+                {'arquivos': [nome for nome, _ in arquivos], '_arquivos': arquivos, 'batch_size': batch_size},
+                prioridade=PRIORIDADE_INTERATIVA
+            )
+            return jsonify({'job_id': job_id, 'status': STATUS_PENDENTE}), 202
+
+        with connect() as connection:
+            ingestor = NFeBatchIngestor(connection, batch_size=batch_size)
+            for file in files:
+                _ingest_upload(ingestor, file.filename, file.stream)
+            resumo = ingestor.close()
+
+        return jsonify(resumo), 200
+
+    except Exception as e:
+        logging.exception("Erro geral no upload em lote")
+        return jsonify({'error': f'Erro geral: {str(e)}'}), 500
+
+@opme_bp.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """Acertos do cache de documentos por hash desde o início do processo"""
+    return jsonify(DOCUMENT_CACHE_STATS.snapshot()), 200
+
+def _balance_query_from_args():
+    # Saldo agregado no banco (GROUP BY), com filtros opcionais;
+    # as_of=AAAA-MM-DD devolve o saldo ao fim daquele dia e em_aberto=1
+    # descarta os saldos zerados
+    return balance_query(
+        cnpj_cliente=request.args.get('cnpj_cliente'),
+        codigo_produto=request.args.get('codigo_produto'),
+        lote=request.args.get('lote'),
+        data_inicio=request.args.get('data_inicio'),
+        data_fim=request.args.get('data_fim'),
+        as_of=request.args.get('as_of'),
+        em_aberto=request.args.get('em_aberto', '').lower() in ('1', 'true', 'sim')
+    )
+
 @opme_bp.route('/balance', methods=['GET'])
+@cached_response
 def get_balance():
     try:
-        cnpj_cliente = request.args.get('cnpj_cliente')
-        
-        # Consulta usando ORM
-        movements = db.session.query(
-            NFeHeader.nNF,
-            NFeHeader.dEmi,
-            NFeHeader.CNPJ_dest,
-            NFeHeader.xNome_dest,
-            NFeItem.cProd,
-            NFeItem.xProd,
-            NFeItem.CFOP,
-            NFeItem.qCom,
-            NFeItem.nLote,
-            NFeItem.qLote
-        ).join(NFeItem).filter(
-            NFeHeader.CNPJ_dest == cnpj_cliente
-        ).all()
-        
-        # Cálculo do saldo
-        balance = {}
-        for mov in movements:
-            key = (mov.CNPJ_dest, mov.xNome_dest, mov.cProd, mov.xProd, mov.nLote)
-            
-            if mov.CFOP in ['5102', '6102']:  # Entradas
-                balance.setdefault(key, 0)
-                balance[key] += mov.qCom
-            elif mov.CFOP in ['5405', '6405']:  # Saídas
-                balance.setdefault(key, 0)
-                balance[key] -= mov.qCom
-        
+        query, params = _balance_query_from_args()
+        with connect(readonly=True) as connection:
+            rows = connection.execute(text(query), params).all()
+
         # Formata resposta
         balance_list = [{
-            'cnpj_cliente': key[0],
-            'nome_cliente': key[1],
-            'codigo_produto': key[2],
-            'descricao_produto': key[3],
-            'lote': key[4],
-            'saldo': saldo
-        } for key, saldo in balance.items()]
+            'cnpj_cliente': cnpj,
+            'nome_cliente': nome,
+            'codigo_produto': cprod,
+            'descricao_produto': xprod,
+            'lote': lote,
+            'saldo': from_scaled(saldo)
+        } for cnpj, nome, cprod, xprod, lote, saldo in rows]
         
         return jsonify(balance_list), 200
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logging.exception("Erro ao calcular saldo")
         return jsonify({'error': f'Erro ao calcular saldo: {str(e)}'}), 500
 
+@opme_bp.route('/lotes/vencendo', methods=['GET'])
+def get_lotes_vencendo():
+    """
+    Lotes em consignação que vencem nos próximos `dias` dias (padrão 30), por cliente.
+
+    Parâmetros opcionais: cnpj_cliente e vencidos=1 (inclui os já vencidos).
+    Só entram lotes com material em poder do cliente no razão de saldos.
+    """
+    try:
+        dias = int(request.args.get('dias', 30))
+    except ValueError:
+        return jsonify({'error': 'dias deve ser um número inteiro'}), 400
+
+    try:
+        hoje = date.today()
+        query, params = expiring_lots_query(
+            dias,
+            hoje=hoje,
+            cnpj_cliente=request.args.get('cnpj_cliente'),
+            vencidos=request.args.get('vencidos', '').lower() in ('1', 'true', 'sim')
+        )
+
+        with connect(readonly=True) as connection:
+            rows = connection.execute(text(query), params).all()
+
+        clientes = []
+        for cnpj, nome, cprod, xprod, lote, dval, quantidade in rows:
+            # SQLite devolve a data como texto; PostgreSQL, como date
+            validade = dval if isinstance(dval, date) else date.fromisoformat(dval)
+            if not clientes or clientes[-1]['cnpj_cliente'] != cnpj:
+                clientes.append({
+                    'cnpj_cliente': cnpj,
+                    'nome_cliente': nome,
+                    'quantidade': 0,
+                    'lotes': []
+                })
+            cliente = clientes[-1]
+            cliente['quantidade'] += quantidade
+            cliente['lotes'].append({
+                'codigo_produto': cprod,
+                'descricao_produto': xprod,
+                'lote': lote,
+                'validade': validade.isoformat(),
+                'dias_para_vencer': (validade - hoje).days,
+                'quantidade': from_scaled(quantidade)
+            })
+        for cliente in clientes:
+            cliente['quantidade'] = from_scaled(cliente['quantidade'])
+
+        return jsonify({
+            'data_referencia': hoje.isoformat(),
+            'data_limite': params['limite'],
+            'clientes': clientes
+        }), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logging.exception("Erro ao consultar lotes a vencer")
+        return jsonify({'error': f'Erro ao consultar lotes a vencer: {str(e)}'}), 500
+
+def _aging_dict(faixas, sem_remessa, mais_antiga):
+    quantidades = {rotulo: from_scaled(quantidade) for (rotulo, _), quantidade in zip(AGING_BUCKETS, faixas)}
+    if isinstance(mais_antiga, date):
+        mais_antiga = mais_antiga.isoformat()
+    return {
+        'faixas': quantidades,
+        'total': from_scaled(sum(faixas)),
+        'sem_remessa': from_scaled(sem_remessa),
+        'remessa_mais_antiga': mais_antiga
+    }
+
+@opme_bp.route('/aging', methods=['GET'])
+def get_aging():
+    """
+    Idade do material em poder de cada cliente, por faixa de dias desde a remessa.
+
+    As remessas em aberto vêm das filas FIFO (src/fifo.py), já casadas com os
+    retornos. Parâmetros opcionais: cnpj_cliente e detalhe=1 (uma linha por
+    produto e lote de cada cliente).
+    """
+    try:
+        hoje = date.today()
+        detalhe = request.args.get('detalhe', '').lower() in ('1', 'true', 'sim')
+        query, params = aging_query(
+            hoje=hoje, cnpj_cliente=request.args.get('cnpj_cliente'), detalhe=detalhe
+        )
+        n = len(AGING_BUCKETS)
+        with connect(readonly=True) as connection:
+            rows = connection.execute(text(query), params).all()
+
+        clientes = []
+        for row in rows:
+            cnpj, nome = row[0], row[1]
+            if not detalhe:
+                clientes.append({'cnpj_cliente': cnpj, 'nome_cliente': nome, **_aging_dict(row[2:2 + n], *row[2 + n:])})
+                continue
+            if not clientes or clientes[-1]['cnpj_cliente'] != cnpj:
+                clientes.append({'cnpj_cliente': cnpj, 'nome_cliente': nome, 'itens': []})
+            clientes[-1]['itens'].append({
+                'codigo_produto': row[2],
+                'descricao_produto': row[3],
+                'lote': row[4],
+                **_aging_dict(row[5:5 + n], *row[5 + n:])
+            })
+
+        return jsonify({
+            'data_referencia': hoje.isoformat(),
+            'faixas': [rotulo for rotulo, _ in AGING_BUCKETS],
+            'clientes': clientes
+        }), 200
+
+    except Exception as e:
+        logging.exception("Erro ao calcular idade da consignação")
+        return jsonify({'error': f'Erro ao calcular idade da consignação: {str(e)}'}), 500
+
+def _search_filter(tipo, chave, cprod):
+    """Parâmetros de /api/balance para a sugestão escolhida."""
+    if tipo == TIPO_CLIENTE:
+        return {'cnpj_cliente': chave}
+    if tipo == TIPO_PRODUTO:
+        return {'codigo_produto': chave}
+    return {'codigo_produto': cprod, 'lote': chave}
+
+@opme_bp.route('/search', methods=['GET'])
+def search():
+    """
+    Sugestões de clientes, produtos e lotes para o texto digitado (busca por trecho).
+
+    Parâmetros: q (nome, descrição, CNPJ, código ou lote, em qualquer parte;
+    trechos a partir de 3 caracteres), tipo opcional (cliente, produto e/ou
+    lote, separados por vírgula) e limite (padrão 10, máximo 50). Cada
+    sugestão traz o filtro correspondente de /api/balance.
+    """
+    q = request.args.get('q', '')
+    tipos = [tipo.strip() for tipo in request.args.get('tipo', '').split(',') if tipo.strip()]
+    try:
+        limite = int(request.args.get('limite', DEFAULT_SEARCH_LIMIT))
+    except ValueError:
+        return jsonify({'error': 'limite deve ser um número inteiro'}), 400
+
+    try:
+        sugestoes = []
+        with connect(readonly=True) as connection:
+            query, params = search_query(q, connection.dialect.name, tipos=tipos, limite=limite)
+            rows = connection.execute(text(query), params).all() if query else []
+        for tipo, chave, cprod, descricao in rows:
+            sugestao = {'tipo': tipo, 'codigo': chave, 'descricao': descricao}
+            if cprod:
+                sugestao['codigo_produto'] = cprod
+            sugestao['filtro'] = _search_filter(tipo, chave, cprod)
+            sugestoes.append(sugestao)
+        return jsonify({'q': q, 'sugestoes': sugestoes}), 200
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logging.exception("Erro na busca")
+        return jsonify({'error': f'Erro na busca: {str(e)}'}), 500
+
+def _encode_cursor(dEmi, item_id):
+    """Cursor opaco com a chave (dEmi, id do item) da última linha entregue."""
+    raw = json.dumps([dEmi.isoformat(), item_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        dEmi, item_id = json.loads(raw)
+        return date.fromisoformat(dEmi), int(item_id)
+    except (ValueError, TypeError):
+        raise ValueError('cursor inválido')
+
+def movements_query(cnpj_cliente, cursor=None):
+    """Movimentações ordenadas por (dEmi, id do item), a partir do cursor (exclusivo)."""
+    query = select(
+        NFeHeader.nNF,
+        NFeHeader.dEmi,
+        Cliente.CNPJ,
+        Cliente.xNome,
+        NFeItem.id,
+        Produto.cProd,
+        Produto.xProd,
+        NFeItem.CFOP,
+        NFeItem.qCom,
+        LoteInfo.nLote,
+        LoteInfo.qLote
+    ).select_from(NFeHeader).join(
+        NFeItem, NFeItem.nfe_header_id == NFeHeader.id
+    ).join(
+        Cliente, Cliente.id == NFeHeader.cliente_id
+    ).join(
+        Produto, Produto.id == NFeItem.produto_id
+    ).outerjoin(
+        LoteInfo, LoteInfo.nfe_item_id == NFeItem.id
+    )
+    if cnpj_cliente:
+        query = query.where(NFeHeader.cliente_id == select(Cliente.id).where(
+            Cliente.CNPJ == cnpj_cliente
+        ).scalar_subquery())
+    if cursor:
+        dEmi, item_id = cursor
+        query = query.where(or_(
+            NFeHeader.dEmi > dEmi,
+            and_(NFeHeader.dEmi == dEmi, NFeItem.id > item_id)
+        ))
+    return query.order_by(NFeHeader.dEmi, NFeItem.id)
+
+def _movement_row(mov):
+    """Linha na ordem de MOVEMENT_COLUMNS (acesso posicional: é o caminho quente das exportações)."""
+    nNF, dEmi, CNPJ_dest, xNome_dest, _item_id, cProd, xProd, CFOP, qCom, nLote, qLote = mov
+    return (nNF, dEmi.isoformat(), CNPJ_dest, xNome_dest, cProd, xProd, CFOP,
+            from_scaled(qCom), nLote, from_scaled(qLote))
+
+def _movement_dict(mov):
+    return dict(zip(MOVEMENT_COLUMNS, _movement_row(mov)))
+
+def _iter_movements(query):
+    """
+    Percorre a consulta em blocos de STREAM_CHUNK_SIZE linhas (cursor no servidor
+    no PostgreSQL), por uma conexão do pool somente leitura que fica aberta
+    enquanto a resposta é enviada.
+    """
+    with connect(readonly=True) as connection:
+        yield from connection.execute(query, execution_options={'yield_per': STREAM_CHUNK_SIZE})
+
+def _stream_movements(query, ndjson):
+    """Gera a resposta linha a linha a partir de um cursor do banco (yield_per)."""
+    dumps = current_app.json.dumps
+    if ndjson:
+        for mov in _iter_movements(query):
+            yield dumps(_movement_dict(mov)) + '\n'
+        return
+
+    # Mesmo formato de antes (uma lista JSON), sem montar a lista em memória
+    separador = '['
+    for mov in _iter_movements(query):
+        yield separador + dumps(_movement_dict(mov))
+        separador = ','
+    yield '[]' if separador == '[' else ']'
+
 @opme_bp.route('/movements', methods=['GET'])
 def get_movements():
+    """
+    Movimentações de um cliente (ou de todos), em ordem de emissão.
+
+    - padrão: lista JSON completa, enviada em streaming;
+    - limit/cursor: página {"movimentacoes": [...], "proximo_cursor": ...};
+    - format=ndjson: uma movimentação por linha (application/x-ndjson),
+      também aceitando cursor para retomar de onde parou.
+    """
     try:
         cnpj_cliente = request.args.get('cnpj_cliente')
-        
-        movements = db.session.query(
-            NFeHeader.nNF,
-            NFeHeader.dEmi,
-            NFeHeader.CNPJ_dest,
-            NFeHeader.xNome_dest,
-            NFeItem.cProd,
-            NFeItem.xProd,
-            NFeItem.CFOP,
-            NFeItem.qCom,
-            NFeItem.nLote,
-            NFeItem.qLote
-        ).join(NFeItem).filter(
-            NFeHeader.CNPJ_dest == cnpj_cliente
-        ).all()
-        
-        movements_list = []
-        for mov in movements:
-            movements_list.append({
-                'numero_nf': mov.nNF,
-                'data_emissao': mov.dEmi.strftime('%Y-%m-%d'),
-                'cnpj_cliente': mov.CNPJ_dest,
-                'nome_cliente': mov.xNome_dest,
-                'codigo_produto': mov.cProd,
-                'descricao_produto': mov.xProd,
-                'cfop': mov.CFOP,
-                'quantidade': mov.qCom,
-                'lote': mov.nLote,
-                'quantidade_lote': mov.qLote
-            })
-        
-        return jsonify(movements_list), 200
+        cursor = request.args.get('cursor')
+        limit = request.args.get('limit', type=int)
+        try:
+            cursor = _decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        query = movements_query(cnpj_cliente, cursor)
+
+        if request.args.get('format') == 'ndjson':
+            return Response(
+                stream_with_context(_stream_movements(query, ndjson=True)),
+                mimetype='application/x-ndjson'
+            )
+
+        if limit is not None or cursor is not None:
+            limit = max(1, min(limit or MOVEMENTS_PAGE_MAX, MOVEMENTS_PAGE_MAX))
+            with connect(readonly=True) as connection:
+                rows = connection.execute(query.limit(limit + 1)).all()
+            proximo = None
+            if len(rows) > limit:
+                rows = rows[:limit]
+                proximo = _encode_cursor(rows[-1].dEmi, rows[-1].id)
+            return jsonify({
+                'movimentacoes': [_movement_dict(mov) for mov in rows],
+                'proximo_cursor': proximo
+            }), 200
+
+        return Response(
+            stream_with_context(_stream_movements(query, ndjson=False)),
+            mimetype='application/json'
+        )
         
     except Exception as e:
         logging.exception("Erro ao obter movimentações")
-        return jsonify({'error': f'Erro ao obter movimentações: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'Erro ao obter movimentações: {str(e)}'}), 500
+
+def _export_response(nome, header, rows):
+    """
+    Resposta de exportação em streaming: CSV (padrão) ou XLSX (format=xlsx).
+
+    O CSV é comprimido com gzip quando o cliente aceita (Accept-Encoding);
+    o XLSX já é um ZIP comprimido e vai como está.
+    """
+    formato = request.args.get('format', 'csv')
+    if formato not in ('csv', 'xlsx'):
+        return jsonify({'error': 'format deve ser csv ou xlsx'}), 400
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="{nome}-{datetime.now():%Y%m%d}.{formato}"',
+        'Vary': 'Accept-Encoding'
+    }
+    if formato == 'xlsx':
+        body = xlsx_stream(header, rows, sheet_name=nome)
+        mimetype = XLSX_MIMETYPE
+    else:
+        body = csv_stream(header, rows)
+        mimetype = 'text/csv'
+        if request.accept_encodings['gzip']:
+            body = gzip_stream(body)
+            headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(body), mimetype=mimetype, headers=headers)
+
+@opme_bp.route('/export/balance', methods=['GET'])
+def export_balance():
+    """Saldos (mesmos filtros de /balance) em CSV ou XLSX, lidos do cursor do banco"""
+    try:
+        query, params = _balance_query_from_args()
+
+        def linhas():
+            with connect(readonly=True) as connection:
+                for *chave, saldo in connection.execute(
+                    text(query), params, execution_options={'yield_per': STREAM_CHUNK_SIZE}
+                ):
+                    yield (*chave, from_scaled(saldo))
+
+        return _export_response('saldos', BALANCE_COLUMNS, linhas())
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logging.exception("Erro ao exportar saldos")
+        return jsonify({'error': f'Erro ao exportar saldos: {str(e)}'}), 500
+
+@opme_bp.route('/export/movements', methods=['GET'])
+def export_movements():
+    """Movimentações (mesmos filtros de /movements) em CSV ou XLSX"""
+    try:
+        query = movements_query(request.args.get('cnpj_cliente'))
+
+        def linhas():
+            for mov in _iter_movements(query):
+                yield _movement_row(mov)
+
+        return _export_response('movimentacoes', MOVEMENT_COLUMNS, linhas())
+
+    except Exception as e:
+        logging.exception("Erro ao exportar movimentações")
+        return jsonify({'error': f'Erro ao exportar movimentações: {str(e)}'}), 500
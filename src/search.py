@@ -0,0 +1,273 @@
+"""
+Busca por trecho de texto em clientes, produtos e lotes (GET /api/search).
+
+search_entry tem uma linha por cliente (CNPJ), produto (cProd) e lote (nLote
+de um produto), com o id da dimensão cliente ou produto; a descrição
+exibida vem da dimensão. A coluna termo junta código e descrição já
+normalizados (maiúsculas, sem acentos, CNPJ sem pontuação) e é o que o
+índice de trigramas cobre:
+
+- SQLite: tabela FTS5 search_fts (tokenize='trigram') com conteúdo externo
+  em search_entry, sincronizada por triggers;
+- PostgreSQL: índice GIN com gin_trgm_ops (extensão pg_trgm) em termo.
+
+Os dois atendem buscas por trecho a partir de 3 caracteres em qualquer
+posição. Consultas mais curtas buscam pelo início do código (o índice único
+começa por chave).
+
+As entradas são gravadas na mesma transação da importação
+(insert_nfe_records); uma descrição nova (ex.: cliente que mudou de razão
+social) substitui a anterior. rebuild_ledger (python -m src.rebuild_saldo)
+recria o índice.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+from sqlalchemy import text
+
+TIPO_CLIENTE = "cliente"
+TIPO_PRODUTO = "produto"
+TIPO_LOTE = "lote"
+TIPOS = (TIPO_CLIENTE, TIPO_PRODUTO, TIPO_LOTE)
+
+# O trigrama é a menor unidade do índice
+MIN_TRECHO = 3
+DEFAULT_SEARCH_LIMIT = 10
+SEARCH_LIMIT_MAX = 50
+
+# Tabela FTS5 e triggers do SQLite (também em database_setup.py)
+SQLITE_FTS_DDL = (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+        termo, content='search_entry', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_entry_ai AFTER INSERT ON search_entry BEGIN
+        INSERT INTO search_fts (rowid, termo) VALUES (new.id, new.termo);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_entry_ad AFTER DELETE ON search_entry BEGIN
+        INSERT INTO search_fts (search_fts, rowid, termo) VALUES ('delete', old.id, old.termo);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS search_entry_au AFTER UPDATE OF termo ON search_entry BEGIN
+        INSERT INTO search_fts (search_fts, rowid, termo) VALUES ('delete', old.id, old.termo);
+        INSERT INTO search_fts (rowid, termo) VALUES (new.id, new.termo);
+    END
+    """,
+)
+
+# Só regrava (e reindexa) quando o termo mudou
+UPSERT_ENTRY_SQL = """
+    INSERT INTO search_entry (chave, tipo, dimensao_id, termo)
+    VALUES (:chave, :tipo, :dimensao_id, :termo)
+    ON CONFLICT (chave, tipo, dimensao_id) DO UPDATE SET
+        termo = excluded.termo
+    WHERE search_entry.termo <> excluded.termo
+"""
+
+# Entradas de todas as NF-es gravadas, com os nomes das dimensões cliente e
+# produto (os mais recentes); emitentes que nunca foram destinatários ficam de fora
+REBUILD_ENTRIES_SQL = """
+    SELECT :cliente, c."CNPJ", c.id, '', c."xNome"
+    FROM cliente c
+    WHERE EXISTS (SELECT 1 FROM nfe_header nh WHERE nh.cliente_id = c.id)
+    UNION ALL
+    SELECT :produto, p."cProd", p.id, '', p."xProd"
+    FROM produto p
+    UNION ALL
+    SELECT :lote, lotes."nLote", p.id, p."cProd", p."xProd"
+    FROM (
+        SELECT DISTINCT li."nLote", ni.produto_id
+        FROM lote_info li
+        JOIN nfe_item ni ON ni.id = li.nfe_item_id
+        WHERE li."nLote" IS NOT NULL AND li."nLote" <> ''
+    ) lotes
+    JOIN produto p ON p.id = lotes.produto_id
+"""
+
+# Código do produto (só nos lotes) e descrição pelas dimensões
+_COLUNAS = f"""
+    e.tipo, e.chave,
+    CASE WHEN e.tipo = '{TIPO_LOTE}' THEN p."cProd" ELSE '' END,
+    COALESCE(c."xNome", p."xProd")
+"""
+_DIMENSOES = f"""
+    LEFT JOIN cliente c ON e.tipo = '{TIPO_CLIENTE}' AND c.id = e.dimensao_id
+    LEFT JOIN produto p ON e.tipo <> '{TIPO_CLIENTE}' AND p.id = e.dimensao_id
+"""
+
+
+# Clientes e produtos se repetem em quase todas as notas
+@lru_cache(maxsize=65536)
+def normalize(texto):
+    """Maiúsculas, sem acentos e espaços repetidos; pontuação entre dígitos (CNPJ) some."""
+    sem_acento = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode("ascii")
+    sem_pontuacao = re.sub(r"(?<=\d)[./-](?=\d)", "", sem_acento.upper())
+    return " ".join(sem_pontuacao.split())
+
+
+def _entry(tipo, chave, dimensao_id, cProd, descricao):
+    partes = (chave, descricao, cProd) if tipo == TIPO_LOTE else (chave, descricao)
+    return {
+        "tipo": tipo,
+        "chave": chave,
+        "dimensao_id": dimensao_id,
+        "termo": normalize(" ".join(parte for parte in partes if parte))
+    }
+
+
+def record_entries(records, cliente_ids, produto_ids):
+    """
+    Entradas de busca de NF-es parseadas; a última nota de cada chave prevalece.
+
+    Args:
+        records (list): NFeRecord
+        cliente_ids (dict): CNPJ -> cliente.id
+        produto_ids (dict): cProd -> produto.id
+    """
+    entradas = {}
+    for record in records:
+        entradas[(record.CNPJ_dest, TIPO_CLIENTE, cliente_ids[record.CNPJ_dest])] = ("", record.xNome_dest)
+        for product in record.products:
+            produto_id = produto_ids[product.cProd]
+            entradas[(product.cProd, TIPO_PRODUTO, produto_id)] = ("", product.xProd)
+            if product.lote_info.nLote:
+                entradas[(product.lote_info.nLote, TIPO_LOTE, produto_id)] = (product.cProd, product.xProd)
+    return [
+        _entry(tipo, chave, dimensao_id, cProd, descricao)
+        for (chave, tipo, dimensao_id), (cProd, descricao) in entradas.items()
+    ]
+
+
+def update_search_index(connection, records, primeira_nfe_id, cliente_ids, produto_ids):
+    """
+    Grava as entradas de busca das NF-es recém-gravadas (mesma transação do insert).
+
+    Em um banco com notas anteriores e índice ainda vazio (antes da migração
+    0011), o índice é criado de uma vez com rebuild_search_index.
+    """
+    if connection.execute(text("SELECT 1 FROM search_entry LIMIT 1")).first() is None and connection.execute(
+        text("SELECT 1 FROM nfe_header WHERE id < :id LIMIT 1"), {"id": primeira_nfe_id}
+    ).first() is not None:
+        rebuild_search_index(connection)
+        return
+
+    entradas = record_entries(records, cliente_ids, produto_ids)
+    if entradas:
+        connection.execute(text(UPSERT_ENTRY_SQL), entradas)
+
+
+def rebuild_search_index(connection):
+    """Apaga e recria search_entry (e, pelos triggers, search_fts) a partir das NF-es."""
+    connection.execute(text("DELETE FROM search_entry"))
+    rows = connection.execute(
+        text(REBUILD_ENTRIES_SQL),
+        {"cliente": TIPO_CLIENTE, "produto": TIPO_PRODUTO, "lote": TIPO_LOTE}
+    )
+    entradas = [_entry(*row) for row in rows]
+    if entradas:
+        connection.execute(text(UPSERT_ENTRY_SQL), entradas)
+    return len(entradas)
+
+
+def _like(trecho):
+    return trecho.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_query(q, dialect, tipos=None, limite=DEFAULT_SEARCH_LIMIT):
+    """
+    Monta a consulta de sugestões para o texto digitado.
+
+    Todas as palavras precisam aparecer (em qualquer ordem) no código ou na
+    descrição. Entradas em que alguma palavra começa o código ou a descrição
+    vêm primeiro.
+
+    Args:
+        q (str): Texto digitado
+        dialect (str): "sqlite" ou "postgresql"
+        tipos (list, optional): Subconjunto de TIPOS
+        limite (int): Máximo de sugestões (até SEARCH_LIMIT_MAX)
+
+    Returns:
+        tuple: (SQL, parâmetros), ou (None, None) se não há o que buscar
+
+    Raises:
+        ValueError: tipo desconhecido
+    """
+    palavras = normalize(q).split()
+    if not palavras:
+        return None, None
+
+    params = {"limite": max(1, min(int(limite), SEARCH_LIMIT_MAX))}
+    filtros = []
+    if tipos:
+        desconhecidos = set(tipos) - set(TIPOS)
+        if desconhecidos:
+            raise ValueError(f"tipo deve ser um de: {', '.join(TIPOS)}")
+        nomes = []
+        for i, tipo in enumerate(sorted(set(tipos))):
+            params[f"tipo{i}"] = tipo
+            nomes.append(f":tipo{i}")
+        filtros.append(f"e.tipo IN ({', '.join(nomes)})")
+
+    longas = [palavra for palavra in palavras if len(palavra) >= MIN_TRECHO]
+    if not longas:
+        # Sem trigramas para buscar: início do código, pelo índice único (chave, tipo, dimensao_id)
+        inicio = " ".join(palavras)
+        params["inicio"] = inicio
+        params["fim"] = inicio[:-1] + chr(ord(inicio[-1]) + 1)
+        filtros.insert(0, "e.chave >= :inicio AND e.chave < :fim")
+        return f"""
+            SELECT {_COLUNAS}
+            FROM search_entry e
+            {_DIMENSOES}
+            WHERE {' AND '.join(filtros)}
+            ORDER BY e.chave, e.tipo, e.dimensao_id
+            LIMIT :limite
+        """, params
+
+    # No SQLite as palavras longas vão para o MATCH e as curtas filtram as linhas
+    # encontradas; no PostgreSQL o índice de trigramas atende o próprio LIKE
+    for i, palavra in enumerate(palavras):
+        if dialect == "sqlite" and len(palavra) >= MIN_TRECHO:
+            continue
+        params[f"trecho{i}"] = f"%{_like(palavra)}%"
+        filtros.append(f"e.termo LIKE :trecho{i} ESCAPE '\\'")
+
+    inicios = []
+    for i, palavra in enumerate(longas):
+        params[f"inicio{i}"] = f"% {_like(palavra)}%"
+        inicios.append(f"' ' || e.termo LIKE :inicio{i} ESCAPE '\\'")
+    prioridade = f"CASE WHEN {' OR '.join(inicios)} THEN 0 ELSE 1 END"
+
+    if dialect == "sqlite":
+        # Frase entre aspas: o trigrama casa o trecho em qualquer posição
+        params["consulta"] = " AND ".join('"' + palavra.replace('"', '""') + '"' for palavra in longas)
+        filtros.insert(0, "search_fts MATCH :consulta")
+        return f"""
+            SELECT {_COLUNAS}
+            FROM search_fts
+            JOIN search_entry e ON e.id = search_fts.rowid
+            {_DIMENSOES}
+            WHERE {' AND '.join(filtros)}
+            ORDER BY {prioridade}, search_fts.rank
+            LIMIT :limite
+        """, params
+
+    if dialect == "postgresql":
+        params["texto"] = " ".join(palavras)
+        return f"""
+            SELECT {_COLUNAS}
+            FROM search_entry e
+            {_DIMENSOES}
+            WHERE {' AND '.join(filtros)}
+            ORDER BY {prioridade}, similarity(e.termo, :texto) DESC, e.termo
+            LIMIT :limite
+        """, params
+
+    raise ValueError(f"Dialeto não suportado: {dialect}")
@@ -0,0 +1,57 @@
+"""
+Serviços do app (XMLProcessor, EstoqueService, MainoAPI), construídos no
+primeiro uso e guardados em app.extensions.
+
+Nada é criado na importação nem em create_app(): com gunicorn --preload a
+sessão HTTP do MainoAPI nasce no próprio worker, depois do fork, e não é
+compartilhada com os outros processos.
+
+    maino_api = get_service("maino_api")
+"""
+import threading
+
+from flask import current_app
+
+_lock = threading.Lock()
+
+
+def _xml_processor(app):
+    from .xml_processor import XMLProcessor
+    return XMLProcessor()
+
+
+def _estoque_service(app):
+    from .estoque_service import EstoqueService
+    return EstoqueService()
+
+
+def _maino_api(app):
+    from .maino_api import MainoAPI
+    from ..maino_integration import DEFAULT_TIMEOUT
+    return MainoAPI(
+        api_key=app.config.get('MAINO_API_KEY'),
+        bearer_token=app.config.get('MAINO_BEARER_TOKEN'),
+        requests_per_second=app.config.get('MAINO_REQUESTS_PER_SECOND', 5),
+        pool_size=app.config.get('MAINO_FETCH_WORKERS', 8),
+        timeout=app.config.get('MAINO_TIMEOUT', DEFAULT_TIMEOUT)
+    )
+
+
+SERVICE_FACTORIES = {
+    "xml_processor": _xml_processor,
+    "estoque_service": _estoque_service,
+    "maino_api": _maino_api,
+}
+
+
+def get_service(nome, app=None):
+    """Instância única do serviço no app (o atual, por padrão), criada na primeira chamada."""
+    app = app or current_app._get_current_object()
+    servicos = app.extensions.setdefault("opme_services", {})
+    servico = servicos.get(nome)
+    if servico is None:
+        with _lock:
+            servico = servicos.get(nome)
+            if servico is None:
+                servico = servicos[nome] = SERVICE_FACTORIES[nome](app)
+    return servico
@@ -1,4 +1,5 @@
-from ..opme_logic import get_opme_movements, calculate_balance
+from ..fixed_point import from_scaled
+from ..opme_logic import get_balance
 
 class EstoqueService:
     """
@@ -10,54 +11,27 @@ class EstoqueService:
         # usando seus models/SQLAlchemy.
         return True
 
-    def get_estoque_resumo(self):
-        # Retorna um resumo (balance) como serializável JSON
-        movements = get_opme_movements()
-        balance = calculate_balance(movements)
+    def get_estoque_resumo(self, as_of=None):
+        # Retorna um resumo (balance) como serializável JSON; o saldo é
+        # agregado no banco e só as linhas resultantes chegam aqui.
+        # as_of (AAAA-MM-DD) dá o saldo ao fim daquele dia
+        return self._saldos(as_of=as_of)
+
+    def get_estoque_por_produto(self, codigo_produto, as_of=None):
+        return self._saldos(codigo_produto=codigo_produto, as_of=as_of)
+
+    def get_estoque_por_cliente(self, cnpj_cliente, as_of=None):
+        return self._saldos(cnpj_cliente=cnpj_cliente, as_of=as_of)
+
+    def _saldos(self, **filtros):
         readable = []
-        for k, v in balance.items():
-            cnpj, nome, cprod, xprod, lote = k
+        for cnpj, nome, cprod, xprod, lote, v in get_balance(**filtros):
             readable.append({
                 "cnpj": cnpj,
                 "nome": nome,
                 "codigo_produto": cprod,
                 "descricao_produto": xprod,
                 "lote": lote,
-                "saldo": v
+                "saldo": from_scaled(v)
             })
         return readable
-
-    def get_estoque_por_produto(self, codigo_produto):
-        movements = get_opme_movements()
-        resultados = []
-        for m in movements:
-            _, dEmi, CNPJ_dest, xNome_dest, cProd, xProd, CFOP, qCom, nLote, qLote = m
-            if str(cProd) == str(codigo_produto):
-                resultados.append({
-                    "data_emissao": dEmi,
-                    "cnpj_cliente": CNPJ_dest,
-                    "nome_cliente": xNome_dest,
-                    "codigo_produto": cProd,
-                    "descricao_produto": xProd,
-                    "cfop": CFOP,
-                    "quantidade": qLote if qLote else qCom,
-                    "lote": nLote or ""
-                })
-        return resultados
-
-    def get_estoque_por_cliente(self, cnpj_cliente):
-        movements = get_opme_movements(cnpj_cliente=cnpj_cliente)
-        resultados = []
-        for m in movements:
-            _, dEmi, CNPJ_dest, xNome_dest, cProd, xProd, CFOP, qCom, nLote, qLote = m
-            resultados.append({
-                "data_emissao": dEmi,
-                "cnpj_cliente": CNPJ_dest,
-                "nome_cliente": xNome_dest,
-                "codigo_produto": cProd,
-                "descricao_produto": xProd,
-                "cfop": CFOP,
-                "quantidade": qLote if qLote else qCom,
-                "lote": nLote or ""
-            })
-        return resultados
\ No newline at end of file
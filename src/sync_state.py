@@ -0,0 +1,55 @@
+"""
+Estado da sincronização incremental com o Mainô.
+
+Cada conta/endpoint guarda uma marca d'água (o último dia sincronizado com
+sucesso); a próxima execução lista só a partir dela. Como a API filtra por
+dia, o próprio dia da marca é listado de novo, e as chaves de acesso já
+importadas são descartadas antes de qualquer download.
+"""
+from datetime import datetime
+
+from sqlalchemy import select
+
+from src.models.nfe import NFeHeader, SyncState
+
+# Chaves por consulta IN na checagem de chaves conhecidas
+KNOWN_KEYS_CHUNK = 500
+
+
+def get_watermark(connection, conta, endpoint):
+    """Devolve o último dia sincronizado (date) ou None na primeira execução."""
+    table = SyncState.__table__
+    return connection.execute(
+        select(table.c.watermark).where(
+            table.c.conta == conta,
+            table.c.endpoint == endpoint
+        )
+    ).scalar()
+
+
+def set_watermark(connection, conta, endpoint, watermark):
+    """Grava a marca d'água; nunca a move para trás."""
+    table = SyncState.__table__
+    atual = get_watermark(connection, conta, endpoint)
+    agora = datetime.now()
+    if atual is None:
+        connection.execute(table.insert().values(
+            conta=conta, endpoint=endpoint, watermark=watermark, atualizado_em=agora
+        ))
+    elif watermark >= atual:
+        connection.execute(table.update().where(
+            table.c.conta == conta,
+            table.c.endpoint == endpoint
+        ).values(watermark=watermark, atualizado_em=agora))
+
+
+def known_keys(connection, chaves):
+    """Subconjunto de `chaves` (chNFe) que já está em nfe_header, via índice único."""
+    table = NFeHeader.__table__
+    chaves = list({chave for chave in chaves if chave})
+    conhecidas = set()
+    for inicio in range(0, len(chaves), KNOWN_KEYS_CHUNK):
+        conhecidas.update(connection.execute(
+            select(table.c.chNFe).where(table.c.chNFe.in_(chaves[inicio:inicio + KNOWN_KEYS_CHUNK]))
+        ).scalars())
+    return conhecidas
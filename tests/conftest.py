@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# Os testes importam o pacote src a partir da raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def migrated_app(url):
+    """App com o esquema das migrações aplicado ao banco de `url`."""
+    from flask_migrate import upgrade
+    from src.main import create_app
+
+    app = create_app({"SQLALCHEMY_DATABASE_URI": url, "JOB_WORKERS": 0})
+    with app.app_context():
+        upgrade()
+    return app
+
+
+@pytest.fixture
+def sqlite_app(tmp_path):
+    """App sobre um SQLite temporário, já migrado."""
+    from src.extensions import db
+
+    app = migrated_app(f"sqlite:///{tmp_path / 'app.db'}")
+    yield app
+    with app.app_context():
+        db.engine.dispose()
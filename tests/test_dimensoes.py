@@ -0,0 +1,59 @@
+"""
+Nomes de cliente nas respostas depois de uma troca de razão social: todas
+as rotas mostram o nome da dimensão cliente (o mais recente recebido).
+"""
+import re
+
+from benchmarks.nfe_generator import NFeGenerator
+from src.connections import get_engine
+from src.insert_nfe_data import NFeBatchIngestor
+
+
+def _nota(gerador, nome, itens):
+    _, xml = gerador.nota(itens)
+    xml = xml.replace(gerador.clientes[0].nome.encode(), nome.encode())
+    # Remessa em consignação: o lote fica em poder do cliente
+    return re.sub(rb"<CFOP>\d{4}</CFOP>", b"<CFOP>5917</CFOP>", xml)
+
+
+def _nomes(resposta, *caminho):
+    """Valores de nome_cliente/nome/descricao em qualquer nível da resposta JSON."""
+    nomes = set()
+    pendentes = [resposta]
+    while pendentes:
+        valor = pendentes.pop()
+        if isinstance(valor, list):
+            pendentes.extend(valor)
+        elif isinstance(valor, dict):
+            for chave, item in valor.items():
+                if chave in caminho:
+                    nomes.add(item)
+                else:
+                    pendentes.append(item)
+    return nomes
+
+
+def test_nome_do_cliente_e_o_mais_recente_em_todas_as_rotas(sqlite_app):
+    # A segunda nota traz só um dos dois produtos: a outra chave não recebe movimentação nova
+    gerador = NFeGenerator(clientes=1, produtos=2, lotes_por_produto=1, proporcao_rastro=1.0)
+    with sqlite_app.app_context(), get_engine().connect() as connection:
+        ingestor = NFeBatchIngestor(connection, batch_size=1)
+        ingestor.add("antiga.xml", _nota(gerador, "HOSPITAL ANTIGO", 2), is_file=False)
+        ingestor.add("nova.xml", _nota(gerador, "HOSPITAL NOVO", 1), is_file=False)
+        assert ingestor.close()["importados"] == 2
+
+    client = sqlite_app.test_client()
+    rotas = {
+        "/api/balance": ("nome_cliente",),
+        "/api/balance?as_of=2099-12-31": ("nome_cliente",),
+        "/api/balance?data_inicio=2000-01-01": ("nome_cliente",),
+        "/api/estoque/resumo": ("nome",),
+        "/api/lotes/vencendo?dias=36500&vencidos=1": ("nome_cliente",),
+        "/api/aging": ("nome_cliente",),
+        "/api/aging?detalhe=1": ("nome_cliente",),
+        "/api/search?q=HOSPITAL&tipo=cliente": ("descricao",),
+    }
+    for rota, campos in rotas.items():
+        resposta = client.get(rota)
+        assert resposta.status_code == 200, rota
+        assert _nomes(resposta.get_json(), *campos) == {"HOSPITAL NOVO"}, rota
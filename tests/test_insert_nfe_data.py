@@ -0,0 +1,62 @@
+"""
+NFeBatchIngestor sobre um SQLite migrado: resultado de cada arquivo e cache
+de documentos por hash dentro da mesma importação.
+"""
+from sqlalchemy import text
+
+from benchmarks.nfe_generator import NFeGenerator
+from src.connections import get_engine
+from src.insert_nfe_data import NFeBatchIngestor, STATUS_DUPLICADO, STATUS_ERRO, STATUS_IMPORTADO
+from src.opme_logic import rebuild_ledger
+
+
+def _importar(app, arquivos):
+    with app.app_context(), get_engine().connect() as connection:
+        ingestor = NFeBatchIngestor(connection, batch_size=10)
+        for nome, conteudo in arquivos:
+            ingestor.add(nome, conteudo, is_file=False)
+        return [(resultado["arquivo"], resultado["status"]) for resultado in ingestor.close()["arquivos"]]
+
+
+def test_segunda_copia_de_xml_invalido_continua_com_erro(sqlite_app):
+    invalido = b"<nfeProc><NFe>sem fechamento"
+
+    resultados = _importar(sqlite_app, [("a.xml", invalido), ("b.xml", invalido)])
+
+    assert resultados == [("a.xml", STATUS_ERRO), ("b.xml", STATUS_ERRO)]
+
+
+def test_segunda_copia_de_xml_valido_e_duplicada(sqlite_app):
+    _, xml = NFeGenerator(clientes=2, produtos=3, itens_por_nota=2).nota()
+
+    resultados = _importar(sqlite_app, [("a.xml", xml), ("b.xml", xml)])
+
+    assert resultados == [("a.xml", STATUS_IMPORTADO), ("b.xml", STATUS_DUPLICADO)]
+
+
+
+def test_copia_reconhecida_pelo_hash_traz_a_nota_gravada(sqlite_app):
+    chave, xml = NFeGenerator(clientes=2, produtos=3, itens_por_nota=2).nota()
+    _importar(sqlite_app, [("a.xml", xml)])
+
+    with sqlite_app.app_context(), get_engine().connect() as connection:
+        ingestor = NFeBatchIngestor(connection)
+        resultado = ingestor.add("b.xml", xml, is_file=False)
+        ingestor.close()
+
+    assert resultado["status"] == STATUS_DUPLICADO and resultado["cache"] is True
+    assert resultado["chNFe"] == chave
+    assert resultado["nNF"] == "1"
+
+
+def test_razao_vazio_com_notas_anteriores_e_recalculado_na_importacao(sqlite_app):
+    gerador = NFeGenerator(clientes=2, produtos=3, itens_por_nota=2)
+    _importar(sqlite_app, [("a.xml", gerador.nota()[1])])
+    # Banco migrado com `flask db upgrade`: notas gravadas e razão ainda vazio
+    with sqlite_app.app_context(), get_engine().begin() as connection:
+        connection.execute(text("DELETE FROM saldo_consignacao"))
+
+    assert _importar(sqlite_app, [("b.xml", gerador.nota()[1])]) == [("b.xml", STATUS_IMPORTADO)]
+
+    with sqlite_app.app_context():
+        assert rebuild_ledger(check_only=True) == []
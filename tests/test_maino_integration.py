@@ -0,0 +1,202 @@
+"""
+MainoAPI contra um servidor HTTP local (http.server) que simula a API do
+Mainô: espera exponencial em 429/5xx, Retry-After, timeout de leitura, limite
+de requisições por segundo e downloads em paralelo na ordem em que ficam prontos.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from src.maino_integration import MainoAPI, RateLimiter
+
+
+class StubServer:
+    """
+    Servidor local com respostas programadas por caminho.
+
+    `respostas[caminho]` é uma lista de (status, headers, corpo, atraso);
+    cada requisição consome a próxima, e a última se repete. Os horários de
+    chegada de cada requisição ficam em `chegadas`.
+    """
+    def __init__(self):
+        self.respostas = {}
+        self.chegadas = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                caminho = self.path.split("?")[0]
+                with stub._lock:
+                    stub.chegadas.append((time.monotonic(), caminho))
+                    fila = stub.respostas.get(caminho) or [(404, {}, b"", 0)]
+                    status, headers, corpo, atraso = fila.pop(0) if len(fila) > 1 else fila[0]
+                if atraso:
+                    time.sleep(atraso)
+                self.send_response(status)
+                for nome, valor in headers.items():
+                    self.send_header(nome, valor)
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def chegadas_em(self, caminho):
+        return [horario for horario, recebido in self.chegadas if recebido == caminho]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def servidor():
+    with StubServer() as stub:
+        yield stub
+
+
+def _api(servidor, **kwargs):
+    opcoes = {"api_key": "teste", "requests_per_second": 0, "backoff_base": 0.05, "conta": "teste"}
+    opcoes.update(kwargs)
+    return MainoAPI(base_url=servidor.base_url, **opcoes)
+
+
+def _xml_path(chave):
+    return f"/notas_fiscais_emitidas/{chave}/xml"
+
+
+@pytest.mark.parametrize("status", [429, 500, 503])
+def test_retenta_com_espera_exponencial(servidor, status):
+    caminho = _xml_path("1")
+    servidor.respostas[caminho] = [(status, {}, b"", 0), (status, {}, b"", 0), (200, {}, b"<nfe/>", 0)]
+
+    resultado = _api(servidor).get_nfe_xml_by_chave("1")
+
+    assert resultado == {"sucesso": True, "xml_content": b"<nfe/>"}
+    chegadas = servidor.chegadas_em(caminho)
+    assert len(chegadas) == 3
+    # backoff_base * 2**0 e backoff_base * 2**1 entre as tentativas
+    assert chegadas[1] - chegadas[0] >= 0.05
+    assert chegadas[2] - chegadas[1] >= 0.1
+
+
+def test_desiste_depois_de_max_retries(servidor):
+    caminho = _xml_path("1")
+    servidor.respostas[caminho] = [(503, {}, b"", 0)]
+
+    resultado = _api(servidor, max_retries=2).get_nfe_xml_by_chave("1")
+
+    assert resultado["sucesso"] is False
+    assert len(servidor.chegadas_em(caminho)) == 3
+
+
+def test_erro_do_cliente_nao_e_retentado(servidor):
+    caminho = _xml_path("1")
+    servidor.respostas[caminho] = [(404, {}, b"", 0)]
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        _api(servidor)._request(servidor.base_url + caminho, "xml")
+    assert len(servidor.chegadas_em(caminho)) == 1
+
+
+def test_respeita_retry_after(servidor):
+    caminho = _xml_path("1")
+    servidor.respostas[caminho] = [(429, {"Retry-After": "1"}, b"", 0), (200, {}, b"<nfe/>", 0)]
+
+    resultado = _api(servidor).get_nfe_xml_by_chave("1")
+
+    assert resultado["sucesso"] is True
+    chegadas = servidor.chegadas_em(caminho)
+    # Retry-After (1 s) no lugar do backoff exponencial (0,05 s)
+    assert chegadas[1] - chegadas[0] >= 1.0
+
+
+def test_retry_after_limitado(servidor):
+    caminho = _xml_path("1")
+    servidor.respostas[caminho] = [(503, {"Retry-After": "3600"}, b"", 0), (200, {}, b"<nfe/>", 0)]
+
+    inicio = time.monotonic()
+    resultado = _api(servidor, retry_after_max=0.2).get_nfe_xml_by_chave("1")
+
+    assert resultado["sucesso"] is True
+    assert time.monotonic() - inicio < 5
+
+
+
+def test_timeout_de_leitura_e_retentado(servidor):
+    caminho = _xml_path("1")
+    servidor.respostas[caminho] = [(200, {}, b"<nfe/>", 2)]
+
+    inicio = time.monotonic()
+    with pytest.raises(requests.exceptions.Timeout):
+        _api(servidor, max_retries=1, timeout=(1, 0.2))._request(servidor.base_url + caminho, "xml")
+
+    # Duas tentativas de 0,2 s, sem esperar os 2 s do servidor
+    assert len(servidor.chegadas_em(caminho)) == 2
+    assert time.monotonic() - inicio < 2
+
+
+def test_rate_limiter_espaca_as_requisicoes(servidor):
+    chaves = [str(i) for i in range(10)]
+    for chave in chaves:
+        servidor.respostas[_xml_path(chave)] = [(200, {}, b"<nfe/>", 0)]
+
+    resultados = list(_api(servidor, requests_per_second=20).buscar_xmls_por_chave(chaves, max_workers=5))
+
+    assert len(resultados) == 10
+    chegadas = sorted(horario for horario, _ in servidor.chegadas)
+    # 10 requisições a 20/s: pelo menos 9 intervalos de 50 ms, mesmo com 5 threads
+    assert chegadas[-1] - chegadas[0] >= 9 * 0.05 * 0.9
+    # Em nenhuma janela de 1 s passam mais de 20 requisições (mais uma de folga)
+    assert all(
+        sum(1 for outra in chegadas if horario <= outra < horario + 1) <= 21
+        for horario in chegadas
+    )
+
+
+def test_rate_limiter_compartilhado_entre_threads():
+    limiter = RateLimiter(50)
+    horarios = []
+    lock = threading.Lock()
+
+    def chamar():
+        for _ in range(5):
+            limiter.aguardar()
+            with lock:
+                horarios.append(time.monotonic())
+
+    threads = [threading.Thread(target=chamar) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    horarios.sort()
+    assert len(horarios) == 20
+    # Intervalo de 20 ms reservado sob o lock (pequena tolerância do relógio)
+    assert horarios[-1] - horarios[0] >= 19 * 0.02 * 0.9
+
+
+def test_resultados_na_ordem_de_conclusao(servidor):
+    servidor.respostas[_xml_path("lenta")] = [(200, {}, b"lenta", 0.5)]
+    servidor.respostas[_xml_path("media")] = [(200, {}, b"media", 0.25)]
+    servidor.respostas[_xml_path("rapida")] = [(200, {}, b"rapida", 0)]
+
+    resultados = list(_api(servidor).buscar_xmls_por_chave(["lenta", "media", "rapida"], max_workers=3))
+
+    assert [chave for chave, _ in resultados] == ["rapida", "media", "lenta"]
+    assert [resultado["xml_content"] for _, resultado in resultados] == [b"rapida", b"media", b"lenta"]
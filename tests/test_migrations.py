@@ -0,0 +1,78 @@
+"""
+`flask db upgrade` sobre bancos criados antes das migrações: aqui, o esquema
+que o db.create_all() dos modelos antigos gerava.
+"""
+import sqlite3
+
+from sqlalchemy import text
+
+from conftest import migrated_app
+from src.extensions import db
+
+# db.create_all() dos modelos antigos: nota em nfe_header_id, lote no item
+ESQUEMA_CREATE_ALL = """
+CREATE TABLE nfe_header (
+    id INTEGER NOT NULL,
+    "nNF" VARCHAR(20) NOT NULL,
+    "dEmi" DATE NOT NULL,
+    "CNPJ_emit" VARCHAR(14) NOT NULL,
+    "xNome_emit" VARCHAR(100) NOT NULL,
+    "CNPJ_dest" VARCHAR(14) NOT NULL,
+    "xNome_dest" VARCHAR(100) NOT NULL,
+    PRIMARY KEY (id)
+);
+CREATE TABLE nfe_item (
+    id INTEGER NOT NULL,
+    nfe_header_id INTEGER NOT NULL,
+    "cProd" VARCHAR(20) NOT NULL,
+    "xProd" VARCHAR(100) NOT NULL,
+    "CFOP" VARCHAR(4) NOT NULL,
+    "uCom" VARCHAR(10) NOT NULL,
+    "qCom" FLOAT NOT NULL,
+    "vUnCom" FLOAT NOT NULL,
+    "nLote" VARCHAR(20),
+    "qLote" FLOAT,
+    PRIMARY KEY (id),
+    FOREIGN KEY(nfe_header_id) REFERENCES nfe_header (id)
+);
+CREATE TABLE estoque_consignacao (
+    id INTEGER NOT NULL,
+    produto VARCHAR(100) NOT NULL,
+    quantidade FLOAT NOT NULL,
+    nfe_item_id INTEGER,
+    PRIMARY KEY (id),
+    FOREIGN KEY(nfe_item_id) REFERENCES nfe_item (id)
+);
+INSERT INTO nfe_header VALUES (1, '100', '2025-01-10', '11111111000111', 'EMITENTE', '22222222000122', 'HOSPITAL');
+INSERT INTO nfe_item VALUES (1, 1, 'P1', 'PARAFUSO', '5917', 'UN', 3.0, 10.5, 'L1', 3.0);
+INSERT INTO nfe_item VALUES (2, 1, 'P2', 'PLACA', '5917', 'UN', 2.0, 100.0, NULL, NULL);
+"""
+
+
+def test_upgrade_do_esquema_do_create_all(tmp_path):
+    caminho = tmp_path / "app.db"
+    conexao = sqlite3.connect(caminho)
+    conexao.executescript(ESQUEMA_CREATE_ALL)
+    conexao.close()
+
+    app = migrated_app(f"sqlite:///{caminho}")
+
+    with app.app_context(), db.engine.connect() as connection:
+        itens = connection.execute(text(
+            'SELECT i.id, i.nfe_id, p."cProd", i."qCom", i."vProd" '
+            'FROM nfe_item i JOIN produto p ON p.id = i.produto_id ORDER BY i.id'
+        )).all()
+        lotes = connection.execute(text(
+            'SELECT nfe_item_id, "nLote", "qLote" FROM lote_info ORDER BY id'
+        )).all()
+        saldos = connection.execute(text(
+            'SELECT p."cProd", s."nLote", s.saldo '
+            'FROM saldo_consignacao s JOIN produto p ON p.id = s.produto_id ORDER BY p."cProd"'
+        )).all()
+        db.engine.dispose()
+
+    # Quantidades em 1/10000 da unidade e vProd em centavos (migração 0012)
+    assert [tuple(item) for item in itens] == [(1, 1, "P1", 30000, 3150), (2, 1, "P2", 20000, 20000)]
+    assert [tuple(lote) for lote in lotes] == [(1, "L1", 30000)]
+    # Razão preenchido pela migração 0016 (remessas 5917: saldo negativo)
+    assert [tuple(saldo) for saldo in saldos] == [("P1", "L1", -30000), ("P2", "SEM_LOTE", -20000)]
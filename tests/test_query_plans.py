@@ -0,0 +1,34 @@
+"""
+Planos de execução das consultas quentes (src/query_plans.py), montadas
+pelos construtores reais, sobre o esquema das migrações: em um SQLite
+temporário sempre, e no PostgreSQL de DATABASE_URL quando houver um.
+"""
+import os
+
+import pytest
+
+from conftest import migrated_app
+from src.extensions import db
+from src.query_plans import check_query_plans, hot_queries
+
+
+def _check(app):
+    with app.app_context(), db.engine.connect() as connection:
+        return check_query_plans(connection)
+
+
+def test_consultas_quentes_sqlite(sqlite_app):
+    resultado = _check(sqlite_app)
+
+    assert set(resultado) == set(hot_queries("sqlite"))
+    assert {nome: scans for nome, scans in resultado.items() if scans} == {}
+
+
+@pytest.mark.skipif(
+    not os.environ.get("DATABASE_URL", "").startswith("postgresql"),
+    reason="sem PostgreSQL em DATABASE_URL"
+)
+def test_consultas_quentes_postgresql():
+    resultado = _check(migrated_app(os.environ["DATABASE_URL"]))
+
+    assert {nome: scans for nome, scans in resultado.items() if scans} == {}